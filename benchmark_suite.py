@@ -0,0 +1,595 @@
+"""
+Benchmark suite of the systems, indices and integrators of the project, for
+tracking performance across commits.
+
+Usage:
+    python benchmark_suite.py [quick|paper] [output.json]
+
+    runs every benchmark at the given scale (default quick) and writes the
+    results as JSON (default: to standard output), and
+
+    python benchmark_suite.py compare <baseline.json> <results.json> [tolerance]
+
+    compares two result files, listing the benchmarks whose time grew by more
+    than the tolerance (default 0.1, i.e. 10%); the exit status is 1 if any did.
+
+The "paper" scale uses the iteration counts and integration times of
+parameters.py; "quick" scales them down (see SCALES) for a smoke run. Every
+benchmark uses fixed seeds and is run once at WARM_UP_SCALE first, so that
+compilation is not timed, and its time is the best of the repetitions of the
+scale. The results are:
+
+- maps/<map>: iterations per second of the orbit of each map of models.py;
+- <system>/lyapunov: iterations (or time units) per second of the orbit and
+  the full Lyapunov spectrum, with every FPU integrator;
+- <system>/ldi/k=<k>: time to result of one task of the LDI systems for each k
+  of parameters.py (LDI of a candidate until its threshold crossing and
+  Lyapunov spectrum until the end of the sample), i.e. the GALI_k of the
+  candidate;
+- <system>/batch/b=<b>: candidates per second of the rejection searches of
+  the Hénon map, the logistic network and the FPU chain, evaluating
+  BATCH_SIZE rejected candidates b at a time (b = 1: one after the other;
+  b = BATCH_SIZE: all at once, on up to `numba.get_num_threads()` threads);
+- <system>/sali: time to result of SALI tasks of the cat and baker maps, as in
+  cat_map.py and baker_map.py;
+- io/write, io/read, io/ragged: throughput in MB/s of the result store
+  (store.py and loader.py).
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numba
+import numpy as np
+from pynamicalsys import DiscreteDynamicalSystem as dds
+from models import (
+    henon_map_3D,
+    henon_map_3D_jacobian,
+    logistic_map_network,
+    logistic_map_network_synchronous,
+    logistic_map_network_jacobian,
+    cat_map,
+    cat_map_jacobian,
+    baker_map,
+    baker_map_jacobian,
+    fermi_pasta_ulam,
+    fermi_pasta_ulam_jacobian,
+    fermi_pasta_ulam_drift,
+    fermi_pasta_ulam_kick,
+)
+from indicators import (
+    SYMPLECTIC_SCHEMES,
+    burn_in,
+    evolve_lyapunov,
+    evolve_flow_lyapunov,
+    flow_deviation_vectors,
+    initial_deviation_vectors,
+    integrator_arguments,
+    ldi_lyapunov_batch,
+    flow_ldi_lyapunov_batch,
+)
+from store import append_records, read_index, load_records, numbered
+from loader import load_ragged
+from parameters import HENON, LOGISTIC_MAP_NETWORK, FPU, CATMAP, BAKERMAP
+
+# Fraction of the paper iteration counts and times of each scale, and number
+# of repetitions of each benchmark
+SCALES = {"quick": (0.01, 3), "paper": (1.0, 1)}
+WARM_UP_SCALE = 1e-4
+
+# Iterations of the map orbits at the paper scale
+MAP_ITERATIONS = 10**7
+
+# Candidates of the batched rejection-search benchmarks
+BATCH_SIZE = 8
+
+# Records written by the I/O benchmark at the paper scale, and their rows
+IO_RECORDS = 600
+IO_ROWS = 2000
+
+
+def scaled(n, scale, minimum=1):
+    """
+    Scale an iteration count, keeping at least minimum iterations.
+    """
+    return max(minimum, int(round(n * scale)))
+
+
+def git_commit():
+    """
+    Return the commit of the working tree, or None outside a git repository.
+    """
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.stdout.strip()
+
+
+# --------------------------
+# Benchmarks
+# --------------------------
+# Each benchmark takes the scale and returns a function that runs it and
+# returns the amount of work done, in the unit of the benchmark
+def logistic_parameters():
+    N = LOGISTIC_MAP_NETWORK["network_size"]
+    return np.array(LOGISTIC_MAP_NETWORK["parameters"] + [N], dtype=np.float64)
+
+
+def logistic_initial_condition():
+    np.random.seed(5)
+    return np.random.uniform(0.0, 1, LOGISTIC_MAP_NETWORK["network_size"]) + 1e-4
+
+
+def fpu_initial_condition():
+    u = np.zeros(2 * FPU["dof"])
+    u[2] = FPU["X"] - 0.5 * FPU["dx"]
+    return u
+
+
+# (initial condition, parameters, mapping, jacobian) of each map
+def map_systems():
+    return {
+        "henon_map_3D": (
+            np.array(HENON["u0"]),
+            np.array(HENON["parameters"], dtype=np.float64),
+            henon_map_3D,
+            henon_map_3D_jacobian,
+        ),
+        "logistic_map_network": (
+            logistic_initial_condition(),
+            logistic_parameters(),
+            logistic_map_network,
+            logistic_map_network_jacobian,
+        ),
+        "logistic_map_network_synchronous": (
+            logistic_initial_condition(),
+            logistic_parameters(),
+            logistic_map_network_synchronous,
+            logistic_map_network_jacobian,
+        ),
+        "cat_map": (np.array([0.1, 0.1]), np.zeros(1), cat_map, cat_map_jacobian),
+        "baker_map": (
+            np.array([0.1, 0.2]),
+            np.array(BAKERMAP["parameters"], dtype=np.float64),
+            baker_map,
+            baker_map_jacobian,
+        ),
+    }
+
+
+def map_orbit(name):
+    def benchmark(scale):
+        u, parameters, mapping, _ = map_systems()[name]
+        steps = scaled(MAP_ITERATIONS, scale)
+
+        def run():
+            burn_in(u.copy(), parameters, steps, mapping)
+            return steps
+
+        return run
+
+    return benchmark
+
+
+def map_lyapunov(name, config):
+    def benchmark(scale):
+        u, parameters, mapping, jacobian = map_systems()[name]
+        steps = scaled(config["sample_size"], scale)
+
+        def run():
+            w = initial_deviation_vectors(len(u), len(u), 13)
+            exponents = np.zeros(len(u))
+            evolve_lyapunov(
+                u.copy(), parameters, mapping, jacobian, w, exponents, steps
+            )
+            return steps
+
+        return run
+
+    return benchmark
+
+
+def map_ldi(name, config, k):
+    def benchmark(scale):
+        u, parameters, mapping, jacobian = map_systems()[name]
+        sample_size = scaled(config["sample_size"], scale, 2)
+        transient_time = scaled(config["transient_time"], scale, 0)
+        rng = np.random.default_rng(k)
+        candidate = u + np.asarray(config["du"]) * rng.random(len(u))
+
+        def run():
+            # The candidate is accepted whatever its threshold crossing
+            ldi_lyapunov_batch(
+                [candidate],
+                sample_size + transient_time,
+                k,
+                parameters,
+                mapping,
+                jacobian,
+                [0, sample_size],
+                transient_time=transient_time,
+                seed=2,
+            )
+            return sample_size + transient_time
+
+        return run
+
+    return benchmark
+
+
+def fpu_lyapunov(integrator):
+    def benchmark(scale):
+        parameters = np.array([FPU["beta"]])
+        u = fpu_initial_condition()
+        total_time = FPU["total_time"] * scale
+        stepping = integrator_arguments(
+            integrator,
+            (fermi_pasta_ulam_drift, fermi_pasta_ulam_kick),
+            FPU["tolerance"],
+            FPU["tolerance"],
+        )
+
+        def run():
+            w = flow_deviation_vectors(len(u), len(u), 13)
+            evolve_flow_lyapunov(
+                u.copy(),
+                parameters,
+                fermi_pasta_ulam,
+                fermi_pasta_ulam_jacobian,
+                w,
+                np.zeros(len(u)),
+                0.0,
+                FPU["time_step"],
+                total_time,
+                None,
+                -1,
+                *stepping,
+            )
+            return total_time
+
+        return run
+
+    return benchmark
+
+
+def fpu_ldi(k):
+    def benchmark(scale):
+        parameters = np.array([FPU["beta"]])
+        u = fpu_initial_condition()
+        total_time = max(FPU["total_time"] * scale, 2 * FPU["time_step"])
+
+        def run():
+            flow_ldi_lyapunov_batch(
+                [u],
+                total_time,
+                k,
+                parameters,
+                fermi_pasta_ulam,
+                fermi_pasta_ulam_jacobian,
+                [0, 2 * total_time],
+                FPU["time_step"],
+                seed=2,
+                threshold=FPU["LDI_threshold"],
+            )
+            return total_time
+
+        return run
+
+    return benchmark
+
+
+def batch_search(name, config, batch_size):
+    def benchmark(scale):
+        u, parameters, mapping, jacobian = map_systems()[name]
+        sample_size = scaled(config["sample_size"], scale, 2)
+        transient_time = scaled(config["transient_time"], scale, 0)
+        rng = np.random.default_rng(0)
+        U = u + np.asarray(config["du"]) * rng.random((BATCH_SIZE, len(u)))
+        # No candidate is accepted: each one is integrated to the end of the
+        # sample, as a rejected candidate that survives past the interval
+        interval = [sample_size + 1, sample_size + 1]
+
+        def run():
+            for start in range(0, BATCH_SIZE, batch_size):
+                ldi_lyapunov_batch(
+                    U[start : start + batch_size],
+                    sample_size + transient_time,
+                    2,
+                    parameters,
+                    mapping,
+                    jacobian,
+                    interval,
+                    transient_time=transient_time,
+                    seed=2,
+                )
+            return BATCH_SIZE
+
+        return run
+
+    return benchmark
+
+
+def fpu_batch_search(batch_size):
+    def benchmark(scale):
+        parameters = np.array([FPU["beta"]])
+        u = fpu_initial_condition()
+        total_time = max(FPU["total_time"] * scale, 2 * FPU["time_step"])
+        rng = np.random.default_rng(0)
+        U = np.tile(u, (BATCH_SIZE, 1))
+        U[:, 2] += FPU["dx"] * rng.random(BATCH_SIZE)
+
+        def run():
+            for start in range(0, BATCH_SIZE, batch_size):
+                flow_ldi_lyapunov_batch(
+                    U[start : start + batch_size],
+                    total_time,
+                    2,
+                    parameters,
+                    fermi_pasta_ulam,
+                    fermi_pasta_ulam_jacobian,
+                    [2 * total_time, 2 * total_time],
+                    FPU["time_step"],
+                    seed=2,
+                    threshold=FPU["LDI_threshold"],
+                )
+            return BATCH_SIZE
+
+        return run
+
+    return benchmark
+
+
+def sali(name, config, parameters, number_of_parameters):
+    def benchmark(scale):
+        _, _, mapping, jacobian = map_systems()[name]
+        ds = dds(
+            mapping=mapping,
+            jacobian=jacobian,
+            system_dimension=2,
+            number_of_parameters=number_of_parameters,
+        )
+        total_time = config.get("total_time")
+        if total_time is None:
+            total_time = config["sample_size"] + config["transient_time"]
+        num_ic = scaled(config["num_ic"], scale, 10)
+        options = {} if parameters is None else {"parameters": parameters}
+
+        def run():
+            for ic in range(num_ic):
+                ds.SALI(
+                    [0.1, 0.1],
+                    total_time,
+                    seed=1313 * ic,
+                    return_history=True,
+                    tol=config["SALI_threshold"],
+                    **options,
+                )
+            return num_ic
+
+        return run
+
+    return benchmark
+
+
+def io_records(scale):
+    rng = np.random.default_rng(0)
+    return [
+        (f"ldi_ic={i}", numbered(rng.random(IO_ROWS)))
+        for i in range(scaled(IO_RECORDS, scale, 50))
+    ]
+
+
+def io_write(scale):
+    records = io_records(scale)
+    directory = tempfile.TemporaryDirectory()
+
+    def run():
+        filename = os.path.join(directory.name, "benchmark.store")
+        append_records(filename, records)
+        os.remove(filename)
+        return sum(array.nbytes for _, array in records) / 2**20
+
+    return run
+
+
+def io_read(ragged):
+    def benchmark(scale):
+        records = io_records(scale)
+        keys = [key for key, _ in records]
+        directory = tempfile.TemporaryDirectory()
+        append_records(os.path.join(directory.name, "benchmark.store"), records)
+
+        def run():
+            # Read every value of every record
+            filename = os.path.join(directory.name, "benchmark.store")
+            if ragged:
+                arrays = load_ragged(filename, keys)
+            else:
+                arrays = load_records(filename, keys, read_index(filename))
+            sum(array.sum() for array in arrays)
+            return sum(array.nbytes for _, array in records) / 2**20
+
+        return run
+
+    return benchmark
+
+
+def benchmarks():
+    """
+    Return the benchmarks as a list of (name, unit, benchmark) tuples.
+    """
+    suite = [
+        (f"maps/{name}", "iterations/s", map_orbit(name)) for name in map_systems()
+    ]
+    for name, config in (
+        ("henon_map_3D", HENON),
+        ("logistic_map_network", LOGISTIC_MAP_NETWORK),
+    ):
+        suite.append((f"{name}/lyapunov", "iterations/s", map_lyapunov(name, config)))
+        for k in config["ks"]:
+            suite.append(
+                (f"{name}/ldi/k={k}", "iterations/s", map_ldi(name, config, k))
+            )
+
+    for integrator in ["rk4", "rk45", *SYMPLECTIC_SCHEMES]:
+        suite.append(
+            (f"fpu/lyapunov/{integrator}", "time units/s", fpu_lyapunov(integrator))
+        )
+    for k in FPU["ks"]:
+        suite.append((f"fpu/ldi/k={k}", "time units/s", fpu_ldi(k)))
+
+    for batch_size in (1, BATCH_SIZE):
+        for name, config in (
+            ("henon_map_3D", HENON),
+            ("logistic_map_network", LOGISTIC_MAP_NETWORK),
+        ):
+            suite.append(
+                (
+                    f"{name}/batch/b={batch_size}",
+                    "candidates/s",
+                    batch_search(name, config, batch_size),
+                )
+            )
+        suite.append(
+            (f"fpu/batch/b={batch_size}", "candidates/s", fpu_batch_search(batch_size))
+        )
+
+    suite += [
+        ("cat_map/sali", "tasks/s", sali("cat_map", CATMAP, None, 0)),
+        (
+            "baker_map/sali",
+            "tasks/s",
+            sali("baker_map", BAKERMAP, BAKERMAP["parameters"], 1),
+        ),
+        ("io/write", "MB/s", io_write),
+        ("io/read", "MB/s", io_read(False)),
+        ("io/ragged", "MB/s", io_read(True)),
+    ]
+
+    return suite
+
+
+# --------------------------
+# Harness
+# --------------------------
+def run_suite(scale_name="quick", selected=None, log=sys.stderr):
+    """
+    Run the benchmarks at a scale.
+
+    Parameters:
+    - scale_name: Key of SCALES.
+    - selected: Optional list of name prefixes of the benchmarks to run.
+    - log: Stream of the progress messages (None for none).
+
+    Returns:
+    - Dictionary with the "scale", the "commit", the "environment" and the
+      "results": for each benchmark, its "name", the "work" done, its "unit"
+      and the best "time" in seconds (and the "rate" work / time).
+    """
+    scale, repeat = SCALES[scale_name]
+    results = []
+    for name, unit, benchmark in benchmarks():
+        if selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+
+        # Compile
+        benchmark(WARM_UP_SCALE)()
+
+        run = benchmark(scale)
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            work = run()
+            best = min(best, time.perf_counter() - start)
+        results.append(
+            {
+                "name": name,
+                "unit": unit,
+                "work": work,
+                "time": best,
+                "rate": work / best,
+            }
+        )
+        if log is not None:
+            print(f"{name:<40}{best:>10.4g} s{work / best:>14.4g} {unit}", file=log)
+
+    return {
+        "scale": scale_name,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "numba": numba.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "threads": numba.get_num_threads(),
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, results, tolerance=0.1):
+    """
+    Compare the times of two runs of the suite.
+
+    Parameters:
+    - baseline, results: Dictionaries returned by `run_suite`.
+    - tolerance: Relative time increase above which a benchmark regressed.
+
+    Returns:
+    - List of (name, baseline time, time, ratio, regressed) tuples of the
+      benchmarks in both runs.
+    """
+    if baseline["scale"] != results["scale"]:
+        raise ValueError(
+            f"cannot compare scales {baseline['scale']!r} and {results['scale']!r}"
+        )
+
+    times = {r["name"]: r["time"] for r in baseline["results"]}
+    comparison = []
+    for r in results["results"]:
+        if r["name"] in times:
+            ratio = r["time"] / times[r["name"]]
+            comparison.append(
+                (r["name"], times[r["name"]], r["time"], ratio, ratio > 1 + tolerance)
+            )
+
+    return comparison
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)
+        with open(sys.argv[3]) as f:
+            results = json.load(f)
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+        comparison = compare_results(baseline, results, tolerance)
+
+        print(f"{'benchmark':<40}{'baseline (s)':>14}{'time (s)':>12}{'ratio':>8}")
+        for name, before, after, ratio, regressed in comparison:
+            flag = "  slower" if regressed else ""
+            print(f"{name:<40}{before:>14.4f}{after:>12.4f}{ratio:>8.2f}{flag}")
+        sys.exit(int(any(regressed for *_, regressed in comparison)))
+
+    scale_name = sys.argv[1] if len(sys.argv) > 1 else "quick"
+    results = run_suite(scale_name)
+    output = json.dumps(results, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
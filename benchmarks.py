@@ -0,0 +1,571 @@
+"""
+Benchmarks of the model kernels.
+
+Usage:
+    python benchmarks.py [N ...]
+
+Runs, in this order:
+
+1. The application of the logistic map network Jacobian to k deviation vectors
+   for increasing network sizes N: building the dense N x N Jacobian and
+   multiplying it by the vectors (as pynamicalsys and the default drivers do),
+   versus the ring-coupling tangent map `logistic_map_network_tangent`, which
+   never builds the matrix. The dense path is skipped for the largest
+   networks, where the Jacobian alone would take hundreds of megabytes.
+2. One iteration of the logistic map network for increasing network sizes N
+   and coupling ranges r: the in-place Gauss-Seidel sweep
+   `logistic_map_network` (O(N * P) operations) versus the synchronous update
+   `logistic_map_network_synchronous` (O(N)).
+3. The right-hand side of the variational equations of the FPU chain for
+   increasing numbers of particles: the dense 2*dof x 2*dof Jacobian times the
+   deviation vectors, versus the stencil kernel `fermi_pasta_ulam_variational`.
+4. One iteration of the orbit and of two deviation vectors of the cat, baker
+   and 3D Hénon maps with the kernels that return new arrays, versus their
+   in-place variants writing into preallocated buffers (evaluating the
+   constant Jacobians of the cat and baker maps only once).
+5. The integrators of the FPU LDI and Lyapunov runs (see
+   `integrator_arguments` in indicators.py): wall time against the error of
+   the LDI threshold time and of the Lyapunov spectrum, relative to RK4 with a
+   small time step, and the largest relative error of the energy along the
+   orbit (tracked at every step by the energy monitor of energy.py).
+6. The energy of a long FPU trajectory: evaluated with NumPy array operations,
+   versus the compiled, parallel `fermi_pasta_ulam_energy` and the single-pass
+   statistics `trajectory_energy_stats`, which store no energies.
+"""
+
+import sys
+import time
+import numpy as np
+from numba import njit
+from models import (
+    cat_map,
+    cat_map_jacobian,
+    cat_map_inplace,
+    cat_map_jacobian_inplace,
+    baker_map,
+    baker_map_jacobian,
+    baker_map_inplace,
+    baker_map_jacobian_inplace,
+    henon_map_3D,
+    henon_map_3D_jacobian,
+    henon_map_3D_inplace,
+    henon_map_3D_jacobian_inplace,
+    logistic_map_network,
+    logistic_map_network_synchronous,
+    logistic_map_network_jacobian,
+    logistic_map_network_tangent,
+    fermi_pasta_ulam,
+    fermi_pasta_ulam_jacobian,
+    fermi_pasta_ulam_variational,
+    fermi_pasta_ulam_drift,
+    fermi_pasta_ulam_kick,
+    fermi_pasta_ulam_hamiltonian,
+    fermi_pasta_ulam_energy,
+)
+from indicators import apply_jacobian, flow_ldi_lyapunov_batch
+from energy import energy_stats, summarize_energy, trajectory_energy_stats
+from parameters import LOGISTIC_MAP_NETWORK, FPU, HENON, BAKERMAP
+
+# Largest network for which the dense Jacobian is benchmarked
+DENSE_MAX_SIZE = 4000
+
+# FPU integrators compared by `benchmark_fpu_integrators`: (integrator, time
+# step, tolerance of "rk45"), and time step of the RK4 reference
+FPU_INTEGRATORS = [
+    ("rk4", 0.005, None),
+    ("rk4", 0.02, None),
+    ("leapfrog", 0.005, None),
+    ("yoshida4", 0.02, None),
+    ("yoshida4", 0.05, None),
+    ("yoshida6", 0.05, None),
+    ("yoshida6", 0.1, None),
+    ("rk45", 0.005, 1e-8),
+    ("rk45", 0.005, 1e-11),
+]
+FPU_REFERENCE_STEP = 0.001
+
+
+@njit
+def dense_tangent(u, parameters, V):
+    """
+    Build the dense Jacobian and multiply it by V.
+    """
+    J = np.ascontiguousarray(logistic_map_network_jacobian(u, parameters))
+    return J @ V
+
+
+@njit
+def dense_variational(time, u, V, parameters, dV):
+    """
+    Build the dense FPU Jacobian and multiply it by V.
+    """
+    dV[:] = fermi_pasta_ulam_jacobian(time, u, parameters) @ V
+    return dV
+
+
+@njit
+def iterate_maps(u, parameters, V, steps, mapping, jacobian):
+    """
+    Iterate the orbit and the columns of V with the kernels returning new arrays.
+    """
+    for _ in range(steps):
+        u = mapping(u, parameters)
+        J = jacobian(u, parameters, mapping)
+        for i in range(V.shape[1]):
+            V[:, i] = J @ np.ascontiguousarray(V[:, i])
+
+    return u
+
+
+@njit
+def iterate_maps_inplace(
+    u, parameters, V, steps, mapping_inplace, jacobian_inplace, constant_jacobian
+):
+    """
+    Iterate the orbit and the columns of V with the in-place kernels.
+    """
+    u_next = np.empty_like(u)
+    J = np.empty((len(u), len(u)))
+    x = np.empty(len(u))
+    if constant_jacobian:
+        jacobian_inplace(u, parameters, J)
+    for _ in range(steps):
+        u, u_next = mapping_inplace(u, parameters, u_next), u
+        if not constant_jacobian:
+            jacobian_inplace(u, parameters, J)
+        apply_jacobian(J, V, x)
+
+    return u
+
+
+def best_time(func, *args, min_time=0.2):
+    """
+    Return the best time per call of func(*args) in seconds, repeating the call
+    for at least min_time seconds.
+    """
+    func(*args)  # compile
+    best = np.inf
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+
+    return best
+
+
+def benchmark_logistic_tangent(sizes, k=8, seed=0):
+    """
+    Time one application of the logistic map network Jacobian to k vectors.
+
+    Parameters:
+    - sizes: Network sizes N.
+    - k: Number of deviation vectors.
+    - seed: Seed of the random state and vectors.
+
+    Returns:
+    - List of dictionaries with the network size "N", the stencil half-width
+      "P", the "dense" and "tangent" times in seconds (dense is None above
+      DENSE_MAX_SIZE), the memory of the dense Jacobian "dense_bytes" and the
+      largest relative difference "error" between the two results.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for N in sizes:
+        parameters = np.array(LOGISTIC_MAP_NETWORK["parameters"] + [N], dtype=float)
+        u = rng.random(N)
+        V = rng.random((N, k))
+
+        tangent = best_time(logistic_map_network_tangent, u, parameters, V)
+        dense, error = None, None
+        if N <= DENSE_MAX_SIZE:
+            dense = best_time(dense_tangent, u, parameters, V)
+            JV = dense_tangent(u, parameters, V)
+            error = np.max(
+                np.abs(logistic_map_network_tangent(u, parameters, V) - JV)
+            ) / np.max(np.abs(JV))
+
+        results.append(
+            {
+                "N": N,
+                "P": round(parameters[1] * N),
+                "dense": dense,
+                "tangent": tangent,
+                "dense_bytes": 8 * N * N,
+                "error": error,
+            }
+        )
+
+    return results
+
+
+def benchmark_logistic_update(sizes, couplings=(0.05, 0.15, 0.45), seed=0):
+    """
+    Time one iteration of the logistic map network with both node updates.
+
+    Parameters:
+    - sizes: Network sizes N.
+    - couplings: Coupling ranges r (fraction of the nodes within the stencil).
+    - seed: Seed of the random state.
+
+    Returns:
+    - List of dictionaries with the network size "N", the coupling range "r",
+      the stencil half-width "P", and the "gauss_seidel" and "synchronous"
+      times in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for N in sizes:
+        for r in couplings:
+            if round(r * N) == 0:
+                # No coupling (and a division by zero in the kernels)
+                continue
+            a, _, sigma = LOGISTIC_MAP_NETWORK["parameters"]
+            parameters = np.array([a, r, sigma, N], dtype=float)
+            u = rng.random(N)
+            results.append(
+                {
+                    "N": N,
+                    "r": r,
+                    "P": round(r * N),
+                    # The sweep updates u in place, which keeps it on the orbit
+                    "gauss_seidel": best_time(logistic_map_network, u, parameters),
+                    "synchronous": best_time(
+                        logistic_map_network_synchronous, u, parameters
+                    ),
+                }
+            )
+
+    return results
+
+
+def benchmark_fpu_variational(dofs, k=8, seed=0):
+    """
+    Time one evaluation of the variational equations of the FPU chain for k
+    deviation vectors.
+
+    Parameters:
+    - dofs: Numbers of particles dof (including the fixed ends).
+    - k: Number of deviation vectors.
+    - seed: Seed of the random state and vectors.
+
+    Returns:
+    - List of dictionaries with the number of particles "dof", the "dense" and
+      "variational" times in seconds, the memory of the dense Jacobian
+      "dense_bytes" and the largest relative difference "error" between the two
+      results.
+    """
+    rng = np.random.default_rng(seed)
+    parameters = np.array([FPU["beta"]])
+    results = []
+    for dof in dofs:
+        u = rng.random(2 * dof)
+        V = rng.random((2 * dof, k))
+        dV = np.empty_like(V)
+
+        variational = best_time(fermi_pasta_ulam_variational, 0.0, u, V, parameters, dV)
+        dense = best_time(dense_variational, 0.0, u, V, parameters, dV)
+        JV = dense_variational(0.0, u, V, parameters, dV).copy()
+        error = np.max(
+            np.abs(fermi_pasta_ulam_variational(0.0, u, V, parameters, dV) - JV)
+        ) / np.max(np.abs(JV))
+
+        results.append(
+            {
+                "dof": dof,
+                "dense": dense,
+                "variational": variational,
+                "dense_bytes": 8 * (2 * dof) ** 2,
+                "error": error,
+            }
+        )
+
+    return results
+
+
+def benchmark_inplace_maps(steps=100000, k=2, seed=0):
+    """
+    Time the iteration of the low-dimensional maps and of k deviation vectors.
+
+    Parameters:
+    - steps: Number of iterations per timed call.
+    - k: Number of deviation vectors.
+    - seed: Seed of the deviation vectors.
+
+    Returns:
+    - List of dictionaries with the "map" name and the "allocating" and
+      "inplace" times per iteration in nanoseconds.
+    """
+    rng = np.random.default_rng(seed)
+    maps = [
+        (
+            "cat",
+            cat_map,
+            cat_map_jacobian,
+            cat_map_inplace,
+            cat_map_jacobian_inplace,
+            [0.0],
+            True,
+            [0.1, 0.2],
+        ),
+        (
+            "baker",
+            baker_map,
+            baker_map_jacobian,
+            baker_map_inplace,
+            baker_map_jacobian_inplace,
+            BAKERMAP["parameters"],
+            True,
+            [0.1, 0.2],
+        ),
+        (
+            "henon_3D",
+            henon_map_3D,
+            henon_map_3D_jacobian,
+            henon_map_3D_inplace,
+            henon_map_3D_jacobian_inplace,
+            HENON["parameters"],
+            False,
+            HENON["u0"],
+        ),
+    ]
+    results = []
+    for (
+        name,
+        mapping,
+        jacobian,
+        mapping_inplace,
+        jacobian_inplace,
+        parameters,
+        constant,
+        u,
+    ) in maps:
+        parameters = np.array(parameters, dtype=np.float64)
+        u = np.array(u, dtype=np.float64)
+        V = rng.random((len(u), k))
+
+        allocating = best_time(
+            iterate_maps, u, parameters, V.copy(), steps, mapping, jacobian
+        )
+        inplace = best_time(
+            iterate_maps_inplace,
+            u,
+            parameters,
+            V.copy(),
+            steps,
+            mapping_inplace,
+            jacobian_inplace,
+            constant,
+        )
+        results.append(
+            {
+                "map": name,
+                "allocating": 1e9 * allocating / steps,
+                "inplace": 1e9 * inplace / steps,
+            }
+        )
+
+    return results
+
+
+def benchmark_fpu_integrators(total_time=500.0, k=2, integrators=FPU_INTEGRATORS):
+    """
+    Time the LDI and Lyapunov run of one FPU initial condition with several
+    integrators and measure their accuracy.
+
+    Parameters:
+    - total_time: Integration time (it should include the LDI threshold time).
+    - k: Number of LDI deviation vectors.
+    - integrators: List of (integrator, time step, tolerance) tuples.
+
+    Returns:
+    - List of dictionaries with the "integrator", "time_step" and "tolerance",
+      the wall "time" in seconds, the absolute errors of the LDI threshold
+      time "ldi_error" and of the Lyapunov exponents "lyapunov_error"
+      (largest over the spectrum) relative to RK4 with FPU_REFERENCE_STEP, and
+      the largest relative "energy_error" of the timed run.
+    """
+    parameters = np.array([FPU["beta"]])
+    u = np.zeros(2 * FPU["dof"])
+    u[2] = FPU["X"] - 0.5 * FPU["dx"]
+    splitting = (fermi_pasta_ulam_drift, fermi_pasta_ulam_kick)
+
+    def run(integrator, time_step, tolerance, total_time, threshold):
+        options = {"integrator": integrator, "splitting": splitting}
+        if tolerance is not None:
+            options.update(atol=tolerance, rtol=tolerance)
+        energy = energy_stats()
+        _, history, _, exponents = flow_ldi_lyapunov_batch(
+            [u],
+            total_time,
+            k,
+            parameters,
+            fermi_pasta_ulam,
+            fermi_pasta_ulam_jacobian,
+            [0, 2 * total_time],
+            time_step,
+            seed=2,
+            threshold=threshold,
+            variational=fermi_pasta_ulam_variational,
+            hamiltonian=fermi_pasta_ulam_hamiltonian,
+            energy=energy,
+            **options,
+        )
+        return history[-1, 0], exponents, summarize_energy(energy)["max_error"]
+
+    threshold = FPU["LDI_threshold"]
+    reference = run("rk4", FPU_REFERENCE_STEP, None, total_time, threshold)
+    results = []
+    for integrator, time_step, tolerance in integrators:
+        # Compile, crossing the threshold at the first step so that the
+        # Lyapunov continuation is compiled too
+        run(integrator, time_step, tolerance, 2 * time_step, 1.0)
+        start = time.perf_counter()
+        ldi_time, exponents, energy_error = run(
+            integrator, time_step, tolerance, total_time, threshold
+        )
+        elapsed = time.perf_counter() - start
+
+        results.append(
+            {
+                "integrator": integrator,
+                "time_step": time_step,
+                "tolerance": tolerance,
+                "time": elapsed,
+                "ldi_error": abs(ldi_time - reference[0]),
+                "lyapunov_error": np.max(np.abs(exponents - reference[1])),
+                "energy_error": energy_error,
+            }
+        )
+
+    return results
+
+
+def numpy_energy(u, parameters):
+    """
+    Energy of each row of an FPU trajectory with NumPy array operations.
+    """
+    x = u[:, 0::2]
+    p = u[:, 1::2]
+    T = 0.5 * np.sum(p[:, 1:-1] ** 2, axis=1)
+    dx = np.diff(x, axis=1)
+    V = np.sum(0.5 * dx**2 + 0.25 * parameters[0] * dx**4, axis=1)
+
+    return T + V
+
+
+def benchmark_fpu_energy(steps=10**6, dof=FPU["dof"], seed=0):
+    """
+    Time the energy of an FPU trajectory of the given number of steps.
+
+    Returns:
+    - Dictionary with the times in seconds of "numpy_energy", of the compiled
+      "energy" and of the single-pass "stats", and the largest relative
+      difference "error" between the NumPy and compiled energies.
+    """
+    rng = np.random.default_rng(seed)
+    trajectory = 0.1 * rng.standard_normal((steps, 2 * dof))
+    times = np.arange(steps, dtype=np.float64)
+    parameters = np.array([FPU["beta"]])
+
+    def stats():
+        trajectory_energy_stats(
+            trajectory, times, parameters, fermi_pasta_ulam_hamiltonian, energy_stats()
+        )
+
+    H = fermi_pasta_ulam_energy(trajectory, parameters)
+    reference = numpy_energy(trajectory, parameters)
+
+    return {
+        "numpy": best_time(numpy_energy, trajectory, parameters),
+        "energy": best_time(fermi_pasta_ulam_energy, trajectory, parameters),
+        "stats": best_time(stats),
+        "error": np.max(np.abs(H - reference) / np.abs(reference)),
+    }
+
+
+if __name__ == "__main__":
+    sizes = [int(N) for N in sys.argv[1:]] or [10, 100, 1000, 4000, 10000]
+    results = benchmark_logistic_tangent(sizes)
+
+    print(
+        f"{'N':>7}{'P':>6}{'dense (ms)':>13}{'tangent (ms)':>14}"
+        f"{'speedup':>10}{'dense J (MB)':>14}{'rel. error':>12}"
+    )
+    for r in results:
+        if r["dense"] is None:
+            dense = speedup = error = "-"
+        else:
+            dense = f"{1e3 * r['dense']:.4f}"
+            speedup = f"{r['dense'] / r['tangent']:.1f}"
+            error = f"{r['error']:.1e}"
+        print(
+            f"{r['N']:>7}{r['P']:>6}{dense:>13}{1e3 * r['tangent']:>14.4f}"
+            f"{speedup:>10}{r['dense_bytes'] / 2**20:>14.1f}{error:>12}"
+        )
+
+    print()
+    results = benchmark_logistic_update(sizes)
+
+    print(
+        f"{'N':>7}{'r':>6}{'P':>6}{'Gauss-Seidel (ms)':>19}"
+        f"{'synchronous (ms)':>18}{'speedup':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['N']:>7}{r['r']:>6.2f}{r['P']:>6}{1e3 * r['gauss_seidel']:>19.4f}"
+            f"{1e3 * r['synchronous']:>18.4f}"
+            f"{r['gauss_seidel'] / r['synchronous']:>10.1f}"
+        )
+
+    print()
+    results = benchmark_fpu_variational([6, 50, 200, 500, 1000])
+
+    print(
+        f"{'dof':>7}{'dense (ms)':>13}{'stencil (ms)':>14}"
+        f"{'speedup':>10}{'dense J (MB)':>14}{'rel. error':>12}"
+    )
+    for r in results:
+        print(
+            f"{r['dof']:>7}{1e3 * r['dense']:>13.4f}{1e3 * r['variational']:>14.4f}"
+            f"{r['dense'] / r['variational']:>10.1f}"
+            f"{r['dense_bytes'] / 2**20:>14.1f}{r['error']:>12.1e}"
+        )
+
+    print()
+    results = benchmark_inplace_maps()
+
+    print(
+        f"{'map':>9}{'allocating (ns/it)':>20}{'in-place (ns/it)':>18}{'speedup':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['map']:>9}{r['allocating']:>20.1f}{r['inplace']:>18.1f}"
+            f"{r['allocating'] / r['inplace']:>10.1f}"
+        )
+
+    print()
+    results = benchmark_fpu_integrators()
+
+    print(
+        f"{'integrator':>11}{'step/tol':>10}{'time (s)':>10}{'LDI time err.':>15}"
+        f"{'Lyapunov err.':>15}{'energy err.':>13}"
+    )
+    for r in results:
+        step = r["tolerance"] if r["tolerance"] is not None else r["time_step"]
+        print(
+            f"{r['integrator']:>11}{step:>10.0e}{r['time']:>10.2f}"
+            f"{r['ldi_error']:>15.2e}{r['lyapunov_error']:>15.2e}"
+            f"{r['energy_error']:>13.2e}"
+        )
+
+    print()
+    r = benchmark_fpu_energy()
+
+    print(
+        f"{'NumPy (ms)':>12}{'compiled (ms)':>15}{'stats (ms)':>12}{'rel. error':>12}"
+    )
+    print(
+        f"{1e3 * r['numpy']:>12.2f}{1e3 * r['energy']:>15.2f}"
+        f"{1e3 * r['stats']:>12.2f}{r['error']:>12.1e}"
+    )
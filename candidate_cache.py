@@ -0,0 +1,213 @@
+"""
+Persistent cache of the LDI outcomes of the candidates of the rejection
+searches.
+
+The searches draw candidate initial conditions from deterministic seeds, so
+rerunning them (e.g. after changing an acceptance interval in parameters.py)
+integrates the same candidates again. The cache stores the terminal LDI of
+every candidate that was evaluated (the number of iterations, or the time, at
+which its integration stopped, the LDI at that point, whether it had dropped
+below the threshold and whether it had reached the end of the sample) under
+a content-addressed key: a hash of everything that determines the LDI (model
+kernels, parameters, initial condition, k, seeds, threshold and integration
+times). With a new interval, the candidates that the cache proves to be
+rejected are skipped, and only the accepted candidate (whose history and
+Lyapunov exponents are needed) and the undecided ones are integrated.
+
+The entries live in a single SQLite file shared by all the workers. The least
+recently used entries are evicted when the file exceeds its disk budget. Every
+batch of candidates is written with its own transaction, so concurrent workers
+contend for the lock of the file, and SQLite locking is unreliable on network
+file systems: the cache is disabled by default (see CANDIDATE_CACHE in
+parameters.py), and is meant for reruns on a local disk.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import sqlite3
+import time
+import numpy as np
+
+# Fraction of the disk budget left free when the cache is evicted
+EVICTION_FRACTION = 0.1
+
+# Version of the cached outcomes, part of every key: bump it when the LDI
+# drivers of indicators.py change the histories they compute
+CACHE_VERSION = 1
+
+
+@functools.lru_cache(maxsize=None)
+def kernel_identity(kernel):
+    """
+    Return the module, name and source code of a model kernel, so that editing
+    a kernel changes the keys of the outcomes computed with it.
+    """
+    function = getattr(kernel, "py_func", kernel)
+    name = f"{function.__module__}.{getattr(function, '__qualname__', repr(kernel))}"
+    try:
+        return f"{name}\n{inspect.getsource(function)}"
+    except (OSError, TypeError):
+        return name
+
+
+def candidate_key(*content):
+    """
+    Return the content-addressed key of a candidate.
+
+    Parameters:
+    - content: Everything that determines the LDI of the candidate: numbers,
+      strings, arrays and model kernels (identified by their source code, see
+      `kernel_identity`).
+
+    Returns:
+    - Hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}\0".encode())
+    for item in content:
+        if callable(item):
+            item = kernel_identity(item)
+        if isinstance(item, np.ndarray) or isinstance(item, (list, tuple)):
+            array = np.ascontiguousarray(item, dtype=np.float64)
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+        else:
+            digest.update(repr(item).encode())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def cached_decision(entry, target_interval):
+    """
+    Decide the acceptance of a candidate from its cached outcome.
+
+    Parameters:
+    - entry: (length, ldi, crossed, complete) tuple, or None.
+    - target_interval: [lower, upper] bounds of the accepted length (or time).
+
+    Returns:
+    - True or False if the entry decides the acceptance, None otherwise (no
+      entry, or an integration stopped before the upper bound).
+    """
+    if entry is None:
+        return None
+
+    length, _, crossed, complete = entry
+    lo, hi = target_interval
+    if crossed or complete:
+        return bool(lo <= length <= hi)
+    if hi <= length:
+        # The LDI drops below the threshold after the upper bound
+        return False
+
+    return None
+
+
+class CandidateCache:
+    """
+    LRU cache of candidate outcomes in an SQLite file.
+
+    Parameters:
+    - filename: Cache file.
+    - budget: Disk budget in bytes.
+    """
+
+    def __init__(self, filename, budget):
+        self.filename = filename
+        self.budget = budget
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(filename, timeout=600)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS candidates ("
+                "key TEXT PRIMARY KEY, length REAL, ldi REAL, crossed INTEGER, "
+                "complete INTEGER, last_used REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS lru ON candidates (last_used)"
+            )
+
+    def get(self, keys):
+        """
+        Look up candidates and mark them as recently used.
+
+        Returns:
+        - Dictionary mapping the keys found to (length, ldi, crossed, complete).
+        """
+        entries = {}
+        with self.connection:
+            for key in keys:
+                row = self.connection.execute(
+                    "SELECT length, ldi, crossed, complete FROM candidates "
+                    "WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    length, ldi, crossed, complete = row
+                    entries[key] = (length, ldi, bool(crossed), bool(complete))
+            self.connection.executemany(
+                "UPDATE candidates SET last_used = ? WHERE key = ?",
+                [(time.time(), key) for key in entries],
+            )
+
+        return entries
+
+    def put(self, entries):
+        """
+        Store the outcomes of candidates, replacing previous ones, and evict
+        the least recently used entries if the cache exceeds its budget.
+
+        Parameters:
+        - entries: Iterable of (key, length, ldi, crossed, complete) tuples.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, float(length), float(ldi), int(crossed), int(complete), now)
+                    for key, length, ldi, crossed, complete in entries
+                ],
+            )
+        if self.size() > self.budget:
+            self.evict()
+
+    def size(self):
+        """
+        Return the disk space used by the entries, in bytes.
+        """
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        pages = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        free = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return (pages - free) * page_size
+
+    def evict(self):
+        """
+        Delete the least recently used entries so that the cache fits its
+        budget, with a margin of EVICTION_FRACTION of the entries.
+        """
+        count = self.connection.execute("SELECT COUNT(*) FROM candidates")
+        count = count.fetchone()[0]
+        if count == 0:
+            return
+
+        entry_size = self.size() / count
+        keep = int((1 - EVICTION_FRACTION) * self.budget / entry_size)
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM candidates WHERE key IN (SELECT key FROM "
+                "candidates ORDER BY last_used LIMIT ?)",
+                (max(0, count - keep),),
+            )
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        self.connection.close()
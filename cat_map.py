@@ -10,23 +10,34 @@ Usage:
 
     python run_systems.py <num_ic>
 
+    or
+
+    python cat_map.py grid [size]
+
 Arguments:
     i_ini : int
         Starting index of initial conditions for this batch.
     i_end : int
         Ending index of initial conditions for this batch.
+    size : int, optional
+        Number of grid points per axis (default: "grid_size" in parameters.py).
 
 Outputs:
-    Data/Henon/henon_sali_k=<k>_ic=<i>.dat
-    Data/Henon/henon_lyapunov_k=<k>_ic=<i>.dat
+    Data/CatMap/catmap.store, with the records (see store.py)
+        catmap_sali_ic=<i>
+        catmap_<index>_grid_n=<size>   (grid mode, see `run_grid`)
 """
 
 import os
 import sys
+import numpy as np
 from pynamicalsys import DiscreteDynamicalSystem as dds
 from models import cat_map, cat_map_jacobian
-from parameters import CATMAP
-
+from parameters import CATMAP, HISTORY
+from indicators import alignment_index_grid
+from recording import thin_history
+from store import store_file, append_records, has_record, numbered
+from profiling import profiled_task, span
 
 # --------------------------
 # Iteration parameters
@@ -35,6 +46,7 @@ total_time = CATMAP["total_time"]
 
 path = CATMAP["path"]  # Datafiles location
 os.makedirs(path, exist_ok=True)
+results_file = store_file(path, "catmap")  # Result store of all ic
 
 threshold = CATMAP["SALI_threshold"]
 
@@ -48,31 +60,106 @@ ds = dds(
     number_of_parameters=0,
 )
 
+
 # --------------------------
-# Batch indices from command line
+# JIT warm-up
 # --------------------------
-i_ini = int(sys.argv[1])
-i_end = int(sys.argv[2])
+def warm_up():
+    """
+    Compile the model kernels and the pynamicalsys routines used by `run_task`
+    by running them for a couple of iterations.
+    """
+    ds.SALI([0.1, 0.1], 2, seed=0, return_history=True, tol=threshold)
+
 
 # --------------------------
-# Main computation loop
+# Main computation
 # --------------------------
+def task_done(ic):
+    """
+    Return whether a previous run stored the results of the ic-th task.
+    """
+    return has_record(results_file, f"catmap_sali_ic={ic}")
+
+
+@profiled_task("cat_map")
+def run_task(ic):
+    """
+    Compute the SALI history for the ic-th deviation-vector seed and save it.
+
+    Parameters:
+    - ic: Index of the initial condition.
+    """
+    # Skip tasks completed by a previous run
+    if task_done(ic):
+        return
 
-for ic in range(i_ini, i_end + 1):
     # Compute SALI history
-    sali_history = ds.SALI(
-        [0.1, 0.1],
+    with span("sali"):
+        sali_history = ds.SALI(
+            [0.1, 0.1],
+            total_time,
+            seed=1313 * ic,
+            return_history=True,
+            tol=threshold,
+        )
+    sali_history = sali_history[sali_history > 0]
+
+    # --------------------------
+    # Save SALI to the result store
+    # --------------------------
+    with span("write"):
+        append_records(
+            results_file,
+            [(f"catmap_sali_ic={ic}", thin_history(numbered(sali_history), **HISTORY))],
+        )
+
+
+def run_grid(size=None):
+    """
+    Compute the index of CATMAP["grid_index"] ("sali" or "gali") over a size x
+    size grid of initial conditions covering the unit square (the centres of
+    its cells) in a single compiled pass, and save the number of iterations
+    until it drops below the threshold as a single 2D record (rows: y,
+    columns: x). The grid points are the initial conditions, so there is no
+    transient.
+
+    Parameters:
+    - size: Number of grid points per axis (default: CATMAP["grid_size"]).
+    """
+    if size is None:
+        size = CATMAP["grid_size"]
+    index = CATMAP["grid_index"]
+    key = f"catmap_{index}_grid_n={size}"
+
+    # Skip grids completed by a previous run
+    if has_record(results_file, key):
+        return
+
+    points = (np.arange(size) + 0.5) / size
+    times, _ = alignment_index_grid(
+        points,
+        points,
         total_time,
-        seed=1313 * ic,
-        return_history=True,
+        None,
+        cat_map,
+        cat_map_jacobian,
+        index=index,
         tol=threshold,
     )
-    sali_history = sali_history[sali_history > 0]
+    append_records(results_file, [(key, times)])
+
 
+if __name__ == "__main__":
     # --------------------------
-    # Save SALI to file
+    # Batch indices from command line
     # --------------------------
-    sali_file = f"{path}/catmap_sali_ic={ic}.dat"
-    with open(sali_file, "w") as f:
-        for idx, val in enumerate(sali_history):
-            f.write(f"{idx + 1} {val:.16f}\n")
+    if sys.argv[1] == "grid":
+        run_grid(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        sys.exit()
+
+    i_ini = int(sys.argv[1])
+    i_end = int(sys.argv[2])
+
+    for ic in range(i_ini, i_end + 1):
+        run_task(ic)
@@ -0,0 +1,95 @@
+"""
+Checkpoints of the rejection searches, so that preempted runs resume where
+they stopped instead of starting from zero.
+
+A checkpoint holds the state of one (system, k, ic) task: the number of
+rejected candidates (which determines the seeds of the next ones) and, once a
+candidate has been accepted, the state of its Lyapunov integration (orbit,
+Lyapunov vectors, accumulated exponents and step counter). The drivers in
+indicators.py continue the integration from that state with exactly the same
+operations, so a resumed task gives bit-identical results. Checkpoints are
+written atomically (to a temporary file that then replaces the previous one)
+and at most once every `interval` seconds; the checkpoint is removed when the
+results of the task are stored.
+"""
+
+import os
+import time
+import numpy as np
+
+# Minimum time between two writes of a checkpoint, in seconds
+CHECKPOINT_INTERVAL = 60.0
+
+# Number of iterations (or time steps) of the Lyapunov integrations between two
+# opportunities to write a checkpoint
+CHECKPOINT_STEPS = 10000
+
+
+class Checkpoint:
+    """
+    Checkpoint file of a single task.
+
+    Parameters:
+    - filename: Checkpoint file (.npz).
+    - interval: Minimum time between two writes, in seconds.
+
+    Attributes:
+    - state: Last state loaded or saved, as a dictionary of arrays and numbers.
+    """
+
+    def __init__(self, filename, interval=CHECKPOINT_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.state = {}
+        self.last_write = time.monotonic()
+
+    def load(self):
+        """
+        Read the checkpoint, if there is one.
+
+        Returns:
+        - The stored state (empty if there is no checkpoint).
+        """
+        self.state = {}
+        if os.path.exists(self.filename):
+            with np.load(self.filename) as data:
+                self.state = {key: data[key] for key in data.files}
+
+        return self.state
+
+    def save(self, state, force=False):
+        """
+        Record the current state and write it if the last write is older than
+        the interval (or if force is True).
+
+        Returns:
+        - Whether the checkpoint was written.
+        """
+        self.state = state
+        if not force and time.monotonic() - self.last_write < self.interval:
+            return False
+
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+        self.last_write = time.monotonic()
+
+        return True
+
+    def remove(self):
+        """
+        Delete the checkpoint once the task is complete.
+        """
+        self.state = {}
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def checkpoint_file(path, name):
+    """
+    Return the checkpoint file of a task (e.g. name="henon_k=2_ic=5").
+    """
+    return os.path.join(path, f"{name}.checkpoint.npz")
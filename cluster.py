@@ -0,0 +1,570 @@
+"""
+Multi-node backend of the work-queue scheduler.
+
+A coordinator holds the (system, k, ic) tasks of a campaign and hands them out,
+one at a time, to worker processes that connect to it over plain TCP, from this
+host or from any other host that can reach it. Each worker compiles the
+selected systems once, runs the tasks through the `run_task` functions of the
+system scripts and sends the records of each task back instead of writing them
+(see `capture_records` in store.py), so all the results end up in the result
+stores of the coordinator's host.
+
+A worker that disconnects, or stays silent (it sends a heartbeat every
+CLUSTER["heartbeat"] seconds while it works) for longer than
+CLUSTER["lease_timeout"] seconds, loses its task, which goes back to the front
+of the queue; a task lost CLUSTER["max_attempts"] times fails. Tasks that raise
+fail right away, as with the local scheduler. Tasks whose records are already
+in the result stores of the coordinator are not handed out, so a restarted
+coordinator only runs the remaining ones, and results that were lost or moved
+away are computed again.
+
+Messages are length-prefixed frames: a JSON header followed by a binary
+payload, which carries the encoded records of a task. Workers must present the
+coordinator's token, if one is set. The coordinator listens on 127.0.0.1 by
+default; use --host 0.0.0.0 (and a token) to accept remote workers.
+
+Usage:
+    python run_systems.py <num_ic> --mode cluster [--system <n>] [--host <h>]
+                          [--port <p>] [--token <t>] [--workers <n>]
+
+        runs the coordinator (and n local workers, none by default).
+
+    python cluster.py worker <host>:<port> [--processes <n>] [--token <t>]
+                             [--profile <trace>]
+
+        runs n worker processes (default: available CPUs) on this host.
+"""
+
+import argparse
+import collections
+import hmac
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from parameters import CLUSTER
+from profiling import enable as enable_profiling
+from scheduler import available_cpus, describe_task, init_worker, run_task
+from scheduler import print_search_summaries, task_done, task_status
+from store import append_data, capture_records
+from warmup import warm_up
+
+# Lengths of the JSON header and of the payload of a message
+FRAME = struct.Struct("<II")
+MAX_HEADER = 2**20
+
+# Seconds an idle worker waits before asking again while tasks are in flight
+IDLE_DELAY = 1.0
+
+
+def send_message(sock, message, payload=b""):
+    """
+    Send a message: a JSON-serializable dictionary and an optional payload.
+    """
+    header = json.dumps(message, default=lambda value: value.item()).encode()
+    sock.sendall(FRAME.pack(len(header), len(payload)) + header + payload)
+
+
+def receive_exactly(sock, size):
+    """
+    Read exactly size bytes from a socket.
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if received == 0:
+            raise ConnectionError("connection closed")
+        view = view[received:]
+
+    return bytes(data)
+
+
+def receive_message(sock, max_payload=CLUSTER["max_payload"]):
+    """
+    Receive a message, checking the announced sizes before reading it.
+
+    Parameters:
+    - sock: Connected socket.
+    - max_payload: Largest accepted payload, in bytes.
+
+    Returns:
+    - (message, payload): Dictionary and bytes sent by `send_message`.
+    """
+    header_size, payload_size = FRAME.unpack(receive_exactly(sock, FRAME.size))
+    if header_size > MAX_HEADER:
+        raise ConnectionError(f"message header of {header_size} bytes")
+    if payload_size > max_payload:
+        raise ConnectionError(f"message payload of {payload_size} bytes")
+    message = json.loads(receive_exactly(sock, header_size))
+
+    return message, receive_exactly(sock, payload_size)
+
+
+def check_store_file(filename):
+    """
+    Raise ValueError unless filename is a result store below the current
+    directory, the only files workers may append to.
+    """
+    parts = os.path.normpath(filename).split(os.sep)
+    if os.path.isabs(filename) or ".." in parts or not filename.endswith(".store"):
+        raise ValueError(f"refusing to write {filename!r}")
+
+
+class Coordinator:
+    """
+    Queue of the tasks of a campaign and bookkeeping of the tasks in flight.
+
+    Parameters:
+    - tasks: List of (system, j, ic) tuples. Those whose records are already
+      stored are skipped.
+    - batch_size: Number of candidates evaluated at once by the rejection
+      searches of the LDI systems.
+    - token: Secret the workers must present (empty: none).
+    - max_attempts: Times a lost task is handed out before it fails.
+    """
+
+    def __init__(
+        self,
+        tasks,
+        batch_size=1,
+        token="",
+        max_attempts=CLUSTER["max_attempts"],
+    ):
+        self.pending = collections.deque(task for task in tasks if not task_done(task))
+        self.systems = list(dict.fromkeys(task[0] for task in tasks))
+        self.batch_size = batch_size
+        self.token = token
+        self.max_attempts = max_attempts
+        self.skipped = len(tasks) - len(self.pending)
+        self.total = len(self.pending)
+        self.leases = {}  # Task held by each worker
+        self.attempts = collections.Counter()
+        self.done = 0
+        self.failed = []
+        self.stats = {}
+        self.workers = 0
+        self.start = time.perf_counter()
+        self.changed = threading.Condition()
+
+    def finished(self):
+        """
+        Return whether every task has completed or failed.
+        """
+        return not self.pending and not self.leases
+
+    def connect(self):
+        with self.changed:
+            self.workers += 1
+
+    def next_task(self, worker):
+        """
+        Lease the next pending task to a worker.
+
+        Returns:
+        - The task, "wait" if none is pending but some are still in flight
+          (they may be lost and handed out again), or None once finished.
+        """
+        with self.changed:
+            if self.pending:
+                task = self.pending.popleft()
+                self.leases[worker] = task
+                self.attempts[task] += 1
+                return task
+
+            return None if self.finished() else "wait"
+
+    def complete(self, worker, elapsed, result, error, records, payload):
+        """
+        Store the records of the task leased to a worker and report it.
+
+        The records are written without holding the queue, so the other
+        workers are served meanwhile. Records that a result store already
+        holds are not appended again: a task lost after it was stored (e.g.
+        its worker timed out while sending the result) runs again but its
+        records are stored once.
+
+        Parameters:
+        - worker: Name of the worker.
+        - elapsed: Wall time of the task in seconds.
+        - result, error: As returned by `scheduler.run_task`.
+        - records: List of (filename, size) pairs splitting the payload into the
+          encoded records of each result store.
+        - payload: Encoded records.
+        """
+        # The lease is only released once the task is written, so the
+        # campaign is not over before its results are stored
+        with self.changed:
+            task = self.leases[worker]
+        if error is None:
+            try:
+                offset = 0
+                for filename, size in records:
+                    check_store_file(filename)
+                    directory = os.path.dirname(filename)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    data = payload[offset : offset + size]
+                    append_data(filename, data, skip_stored=True)
+                    offset += size
+            except (OSError, ValueError, struct.error) as exc:
+                error = f"{type(exc).__name__}: {exc}"
+
+        with self.changed:
+            del self.leases[worker]
+            self.done += 1
+            if error is not None:
+                self.failed.append(task)
+            if result is not None:
+                self.stats.setdefault(task[:2], []).append(result)
+            print(
+                f"[{self.done}/{self.total}] {describe_task(task)} "
+                f"{task_status(result, error)} in {elapsed:.1f} s on {worker} "
+                f"(total {time.perf_counter() - self.start:.1f} s)",
+                flush=True,
+            )
+            self.changed.notify_all()
+
+    def release(self, worker):
+        """
+        Forget a disconnected worker and put its task, if any, back in the
+        queue (or fail it after max_attempts).
+        """
+        with self.changed:
+            self.workers -= 1
+            task = self.leases.pop(worker, None)
+            if task is not None:
+                attempts = self.attempts[task]
+                if attempts < self.max_attempts:
+                    self.pending.appendleft(task)
+                    print(
+                        f"{describe_task(task)} lost by {worker}, retrying "
+                        f"(attempt {attempts + 1}/{self.max_attempts})",
+                        flush=True,
+                    )
+                else:
+                    self.done += 1
+                    self.failed.append(task)
+                    print(
+                        f"[{self.done}/{self.total}] {describe_task(task)} FAILED "
+                        f"(lost {attempts} times)",
+                        flush=True,
+                    )
+            self.changed.notify_all()
+
+
+class WorkerHandler(socketserver.BaseRequestHandler):
+    """
+    Conversation with one worker connection.
+    """
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        self.request.settimeout(CLUSTER["lease_timeout"])
+        # The hello carries no payload: nothing is allocated for a peer until
+        # it has presented the token
+        try:
+            message, _ = receive_message(self.request, max_payload=0)
+        except (OSError, ValueError):
+            return
+        if not isinstance(message, dict) or message.get("type") != "hello":
+            send_message(self.request, {"type": "rejected"})
+            return
+        token = str(message.get("token", "")).encode()
+        if not hmac.compare_digest(token, coordinator.token.encode()):
+            send_message(self.request, {"type": "rejected"})
+            return
+
+        # The client port tells apart the connections of a reconnected worker
+        worker = (
+            f"{message['name']} ({self.client_address[0]}:{self.client_address[1]})"
+        )
+        send_message(
+            self.request,
+            {
+                "type": "welcome",
+                "systems": coordinator.systems,
+                "batch_size": coordinator.batch_size,
+                "heartbeat": CLUSTER["heartbeat"],
+            },
+        )
+        coordinator.connect()
+        try:
+            while True:
+                message, payload = receive_message(self.request)
+                if message["type"] == "result":
+                    coordinator.complete(
+                        worker,
+                        message["elapsed"],
+                        message["result"],
+                        message["error"],
+                        message["records"],
+                        payload,
+                    )
+                elif message["type"] == "request":
+                    task = coordinator.next_task(worker)
+                    if task is None:
+                        send_message(self.request, {"type": "done"})
+                        return
+                    if task == "wait":
+                        send_message(self.request, {"type": "wait"})
+                    else:
+                        send_message(self.request, {"type": "task", "task": task})
+        except (OSError, ValueError, KeyError):
+            # Lost connection, silent worker (timeout) or malformed message
+            pass
+        finally:
+            coordinator.release(worker)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def worker_command(address, token="", processes=1):
+    """
+    Return the command line of `processes` workers of the coordinator at
+    address.
+    """
+    host, port = address
+    if host in ("", "0.0.0.0"):
+        host = "127.0.0.1"
+    command = [sys.executable, os.path.abspath(__file__), "worker", f"{host}:{port}"]
+    command += ["--processes", str(processes)]
+    if token:
+        command += ["--token", token]
+
+    return command
+
+
+def run_coordinator(
+    tasks,
+    batch_size=1,
+    host=CLUSTER["host"],
+    port=CLUSTER["port"],
+    token="",
+    local_workers=0,
+):
+    """
+    Serve the tasks to the workers that connect until every task has completed
+    or failed.
+
+    Parameters:
+    - tasks: List of (system, j, ic) tuples.
+    - batch_size: Number of candidates evaluated at once by the rejection
+      searches of the LDI systems.
+    - host, port: Address the coordinator listens on (port 0: any free port).
+    - token: Secret the workers must present (empty: none).
+    - local_workers: Number of worker processes launched on this host.
+
+    Returns:
+    - List of the tasks that failed.
+    """
+    coordinator = Coordinator(tasks, batch_size, token)
+    if coordinator.skipped:
+        print(f"Skipping {coordinator.skipped} task(s) already stored")
+    if coordinator.finished():
+        return []
+
+    server = CoordinatorServer((host, port), WorkerHandler)
+    server.coordinator = coordinator
+    address = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving {coordinator.total} tasks on {address[0]}:{address[1]}", flush=True)
+
+    workers = None
+    if local_workers > 0:
+        workers = subprocess.Popen(worker_command(address, token, local_workers))
+
+    try:
+        with coordinator.changed:
+            coordinator.changed.wait_for(coordinator.finished)
+            # Let the idle workers ask once more and learn that the campaign
+            # is over
+            coordinator.changed.wait_for(
+                lambda: coordinator.workers == 0, timeout=2 * IDLE_DELAY
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+        if workers is not None:
+            try:
+                workers.wait(timeout=2 * IDLE_DELAY)
+            except subprocess.TimeoutExpired:
+                workers.terminate()
+
+    print_search_summaries(coordinator.stats)
+
+    return coordinator.failed
+
+
+def heartbeat(sock, lock, interval, stop):
+    """
+    Send a heartbeat every interval seconds until stop is set.
+    """
+    while not stop.wait(interval):
+        try:
+            with lock:
+                send_message(sock, {"type": "heartbeat"})
+        except OSError:
+            return
+
+
+def serve_tasks(sock, processes, warmed):
+    """
+    Run the tasks of the coordinator on a connected socket until it reports
+    that the campaign is over.
+
+    Parameters:
+    - sock: Socket connected to the coordinator, after the hello message.
+    - processes: Number of worker processes on this host (to split the CPUs).
+    - warmed: Set of the systems already compiled in this process, updated.
+    """
+    welcome, _ = receive_message(sock)
+    if welcome["type"] != "welcome":
+        raise PermissionError("rejected by the coordinator (wrong token?)")
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=heartbeat, args=(sock, lock, welcome["heartbeat"], stop), daemon=True
+    )
+    beat.start()
+    try:
+        batch_size = welcome["batch_size"]
+        systems = [system for system in welcome["systems"] if system not in warmed]
+        init_worker(max(1, available_cpus() // processes) if batch_size > 1 else 1)
+        warm_up(systems, batch_size)
+        warmed.update(systems)
+
+        while True:
+            with lock:
+                send_message(sock, {"type": "request"})
+            message, _ = receive_message(sock)
+            if message["type"] == "done":
+                return
+            if message["type"] == "wait":
+                time.sleep(IDLE_DELAY)
+                continue
+
+            with capture_records() as captured:
+                _, elapsed, result, error = run_task(tuple(message["task"]), batch_size)
+            records = [(filename, len(data)) for filename, data in captured]
+            with lock:
+                send_message(
+                    sock,
+                    {
+                        "type": "result",
+                        "elapsed": elapsed,
+                        "result": result,
+                        "error": error,
+                        "records": records,
+                    },
+                    b"".join(data for _, data in captured),
+                )
+    finally:
+        stop.set()
+
+
+def run_worker(address, token="", processes=1, retries=10, retry_delay=5.0):
+    """
+    Connect to a coordinator and run its tasks until the campaign is over,
+    reconnecting after a lost connection.
+
+    Parameters:
+    - address: (host, port) of the coordinator.
+    - token: Secret of the coordinator.
+    - processes: Number of worker processes on this host.
+    - retries: Consecutive failed connection attempts before giving up.
+    - retry_delay: Seconds between connection attempts.
+
+    Returns:
+    - Whether the campaign completed.
+    """
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    warmed = set()
+    failures = 0
+    while failures < retries:
+        try:
+            with socket.create_connection(address) as sock:
+                failures = 0
+                send_message(sock, {"type": "hello", "name": name, "token": token})
+                serve_tasks(sock, processes, warmed)
+                return True
+        except PermissionError as exc:
+            print(f"{name}: {exc}", file=sys.stderr, flush=True)
+            return False
+        except (OSError, ValueError) as exc:
+            failures += 1
+            print(f"{name}: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+            time.sleep(retry_delay)
+
+    return False
+
+
+def worker_process(address, token="", processes=1):
+    """
+    Entry point of a worker process: exit with status 1 unless the campaign
+    completed.
+    """
+    sys.exit(0 if run_worker(address, token, processes) else 1)
+
+
+def parse_address(address):
+    """
+    Split "host:port" into (host, port).
+    """
+    host, port = address.rsplit(":", 1)
+
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the tasks of a coordinator (see run_systems.py)."
+    )
+    parser.add_argument("role", choices=["worker"])
+    parser.add_argument("address", type=parse_address, help="Coordinator host:port")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: available CPUs)",
+    )
+    parser.add_argument("--token", default="", help="Secret of the coordinator")
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Trace file of the profiling events (see profiling.py)",
+    )
+    args = parser.parse_args()
+
+    if args.profile is not None:
+        enable_profiling(args.profile)
+
+    processes = args.processes if args.processes is not None else available_cpus()
+    if processes == 1:
+        worker_process(args.address, args.token)
+
+    workers = [
+        multiprocessing.Process(
+            target=worker_process, args=(args.address, args.token, processes)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    sys.exit(0 if all(worker.exitcode == 0 for worker in workers) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Streaming energy-conservation statistics of Hamiltonian runs.
+
+Checking the energy conservation of a long integration by storing its
+trajectory and evaluating the Hamiltonian afterwards takes memory proportional
+to the number of steps. Here the statistics of the relative energy error
+e(t) = H(t) / H(0) - 1 are accumulated in a fixed-size array instead, one
+energy at a time: during the integration (the flow drivers in indicators.py
+update them at every step when given a Hamiltonian kernel), or in a single
+compiled, parallel pass over a stored trajectory. `summarize_energy` turns them
+into drift statistics: largest |e|, mean and standard deviation of e, final e
+and drift rate (least-squares slope of e against time).
+"""
+
+import numba
+import numpy as np
+from numba import njit, prange
+
+# Fields of a statistics array
+ENERGY_FIELDS = (
+    "samples",
+    "initial_energy",
+    "max_error",
+    "sum_error",
+    "sum_error2",
+    "sum_time",
+    "sum_time2",
+    "sum_time_error",
+    "final_error",
+)
+ENERGY_STATS_SIZE = len(ENERGY_FIELDS)
+
+
+def energy_stats():
+    """
+    Return an empty statistics array.
+    """
+    return np.zeros(ENERGY_STATS_SIZE)
+
+
+@njit(nogil=True)
+def add_energy_error(stats, time, error):
+    """
+    Add the relative energy error at the given time to the statistics.
+    """
+    stats[0] += 1
+    stats[2] = max(stats[2], abs(error))
+    stats[3] += error
+    stats[4] += error * error
+    stats[5] += time
+    stats[6] += time * time
+    stats[7] += time * error
+    stats[8] = error
+
+
+@njit(nogil=True)
+def update_energy_stats(stats, time, H):
+    """
+    Add the energy H at the given time to the statistics. The first energy
+    added is the reference energy H(0).
+    """
+    if stats[0] == 0:
+        stats[1] = H
+    add_energy_error(stats, time, H / stats[1] - 1)
+
+
+@njit(parallel=True)
+def trajectory_energy_stats(trajectory, times, parameters, hamiltonian, stats):
+    """
+    Accumulate the energy statistics of a stored trajectory in a single
+    parallel pass, without storing the energies.
+
+    Parameters:
+    - trajectory: (T, neq) array with one state per row.
+    - times: Time of each state.
+    - parameters: Parameters of the Hamiltonian.
+    - hamiltonian: Kernel `hamiltonian(u, parameters)` returning the energy of
+      a state (e.g. `fermi_pasta_ulam_hamiltonian` in models.py).
+    - stats: Statistics array, updated in place. Unless it already holds
+      samples, the reference energy is that of the first state.
+
+    Returns:
+    - stats.
+    """
+    T = trajectory.shape[0]
+    if T == 0:
+        return stats
+    if stats[0] == 0:
+        stats[1] = hamiltonian(trajectory[0], parameters)
+    H0 = stats[1]
+
+    # Each thread accumulates a contiguous chunk of rows
+    num_chunks = min(T, numba.get_num_threads())
+    partial = np.zeros((num_chunks, ENERGY_STATS_SIZE))
+    for c in prange(num_chunks):
+        for t in range(c * T // num_chunks, (c + 1) * T // num_chunks):
+            H = hamiltonian(trajectory[t], parameters)
+            add_energy_error(partial[c], times[t], H / H0 - 1)
+
+    for c in range(num_chunks):
+        stats[2] = max(stats[2], partial[c, 2])
+        for i in (0, 3, 4, 5, 6, 7):
+            stats[i] += partial[c, i]
+    stats[8] = partial[num_chunks - 1, 8]
+
+    return stats
+
+
+def summarize_energy(stats):
+    """
+    Drift statistics of the relative energy error.
+
+    Parameters:
+    - stats: Statistics array.
+
+    Returns:
+    - Dictionary with the number of "samples", the "initial_energy", the
+      largest absolute error "max_error", the "mean_error" and "std_error",
+      the "final_error" and the "drift_rate" (slope of the error against time).
+    """
+    n = stats[0]
+    if n == 0:
+        return {
+            "samples": 0,
+            "initial_energy": np.nan,
+            "max_error": 0.0,
+            "mean_error": 0.0,
+            "std_error": 0.0,
+            "final_error": 0.0,
+            "drift_rate": 0.0,
+        }
+
+    mean = stats[3] / n
+    std = np.sqrt(max(stats[4] / n - mean**2, 0.0))
+    denominator = n * stats[6] - stats[5] ** 2
+    drift_rate = 0.0
+    if denominator > 0:
+        drift_rate = (n * stats[7] - stats[5] * stats[3]) / denominator
+
+    return {
+        "samples": int(n),
+        "initial_energy": stats[1],
+        "max_error": stats[2],
+        "mean_error": mean,
+        "std_error": std,
+        "final_error": stats[8],
+        "drift_rate": drift_rate,
+    }
+
+
+def format_energy_summary(summary):
+    """
+    Format the output of `summarize_energy` as a single line.
+    """
+    return (
+        f"{summary['samples']} samples, max relative energy error "
+        f"{summary['max_error']:.2e} (mean {summary['mean_error']:.2e}, std "
+        f"{summary['std_error']:.2e}), final {summary['final_error']:.2e}, "
+        f"drift {summary['drift_rate']:.2e} per time unit"
+    )
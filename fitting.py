@@ -0,0 +1,138 @@
+"""
+Vectorized exponential fits of the LDI and SALI histories.
+
+The histories decay as exp(a * n + b). Instead of calling `np.polyfit` on the
+log of every history in a Python loop, the histories are concatenated into a
+flat buffer (a chunk of them at a time, so memory-mapped histories are never
+all loaded at once) and the closed-form least-squares solution of every
+history is obtained from segment sums over that buffer.
+"""
+
+import numpy as np
+
+
+def segment_linear_fit(segment, x, y, num_segments, return_errors=False):
+    """
+    Least-squares straight line y = a * x + b for each segment of a flat buffer.
+
+    Parameters:
+    - segment: Segment index of each point.
+    - x, y: Coordinates of the points.
+    - num_segments: Number of segments.
+    - return_errors: Whether to also return the standard errors of a and b.
+
+    Returns:
+    - (num_segments, 2) array with the slope a and intercept b of each segment
+      (NaN for segments with less than two distinct points).
+    - If return_errors, a second (num_segments, 2) array with their standard
+      errors, from the residual variance RSS / (n - 2) (NaN for segments with
+      less than three points).
+    """
+    n = np.bincount(segment, minlength=num_segments)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.bincount(segment, x, num_segments) / n
+        mean_y = np.bincount(segment, y, num_segments) / n
+
+        # Centered sums, as accurate as np.polyfit
+        dx = x - mean_x[segment]
+        dy = y - mean_y[segment]
+        sxx = np.bincount(segment, dx * dx, num_segments)
+        sxy = np.bincount(segment, dx * dy, num_segments)
+
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        coeffs = np.column_stack((slope, intercept))
+        if not return_errors:
+            return coeffs
+
+        residuals = dy - slope[segment] * dx
+        rss = np.bincount(segment, residuals * residuals, num_segments)
+        variance = np.where(n > 2, rss / (n - 2), np.nan)
+        slope_error = np.sqrt(variance / sxx)
+        intercept_error = np.sqrt(variance * (1 / n + mean_x**2 / sxx))
+
+    return coeffs, np.column_stack((slope_error, intercept_error))
+
+
+def fit_exponential(histories, chunk_size=4096, return_errors=False):
+    """
+    Fit log(y) = a * x + b to each history, using only its positive values.
+
+    Gives the same coefficients as `np.polyfit(x, np.log(y), 1)` for each
+    history, up to round-off.
+
+    Parameters:
+    - histories: Sequence of (n, 2) arrays with the columns x and y, e.g. a
+      list of arrays or a `RaggedArray` (see loader.py).
+    - chunk_size: Number of histories concatenated at once.
+    - return_errors: Whether to also return the least-squares standard errors
+      of the coefficients.
+
+    Returns:
+    - (len(histories), 2) array with the decay rate a and intercept b of each
+      history.
+    - If return_errors, a second (len(histories), 2) array with the standard
+      errors of a and b of each history (see `segment_linear_fit`). The
+      spread over the initial conditions is given by `mean_std` of the first.
+    """
+    coeffs = np.empty((len(histories), 2))
+    errors = np.empty((len(histories), 2))
+    for start in range(0, len(histories), chunk_size):
+        chunk = histories[start : start + chunk_size]
+        lengths = [len(history) for history in chunk]
+        data = np.concatenate(list(chunk)).reshape(-1, 2)
+        segment = np.repeat(np.arange(len(chunk)), lengths)
+
+        positive = data[:, 1] > 0
+        fit = segment_linear_fit(
+            segment[positive],
+            data[positive, 0],
+            np.log(data[positive, 1]),
+            len(chunk),
+            return_errors,
+        )
+        if return_errors:
+            fit, errors[start : start + len(chunk)] = fit
+        coeffs[start : start + len(chunk)] = fit
+
+    if return_errors:
+        return coeffs, errors
+
+    return coeffs
+
+
+def mean_std(values, ddof=1):
+    """
+    Return the mean and standard deviation of values over the initial
+    conditions (first axis).
+    """
+    values = np.asarray(values)
+
+    return np.mean(values, axis=0), np.std(values, axis=0, ddof=ddof)
+
+
+def sum_of_differences(exponents, k, ddof=1):
+    """
+    Sum of the differences between the largest and the next k - 1 Lyapunov
+    exponents, averaged over the initial conditions.
+
+    The uncertainty of each difference is propagated in quadrature from the
+    spreads of its two exponents, as `propagate_error` (utils.py) does, and
+    the uncertainties of the k - 1 differences are then added linearly, not in
+    quadrature: they share the spread of the largest exponent, so they are
+    not independent, and the linear sum is the conservative bound.
+
+    Parameters:
+    - exponents: (num_ic, N) array with the Lyapunov exponents of each initial
+      condition.
+    - k: Number of deviation vectors.
+    - ddof: Delta degrees of freedom of the standard deviations.
+
+    Returns:
+    - (sum, error): Sum of the mean differences and its uncertainty.
+    """
+    mean, std = mean_std(exponents, ddof)
+    differences = mean[0] - mean[1:k]
+    errors = np.sqrt(std[0] ** 2 + std[1:k] ** 2)
+
+    return differences.sum(), errors.sum()
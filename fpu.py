@@ -4,7 +4,7 @@ system using the pynamicalsys package. It generates slightly perturbed initial
 conditions and searches for those that satisfy predefined LDI intervals.
 
 Usage:
-    python fpu.py <i_ini> <i_end>
+    python fpu.py <i_ini> <i_end> [batch_size]
 
     or
 
@@ -15,18 +15,36 @@ Arguments:
         The starting index of initial conditions for this batch.
     i_end : int
         The ending index of initial conditions for this batch.
+    batch_size : int, optional
+        The number of candidate initial conditions evaluated at once, in
+        parallel (default 1).
 
 Outputs:
-    Data/FPU/fpu_ldi_k=<k>_ic=<i>.dat
-    Data/FPU/fpu_lyapunov_k=<k>_ic=<i>.dat
+    Data/FPU/fpu.store, with the records (see store.py)
+        fpu_ldi_k=<k>_ic=<i>
+        fpu_lyapunov_k=<k>_ic=<i>
+        fpu_energy_k=<k>_ic=<i>   (energy statistics, see energy.py)
 """
 
 import os
 import sys
 import numpy as np
-from pynamicalsys import ContinuousDynamicalSystem as cds
-from models import fermi_pasta_ulam, fermi_pasta_ulam_jacobian
-from parameters import FPU
+from models import (
+    fermi_pasta_ulam,
+    fermi_pasta_ulam_jacobian,
+    fermi_pasta_ulam_variational,
+    fermi_pasta_ulam_drift,
+    fermi_pasta_ulam_kick,
+    fermi_pasta_ulam_hamiltonian,
+)
+from indicators import flow_ldi_lyapunov_batch, flow_multi_ldi_lyapunov_batch
+from parameters import FPU, CANDIDATE_CACHE, HISTORY
+from recording import thin_history
+from store import store_file, append_records, has_record, numbered
+from profiling import profiled_task, span
+from checkpoint import Checkpoint, checkpoint_file
+from candidate_cache import CandidateCache
+from energy import energy_stats, summarize_energy, format_energy_summary
 
 # --------------------------
 # System parameters
@@ -39,23 +57,38 @@ parameters = [FPU["beta"]]  # System parameter beta
 
 path = FPU["path"]  # Datafiles location
 os.makedirs(path, exist_ok=True)
+results_file = store_file(path, "fpu")  # Result store of all (k, ic)
 
 # --------------------------
 # Time integration setup
 # --------------------------
 total_time = FPU["total_time"]
-time_step = FPU["time_step"]
-
-# Create the dynamical system
-ds = cds(
-    equations_of_motion=fermi_pasta_ulam,
-    jacobian=fermi_pasta_ulam_jacobian,
-    system_dimension=N,
-    number_of_parameters=1,
-)
+time_step = FPU["time_step"]  # Time step (initial step of "rk45")
+
+# Integrator of the LDI and Lyapunov runs: fixed-step RK4, adaptive RK45, or a
+# symplectic scheme built on the drift and kick kernels of the chain
+integrator_options = {
+    "integrator": FPU["integrator"],
+    "splitting": (fermi_pasta_ulam_drift, fermi_pasta_ulam_kick),
+    "atol": FPU["tolerance"],
+    "rtol": FPU["tolerance"],
+}
+
+# Variational equations from the nearest-neighbour stencil instead of the dense
+# Jacobian (for long chains), and number of Lyapunov exponents
+variational = fermi_pasta_ulam_variational if FPU["jacobian_free"] else None
+num_exponents = FPU["num_exponents"]
+
+# Energy conservation monitor: the relative energy error of the accepted
+# candidate is tracked at every step of its integration, and its results are
+# not stored if it exceeds max_energy_error
+max_energy_error = FPU["max_energy_error"]
+if max_energy_error is not None:
+    integrator_options["hamiltonian"] = fermi_pasta_ulam_hamiltonian
 
-# Select numerical integrator
-ds.integrator("rk4", time_step=time_step)
+# Search for all ks at once: each candidate evolves max(ks) deviation vectors
+# and is tested against the target interval of every k
+multi_k = FPU["multi_k"]
 
 # --------------------------
 # Initial conditions
@@ -68,57 +101,271 @@ u[2] = X
 ks = FPU["ks"]
 intervals = FPU["intervals"]
 
-# Range of initial conditions handled by this batch
-i_ini = int(sys.argv[1])
-i_end = int(sys.argv[2])
 
 # --------------------------
-# Main computation loop
+# JIT warm-up
+# --------------------------
+def warm_up(batch_size=1):
+    """
+    Compile the model kernels and the LDI and Lyapunov drivers used by
+    `run_task` by running them for a couple of time steps. The threshold is
+    crossed at the first step, so the Lyapunov continuation of the accepted
+    candidate is compiled too.
+
+    Parameters:
+    - batch_size: Number of candidates evaluated at once by `run_task`.
+    """
+    if multi_k:
+        flow_multi_ldi_lyapunov_batch(
+            [u] * batch_size,
+            2 * time_step,
+            ks,
+            parameters,
+            fermi_pasta_ulam,
+            fermi_pasta_ulam_jacobian,
+            [[0, 1]] * len(ks),
+            time_step,
+            seed=2,
+            threshold=1.0,
+            num_exponents=num_exponents,
+            variational=variational,
+            **integrator_options,
+        )
+        return
+
+    flow_ldi_lyapunov_batch(
+        [u] * batch_size,
+        2 * time_step,
+        ks[0],
+        parameters,
+        fermi_pasta_ulam,
+        fermi_pasta_ulam_jacobian,
+        [0, 1],
+        time_step,
+        seed=2,
+        threshold=1.0,
+        num_exponents=num_exponents,
+        variational=variational,
+        **integrator_options,
+    )
+
+
+# --------------------------
+# Main computation
 # --------------------------
-for j, k in enumerate(ks):
+def energy_records(energy, keys, checkpoint):
+    """
+    Check the energy conservation of an accepted candidate.
+
+    Parameters:
+    - energy: Energy statistics of the candidate.
+    - keys: Suffixes "k=<k>_ic=<i>" of the records of the candidate.
+    - checkpoint: Checkpoint of the task, removed if the check fails.
+
+    Returns:
+    - Records of the energy statistics (none if the energy is not monitored).
+    """
+    if max_energy_error is None:
+        return []
+
+    summary = summarize_energy(energy)
+    if summary["max_error"] > max_energy_error:
+        # Start over once the integrator settings are fixed
+        checkpoint.remove()
+        raise RuntimeError(
+            f"fpu {keys[0]}: energy not conserved ({format_energy_summary(summary)}"
+            f"); decrease the time step or tolerance"
+        )
+
+    return [(f"fpu_energy_{key}", energy) for key in keys]
+
+
+def task_done(j, ic):
+    """
+    Return whether a previous run stored the results of the task of the j-th
+    k and the ic-th initial condition. With multi_k, the task of the first k
+    searches for all the ks and the others have nothing to do.
+    """
+    if multi_k and j > 0:
+        return True
+    if multi_k:
+        return all(has_record(results_file, f"fpu_ldi_k={k}_ic={ic}") for k in ks)
+
+    return has_record(results_file, f"fpu_ldi_k={ks[j]}_ic={ic}")
+
+
+@profiled_task("fpu")
+def run_task(j, ic, batch_size=1):
+    """
+    Search for a perturbed initial condition whose LDI falls within the j-th
+    target interval and save its LDI history and Lyapunov exponents.
+
+    Parameters:
+    - j: Index of the LDI calculation (k = ks[j]) and of its target interval.
+    - ic: Index of the initial condition.
+    - batch_size: Number of candidates evaluated at once (in parallel).
+    """
+    if multi_k:
+        # The task of the first k searches for all of them
+        if j == 0:
+            run_multi_k_task(ic, batch_size)
+        return
+
+    k = ks[j]
     target_interval = intervals[j]
 
-    for ic in range(i_ini, i_end + 1):
-        count = 0
+    # Skip tasks completed by a previous run
+    if task_done(j, ic):
+        return
+
+    # Outcomes of the candidates evaluated by previous runs
+    cache = None
+    if CANDIDATE_CACHE["enabled"]:
+        cache = CandidateCache(CANDIDATE_CACHE["filename"], CANDIDATE_CACHE["budget"])
 
-        # Keep generating perturbed initial conditions until the LDI falls within target
-        while True:
+    # Resume the search where a preempted run stopped
+    checkpoint = Checkpoint(checkpoint_file(path, f"fpu_k={k}_ic={ic}"))
+    count = int(checkpoint.load().get("count", 0))
+
+    # Keep generating perturbed initial conditions until the LDI falls within target
+    energy = energy_stats()
+    while True:
+        # Perturbed initial conditions of the next batch of candidates
+        candidates = []
+        for b in range(batch_size):
             # Seed ensures reproducibility for each IC
-            np.random.seed(ic * 1313 + j + count)
+            np.random.seed(ic * 1313 + j + count + b)
 
             # Perturb middle particle
             u[2] = X - dx * np.random.rand()
+            candidates.append(u.copy())
+
+        # Compute LDI, stopping as soon as each candidate is decided, and the
+        # Lyapunov exponents of the first accepted candidate along the same
+        # trajectory
+        index, ldi_history, _, lyapunov_values = flow_ldi_lyapunov_batch(
+            candidates,
+            total_time,
+            k,
+            parameters,
+            fermi_pasta_ulam,
+            fermi_pasta_ulam_jacobian,
+            target_interval,
+            time_step,
+            seed=2,
+            threshold=1e-15,
+            num_exponents=num_exponents,
+            variational=variational,
+            checkpoint=checkpoint,
+            cache=cache,
+            energy=energy,
+            **integrator_options,
+        )
+
+        # Check if LDI falls into the target interval
+        if index is not None:
+            break
+
+        count += batch_size
+        checkpoint.save({"count": count})
+
+    # --------------------------
+    # Save results to the result store
+    # --------------------------
+    # LDI history (time, LDI), Lyapunov exponents and energy statistics
+    if cache is not None:
+        cache.close()
+    with span("write"):
+        append_records(
+            results_file,
+            [
+                (f"fpu_ldi_k={k}_ic={ic}", thin_history(ldi_history, **HISTORY)),
+                (f"fpu_lyapunov_k={k}_ic={ic}", numbered(lyapunov_values)),
+            ]
+            + energy_records(energy, [f"k={k}_ic={ic}"], checkpoint),
+        )
+    checkpoint.remove()
+
+
+def run_multi_k_task(ic, batch_size=1):
+    """
+    Search for perturbed initial conditions whose LDI falls within the target
+    interval of every k, evaluating each candidate once for all the ks, and
+    save the LDI history and Lyapunov exponents of each k as `run_task` does.
+
+    Parameters:
+    - ic: Index of the initial condition.
+    - batch_size: Number of candidates evaluated at once (in parallel).
+    """
+    # Skip the ks completed by a previous run
+    pending = [
+        j
+        for j, k in enumerate(ks)
+        if not has_record(results_file, f"fpu_ldi_k={k}_ic={ic}")
+    ]
+    if not pending:
+        return
+
+    # Resume the search where a preempted run stopped
+    checkpoint = Checkpoint(checkpoint_file(path, f"fpu_ic={ic}"))
+    count = int(checkpoint.load().get("count", 0))
+    energy = energy_stats()
+    while pending:
+        # Perturbed initial conditions of the next batch of candidates
+        candidates = []
+        for b in range(batch_size):
+            np.random.seed(ic * 1313 + count + b)
+            u[2] = X - dx * np.random.rand()
+            candidates.append(u.copy())
+
+        index, ldi_histories, _, lyapunov_values = flow_multi_ldi_lyapunov_batch(
+            candidates,
+            total_time,
+            ks,
+            parameters,
+            fermi_pasta_ulam,
+            fermi_pasta_ulam_jacobian,
+            intervals,
+            time_step,
+            pending,
+            seed=2,
+            threshold=1e-15,
+            num_exponents=num_exponents,
+            variational=variational,
+            checkpoint=checkpoint,
+            energy=energy,
+            **integrator_options,
+        )
+        if index is None:
+            count += batch_size
+        else:
+            # Save the results of every k the candidate is accepted for
+            records = []
+            for j, ldi_history in ldi_histories.items():
+                if j in pending:
+                    records += [
+                        (
+                            f"fpu_ldi_k={ks[j]}_ic={ic}",
+                            thin_history(ldi_history, **HISTORY),
+                        ),
+                        (f"fpu_lyapunov_k={ks[j]}_ic={ic}", numbered(lyapunov_values)),
+                    ]
+            keys = [f"k={ks[j]}_ic={ic}" for j in ldi_histories if j in pending]
+            records += energy_records(energy, keys, checkpoint)
+            with span("write"):
+                append_records(results_file, records)
+            pending = [j for j in pending if j not in ldi_histories]
+            count += index + 1
+        checkpoint.save({"count": count})
+    checkpoint.remove()
+
+
+if __name__ == "__main__":
+    # Range of initial conditions handled by this batch
+    i_ini = int(sys.argv[1])
+    i_end = int(sys.argv[2])
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
 
-            # Compute LDI
-            ldi_history = ds.LDI(
-                u,
-                total_time,
-                k,
-                parameters=parameters,
-                seed=2,
-                return_history=True,
-                threshold=1e-15,
-            )
-
-            # Check if LDI falls into the target interval
-            if target_interval[0] <= ldi_history[-1, 0] <= target_interval[1]:
-                # Compute Lyapunov exponents only for accepted IC
-                lyapunov_values = ds.lyapunov(u, total_time, parameters=parameters)
-                break
-
-            count += 1
-
-        # --------------------------
-        # Save results to files
-        # --------------------------
-        # LDI history
-        ldi_file = f"{path}/fpu_ldi_k={k}_ic={ic}.dat"
-        with open(ldi_file, "w") as f:
-            for row in ldi_history:
-                f.write(f"{row[0]:.16f} {row[1]:.16f}\n")
-
-        # Lyapunov exponents
-        lyap_file = f"{path}/fpu_lyapunov_k={k}_ic={ic}.dat"
-        with open(lyap_file, "w") as f:
-            for idx, val in enumerate(lyapunov_values):
-                f.write(f"{idx + 1} {val:.16f}\n")
+    for j in range(len(ks)):
+        for ic in range(i_ini, i_end + 1):
+            run_task(j, ic, batch_size)
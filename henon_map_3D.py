@@ -4,7 +4,7 @@ using pynamicalsys. It generates slightly perturbed initial conditions and searc
 for those that satisfy predefined LDI intervals.
 
 Usage:
-    python henon_map_3D.py <i_ini> <i_end>
+    python henon_map_3D.py <i_ini> <i_end> [batch_size]
 
     or
 
@@ -15,18 +15,33 @@ Arguments:
         Starting index of initial conditions for this batch.
     i_end : int
         Ending index of initial conditions for this batch.
+    batch_size : int, optional
+        Number of candidate initial conditions evaluated at once, in parallel
+        (default 1).
 
 Outputs:
-    Data/Henon/henon_ldi_k=<k>_ic=<i>.dat
-    Data/Henon/henon_lyapunov_k=<k>_ic=<i>.dat
+    Data/Henon/henon.store, with the records (see store.py)
+        henon_ldi_k=<k>_ic=<i>
+        henon_lyapunov_k=<k>_ic=<i>
 """
 
 import os
 import sys
 import numpy as np
-from pynamicalsys import DiscreteDynamicalSystem as dds
-from models import henon_map_3D, henon_map_3D_jacobian
-from parameters import HENON
+from models import (
+    henon_map_3D,
+    henon_map_3D_jacobian,
+    henon_map_3D_inplace,
+    henon_map_3D_jacobian_inplace,
+)
+from indicators import ldi_lyapunov_batch, search_summary, format_search_summary
+from parameters import HENON, CANDIDATE_CACHE, HISTORY
+from recording import thin_history
+from store import store_file, append_records, has_record, numbered
+from profiling import profiled_task, span
+from checkpoint import Checkpoint, checkpoint_file
+from candidate_cache import CandidateCache
+from transient_cache import shared_transient_cache
 
 # --------------------------
 # System parameters
@@ -42,79 +57,169 @@ sample_size = HENON["sample_size"]
 transient_time = HENON["transient_time"]
 total_time = sample_size + transient_time
 
+# In-place kernels writing into preallocated buffers instead of allocating new
+# arrays at every iteration (same orbit, LDI equal up to round-off)
+if HENON["inplace_kernels"]:
+    inplace_kernels = {
+        "mapping_inplace": henon_map_3D_inplace,
+        "jacobian_inplace": henon_map_3D_jacobian_inplace,
+    }
+else:
+    inplace_kernels = {}
+
 # Indices of LDI calculations and corresponding target intervals
 intervals = HENON["intervals"]
 
 path = HENON["path"]  # Datafiles location
 os.makedirs(path, exist_ok=True)
+results_file = store_file(path, "henon")  # Result store of all (k, ic)
 
-# --------------------------
-# Create dynamical system
-# --------------------------
-ds = dds(
-    mapping=henon_map_3D,
-    jacobian=henon_map_3D_jacobian,
-    system_dimension=3,
-    number_of_parameters=3,
-)
 
 # --------------------------
-# Batch indices from command line
+# JIT warm-up
 # --------------------------
-i_ini = int(sys.argv[1])
-i_end = int(sys.argv[2])
+def warm_up(batch_size=1):
+    """
+    Compile the model kernels and the LDI and Lyapunov drivers used by
+    `run_task` by running them for a couple of iterations.
+
+    Parameters:
+    - batch_size: Number of candidates evaluated at once by `run_task`.
+    """
+    ldi_lyapunov_batch(
+        [u0] * batch_size,
+        2,
+        2,
+        parameters,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+        [1, 1],
+        transient_time=1,
+        **inplace_kernels,
+    )
+
 
 # --------------------------
-# Main computation loop
+# Main computation
 # --------------------------
-for j, target_interval in enumerate(intervals):
+def task_done(j, ic):
+    """
+    Return whether a previous run stored the results of the task of the j-th
+    k and the ic-th initial condition.
+    """
+    return has_record(results_file, f"henon_ldi_k={j + 2}_ic={ic}")
+
+
+@profiled_task("henon_map_3D")
+def run_task(j, ic, batch_size=1):
+    """
+    Search for a perturbed initial condition whose LDI falls within the j-th
+    target interval and save its LDI history and Lyapunov exponents.
+
+    Parameters:
+    - j: Index of the LDI calculation (k = j + 2) and of its target interval.
+    - ic: Index of the initial condition.
+    - batch_size: Number of candidates evaluated at once (in parallel).
+
+    Returns:
+    - Dictionary with the number of "candidates" drawn until the accepted one,
+      the "iterations" performed and the "full_iterations" the evaluated
+      candidates would have needed without early abort. None if the results
+      of the task were already stored.
+    """
+    target_interval = intervals[j]
     k_val = j + 2  # k-index for LDI, matching original code
 
-    for ic in range(i_ini, i_end + 1):
-        count = 0
-        while True:
+    # Skip tasks completed by a previous run
+    if task_done(j, ic):
+        return None
+
+    # Outcomes of the candidates evaluated by previous runs
+    cache = None
+    if CANDIDATE_CACHE["enabled"]:
+        cache = CandidateCache(CANDIDATE_CACHE["filename"], CANDIDATE_CACHE["budget"])
+
+    # Resume the search where a preempted run stopped
+    checkpoint = Checkpoint(checkpoint_file(path, f"henon_k={k_val}_ic={ic}"))
+    state = checkpoint.load()
+    count = int(state.get("count", 0))
+    iterations = int(state.get("iterations", 0))
+    evaluated = int(state.get("evaluated", 0))
+    while True:
+        # Perturbed initial conditions of the next batch of candidates
+        candidates = []
+        for b in range(batch_size):
             # Set reproducible seed
-            np.random.seed(ic * 13 + j + count)
+            np.random.seed(ic * 13 + j + count + b)
 
             # Perturb initial condition
             u = u0 + np.random.rand(3) * du
-
-            # Compute LDI history
-            ldi_history = ds.LDI(
-                u,
-                total_time,
-                k=k_val,
-                parameters=parameters,
-                seed=2,
-                transient_time=transient_time,
-                return_history=True,
-            )
+            candidates.append(u)
+
+        # Compute LDI histories, stopping as soon as each candidate is decided,
+        # and the Lyapunov exponents of the first accepted candidate along the
+        # same orbit
+        index, ldi_history, n, lyapunov_values = ldi_lyapunov_batch(
+            candidates,
+            total_time,
+            k_val,
+            parameters,
+            henon_map_3D,
+            henon_map_3D_jacobian,
+            target_interval,
+            transient_time=transient_time,
+            seed=2,
+            checkpoint=checkpoint,
+            cache=cache,
+            transients=shared_transient_cache(),
+            **inplace_kernels,
+        )
+        iterations += n
+        evaluated += batch_size
+
+        # Accept if LDI length falls in the target interval
+        if index is not None:
+            count += index
             ldi_history = ldi_history[ldi_history > 0]
-
-            # Accept if LDI length falls in the target interval
-            if target_interval[0] <= len(ldi_history) <= target_interval[1]:
-                # Compute Lyapunov exponents
-                lyapunov_values = ds.lyapunov(
-                    u,
-                    total_time,
-                    parameters=parameters,
-                    transient_time=transient_time,
-                )
-                break
-            count += 1
-
-        # --------------------------
-        # Save LDI to file
-        # --------------------------
-        ldi_file = f"{path}/henon_ldi_k={k_val}_ic={ic}.dat"
-        with open(ldi_file, "w") as f:
-            for idx, val in enumerate(ldi_history):
-                f.write(f"{idx + 1} {val:.16f}\n")
-
-        # --------------------------
-        # Save Lyapunov exponents to file
-        # --------------------------
-        lyap_file = f"{path}/henon_lyapunov_k={k_val}_ic={ic}.dat"
-        with open(lyap_file, "w") as f:
-            for idx, val in enumerate(lyapunov_values):
-                f.write(f"{idx + 1} {val:.16f}\n")
+            break
+        count += batch_size
+        checkpoint.save(
+            {"count": count, "iterations": iterations, "evaluated": evaluated}
+        )
+
+    # --------------------------
+    # Save LDI and Lyapunov exponents to the result store
+    # --------------------------
+    with span("write"):
+        append_records(
+            results_file,
+            [
+                (
+                    f"henon_ldi_k={k_val}_ic={ic}",
+                    thin_history(numbered(ldi_history), **HISTORY),
+                ),
+                (f"henon_lyapunov_k={k_val}_ic={ic}", numbered(lyapunov_values)),
+            ],
+        )
+    checkpoint.remove()
+    if cache is not None:
+        cache.close()
+
+    return {
+        "candidates": count + 1,
+        "iterations": iterations,
+        "full_iterations": evaluated * total_time,
+    }
+
+
+if __name__ == "__main__":
+    # --------------------------
+    # Batch indices from command line
+    # --------------------------
+    i_ini = int(sys.argv[1])
+    i_end = int(sys.argv[2])
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    for j in range(len(intervals)):
+        stats = [run_task(j, ic, batch_size) for ic in range(i_ini, i_end + 1)]
+        print(f"k = {j + 2}: {format_search_summary(search_summary(stats))}")
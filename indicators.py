@@ -0,0 +1,2102 @@
+"""
+Compiled chaos-indicator drivers used by the system scripts.
+
+The routines follow the pynamicalsys implementations (same deviation-vector
+initialization, same update order and same definition of the indices), so they
+reproduce the values computed by `DiscreteDynamicalSystem` and
+`ContinuousDynamicalSystem`, but they are specialised for the way the system
+scripts use them: the LDI of a candidate initial condition is computed only
+until its acceptance is decided, and the Lyapunov spectrum of an accepted
+candidate is computed along the same orbit instead of integrating it again.
+Several candidates can be evaluated at once, one per thread: the compiled
+routines release the GIL.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numba
+import numpy as np
+from numba import njit, prange
+from pynamicalsys.common.utils import qr
+from pynamicalsys.continuous_time.numerical_integrators import (
+    RK45_A,
+    RK45_B4,
+    RK45_B5,
+    RK45_C,
+)
+from checkpoint import CHECKPOINT_STEPS
+from candidate_cache import candidate_key, cached_decision
+from energy import energy_stats, update_energy_stats
+from profiling import span
+from transient_cache import transient_key
+
+# Sub-step sizes, in units of the time step, of the symplectic integrators:
+# the leapfrog scheme and its fourth- and sixth-order compositions (Yoshida,
+# Phys. Lett. A 150, 262 (1990); sixth order: solution A)
+_Y4 = 1 / (2 - 2 ** (1 / 3))
+_Y6 = (-1.17767998417887, 0.235573213359357, 0.784513610477560)
+SYMPLECTIC_SCHEMES = {
+    "leapfrog": (1.0,),
+    "yoshida4": (_Y4, 1 - 2 * _Y4, _Y4),
+    "yoshida6": _Y6[::-1] + (1 - 2 * sum(_Y6),) + _Y6,
+}
+
+
+def initial_deviation_vectors(neq, k, seed):
+    """
+    Draw k orthonormal deviation vectors exactly as pynamicalsys does.
+
+    Parameters:
+    - neq: Dimension of the system.
+    - k: Number of deviation vectors.
+    - seed: Seed of the random number generator.
+
+    Returns:
+    - (neq, k) array with orthonormal columns.
+    """
+    np.random.seed(seed)
+    v = np.ascontiguousarray(np.random.rand(neq, k))
+    v, _ = qr(v)
+
+    return v
+
+
+@njit(nogil=True)
+def burn_in(u, parameters, transient_time, mapping, mapping_inplace=None):
+    """
+    Iterate the mapping transient_time times and return the final state.
+
+    If an in-place mapping `mapping_inplace(u, parameters, out)` is given, it
+    is used instead, alternating between u and a single buffer.
+    """
+    if mapping_inplace is None:
+        for _ in range(transient_time):
+            u = mapping(u, parameters)
+    else:
+        u_next = np.empty_like(u)
+        for _ in range(transient_time):
+            u, u_next = mapping_inplace(u, parameters, u_next), u
+
+    return u
+
+
+def post_transient(
+    u, parameters, transient_time, mapping, mapping_inplace=None, cache=None
+):
+    """
+    Return a new array with the state reached after transient_time iterations
+    of u, looked up in the cache first and stored in it when it is computed.
+
+    Parameters:
+    - u: Initial condition.
+    - parameters: Parameters of the mapping.
+    - transient_time: Number of iterations.
+    - mapping, mapping_inplace: As in `burn_in`.
+    - cache: Optional `TransientCache` (see transient_cache.py).
+
+    Returns:
+    - Post-transient state, bit-identical to that of `burn_in`.
+    """
+    u = np.array(u, dtype=np.float64)
+    parameters = np.asarray(parameters, dtype=np.float64)
+    if cache is None or transient_time <= 0:
+        return burn_in(u, parameters, transient_time, mapping, mapping_inplace)
+
+    key = transient_key(u, parameters, transient_time, mapping)
+    state = cache.get(key)
+    if state is None:
+        state = burn_in(u, parameters, transient_time, mapping, mapping_inplace)
+        cache.put(key, state)
+
+    return state
+
+
+@njit(nogil=True)
+def apply_jacobian(J, V, x):
+    """
+    Replace each column of V by J times it, using x as scratch space.
+    """
+    n, m = V.shape
+    for l in range(m):
+        for i in range(n):
+            s = 0.0
+            for j in range(n):
+                s += J[i, j] * V[j, l]
+            x[i] = s
+        for i in range(n):
+            V[i, l] = x[i]
+
+
+@njit(nogil=True)
+def nested_ldi(v, ks, out):
+    """
+    Write into out[j] the LDI of the first ks[j] columns of v (unit vectors),
+    for ks in increasing order.
+
+    The LDI of the first k unit vectors is the square root of their Gram
+    determinant, i.e. the product of the first k diagonal elements of R in the
+    QR decomposition of v, so a single (Householder) decomposition gives the
+    LDI of every nested set of vectors.
+    """
+    R = np.linalg.qr(v)[1]
+    ldi = 1.0
+    i = 0
+    for j in range(len(ks)):
+        while i < ks[j]:
+            ldi *= abs(R[i, i])
+            i += 1
+        out[j] = ldi
+
+
+@njit(nogil=True)
+def evolve_ldi_lyapunov(
+    u,
+    parameters,
+    mapping,
+    jacobian,
+    v,
+    w,
+    exponents,
+    max_time,
+    tol,
+    tangent=None,
+    mapping_inplace=None,
+    jacobian_inplace=None,
+    constant_jacobian=False,
+):
+    """
+    Evolve the orbit together with the LDI deviation vectors v and the
+    Lyapunov vectors w for at most max_time iterations, stopping at the first
+    iteration where the LDI drops below tol.
+
+    Both sets of vectors share the orbit and the Jacobian of each iteration.
+    The vectors in v are normalized and w is re-orthonormalized (QR) after
+    every iteration; the log of the diagonal of R is accumulated in exponents.
+    If a tangent map `tangent(u, parameters, V)` returning J @ V is given, it
+    is used instead of building the Jacobian. Otherwise, the in-place kernels
+    `mapping_inplace(u, parameters, out)` and `jacobian_inplace(u, parameters,
+    J)`, if given, write into buffers allocated once, and with
+    constant_jacobian the Jacobian is only evaluated once.
+
+    Returns:
+    - (history, u, w): LDI at each of the iterations performed, and the final
+      state and Lyapunov vectors.
+    """
+    k = v.shape[1]
+    m = w.shape[1]
+    history = np.zeros(max_time)
+
+    # Buffers of the in-place kernels (the Jacobian only if it is used)
+    neq = len(u) if jacobian_inplace is not None else 0
+    u_next = np.empty_like(u)
+    J = np.empty((neq, neq))
+    x = np.empty(neq)
+    if constant_jacobian and jacobian_inplace is not None:
+        jacobian_inplace(u, parameters, J)
+
+    n = 0
+    while n < max_time:
+        if mapping_inplace is None:
+            u = mapping(u, parameters)
+        else:
+            u, u_next = mapping_inplace(u, parameters, u_next), u
+
+        # Update deviation vectors
+        if tangent is not None:
+            v = tangent(u, parameters, v)
+            w = tangent(u, parameters, w)
+        elif jacobian_inplace is not None:
+            if not constant_jacobian:
+                jacobian_inplace(u, parameters, J)
+            apply_jacobian(J, v, x)
+            apply_jacobian(J, w, x)
+        else:
+            J = np.ascontiguousarray(jacobian(u, parameters, mapping))
+            for i in range(k):
+                v[:, i] = J @ np.ascontiguousarray(v[:, i])
+            for i in range(m):
+                w[:, i] = J @ np.ascontiguousarray(w[:, i])
+        for i in range(k):
+            v[:, i] = v[:, i] / np.linalg.norm(v[:, i])
+
+        # LDI is the product of all singular values
+        _, S, _ = np.linalg.svd(v, full_matrices=False)
+        ldi = np.exp(np.sum(np.log(S)))
+
+        # Lyapunov exponents accumulate the stretching along each direction
+        w, R = qr(w)
+        exponents += np.log(np.abs(np.diag(R)))
+
+        history[n] = ldi
+        n += 1
+
+        if ldi < tol:
+            break
+
+    return history[:n], u, w
+
+
+@njit(nogil=True)
+def evolve_lyapunov(
+    u,
+    parameters,
+    mapping,
+    jacobian,
+    w,
+    exponents,
+    steps,
+    tangent=None,
+    mapping_inplace=None,
+    jacobian_inplace=None,
+    constant_jacobian=False,
+):
+    """
+    Evolve the orbit and the Lyapunov vectors w for the given number of
+    iterations, accumulating the log of the diagonal of R in exponents.
+
+    Returns:
+    - (u, w): Final state and Lyapunov vectors.
+    """
+    m = w.shape[1]
+    # Buffers of the in-place kernels (the Jacobian only if it is used)
+    neq = len(u) if jacobian_inplace is not None else 0
+    u_next = np.empty_like(u)
+    J = np.empty((neq, neq))
+    x = np.empty(neq)
+    if constant_jacobian and jacobian_inplace is not None:
+        jacobian_inplace(u, parameters, J)
+
+    for _ in range(steps):
+        if mapping_inplace is None:
+            u = mapping(u, parameters)
+        else:
+            u, u_next = mapping_inplace(u, parameters, u_next), u
+
+        if tangent is not None:
+            w = tangent(u, parameters, w)
+        elif jacobian_inplace is not None:
+            if not constant_jacobian:
+                jacobian_inplace(u, parameters, J)
+            apply_jacobian(J, w, x)
+        else:
+            J = np.ascontiguousarray(jacobian(u, parameters, mapping))
+            for i in range(m):
+                w[:, i] = J @ np.ascontiguousarray(w[:, i])
+        w, R = qr(w)
+        exponents += np.log(np.abs(np.diag(R)))
+
+    return u, w
+
+
+@njit(nogil=True)
+def alignment_spectrum(
+    u, parameters, mapping, jacobian, v, steps, out, stride=1, tangent=None
+):
+    """
+    Evolve the orbit and the deviation vectors v for the given number of
+    iterations, normalizing each vector after every iteration, and record the
+    singular values of v (whose product is the LDI) every stride iterations.
+
+    Parameters:
+    - u: Initial condition.
+    - parameters: Parameters of the mapping.
+    - mapping, jacobian: Model kernels (see models.py).
+    - v: (neq, k) deviation vectors, updated in place.
+    - steps: Number of iterations.
+    - out: Preallocated (steps // stride, k) array; row i receives the
+      singular values after (i + 1) * stride iterations, in decreasing order.
+    - stride: Sub-sampling stride.
+    - tangent: Optional tangent map `tangent(u, parameters, V)` returning
+      J @ V without building the Jacobian.
+
+    Returns:
+    - Final state.
+    """
+    k = v.shape[1]
+    row = 0
+    for n in range(1, steps + 1):
+        u = mapping(u, parameters)
+        if tangent is None:
+            J = np.ascontiguousarray(jacobian(u, parameters, mapping))
+            for i in range(k):
+                v[:, i] = J @ np.ascontiguousarray(v[:, i])
+        else:
+            v[:, :] = tangent(u, parameters, v)
+        for i in range(k):
+            v[:, i] = v[:, i] / np.linalg.norm(v[:, i])
+
+        if n % stride == 0 and row < out.shape[0]:
+            _, S, _ = np.linalg.svd(v, full_matrices=False)
+            out[row] = S
+            row += 1
+
+    return u
+
+
+def map_candidates(search, U):
+    """
+    Apply search to every row of U, running up to `numba.get_num_threads()`
+    rows at once on separate threads.
+
+    Returns:
+    - List with the result of each row, in order.
+    """
+    num_threads = min(len(U), numba.get_num_threads())
+    if num_threads == 1:
+        return [search(u) for u in U]
+
+    with ThreadPoolExecutor(num_threads) as pool:
+        return list(pool.map(search, U))
+
+
+def ldi_accepted(history, sample_size, target_interval, tol):
+    """
+    Decide whether a history returned by `evolve_ldi_lyapunov` is accepted.
+
+    Without a crossing, the history only has its final length if it reached the
+    end of the sample.
+    """
+    n = len(history)
+    decided = history[-1] < tol or n == sample_size
+
+    return decided and target_interval[0] <= n <= target_interval[1]
+
+
+def continue_lyapunov(
+    u,
+    parameters,
+    mapping,
+    jacobian,
+    w,
+    exponents,
+    done,
+    sample_size,
+    checkpoint,
+    state,
+    tangent=None,
+    mapping_inplace=None,
+    jacobian_inplace=None,
+    constant_jacobian=False,
+):
+    """
+    Continue the Lyapunov vectors of an accepted candidate from iteration done
+    to the end of the sample, in chunks of CHECKPOINT_STEPS iterations after
+    each of which the checkpoint (if any) is saved with the entries of state
+    and the state of the integration.
+
+    Returns:
+    - Lyapunov exponents.
+    """
+    chunk = CHECKPOINT_STEPS if checkpoint is not None else sample_size
+    with span("lyapunov", iterations=sample_size - done):
+        while done < sample_size:
+            steps = min(chunk, sample_size - done)
+            u, w = evolve_lyapunov(
+                u,
+                parameters,
+                mapping,
+                jacobian,
+                w,
+                exponents,
+                steps,
+                tangent,
+                mapping_inplace,
+                jacobian_inplace,
+                constant_jacobian,
+            )
+            done += steps
+            if checkpoint is not None:
+                checkpoint.save(
+                    dict(
+                        checkpoint.state,
+                        **state,
+                        u=u,
+                        w=w,
+                        exponents=exponents,
+                        done=done,
+                    )
+                )
+
+    return exponents / sample_size
+
+
+def ldi_lyapunov_batch(
+    U,
+    total_time,
+    k,
+    parameters,
+    mapping,
+    jacobian,
+    target_interval,
+    transient_time=0,
+    seed=13,
+    tol=1e-16,
+    lyapunov_seed=13,
+    num_exponents=None,
+    tangent=None,
+    mapping_inplace=None,
+    jacobian_inplace=None,
+    constant_jacobian=False,
+    checkpoint=None,
+    cache=None,
+    transients=None,
+):
+    """
+    Compute the LDI histories of a batch of candidate initial conditions and
+    return the first one, in the order of the rows of U, for which the number
+    of iterations until the LDI drops below tol falls within the target
+    interval, together with its Lyapunov spectrum along the same orbit.
+
+    For each candidate, this performs the computation of running
+    `ds.LDI(..., return_history=True)` for the whole `total_time`, checking the
+    length of the positive part of the history, and then running
+    `ds.lyapunov` from the same initial condition, but the orbit is iterated
+    only once: the transient and the LDI iterations are shared with the
+    Lyapunov vectors, and the LDI stops as soon as the outcome is known (at the
+    threshold crossing, or once the LDI has survived past the upper bound of
+    the interval). The history and the exponents agree with those of
+    pynamicalsys up to round-off (the singular values and the norms are not
+    computed by the same routines), which grows relative to the LDI as it
+    approaches tol, so the crossing can move by a few iterations and the
+    decision can differ for candidates near the edges of the interval. The
+    candidates of a batch are evaluated in parallel, and only the first
+    accepted one continues its Lyapunov vectors to total_time, so the result
+    is the same as evaluating them one at a time.
+
+    Parameters:
+    - U: Candidate initial conditions, one per row.
+    - total_time: Total number of iterations, including the transient.
+    - k: Number of deviation vectors.
+    - parameters: Parameters of the mapping.
+    - mapping, jacobian: Model kernels (see models.py).
+    - target_interval: [lower, upper] bounds of the accepted history length.
+    - transient_time: Number of initial iterations to discard.
+    - seed: Seed of the LDI deviation vectors.
+    - tol: LDI threshold.
+    - lyapunov_seed: Seed of the Lyapunov vectors.
+    - num_exponents: Number of Lyapunov exponents (default: all of them).
+    - tangent: Optional tangent map `tangent(u, parameters, V)` returning
+      J @ V without building the Jacobian (see models.py).
+    - mapping_inplace, jacobian_inplace: Optional in-place variants of the
+      model kernels, writing into preallocated buffers (see models.py).
+    - constant_jacobian: Whether the Jacobian does not depend on the state, so
+      that jacobian_inplace is only evaluated once.
+    - checkpoint: Optional `Checkpoint` (see checkpoint.py). The state of the
+      Lyapunov integration of the accepted candidate is saved in it, and if
+      it holds such a state for the same batch U, the integration resumes
+      from there without searching again.
+    - cache: Optional `CandidateCache` (see candidate_cache.py). Candidates
+      that it proves to be rejected are not integrated, and the outcomes of
+      the integrated candidates are stored in it.
+    - transients: Optional `TransientCache` (see transient_cache.py) of the
+      post-transient states of the candidates.
+
+    Returns:
+    - (index, history, iterations, exponents): Row of the first accepted
+      candidate, its LDI history and Lyapunov exponents (all None if no
+      candidate is accepted), and the number of iterations performed for the
+      whole batch (including the transients).
+    """
+    U = np.atleast_2d(np.array(U, dtype=np.float64))
+    parameters = np.array(parameters, dtype=np.float64)
+    neq = U.shape[1]
+    if num_exponents is None:
+        num_exponents = neq
+    v = initial_deviation_vectors(neq, k, seed)
+    w = initial_deviation_vectors(neq, num_exponents, lyapunov_seed)
+
+    sample_size = total_time - transient_time
+    max_time = min(target_interval[1], sample_size)
+
+    def search(u):
+        exponents = np.zeros(num_exponents)
+        with span("transient", iterations=transient_time):
+            u = post_transient(
+                u, parameters, transient_time, mapping, mapping_inplace, transients
+            )
+        with span("ldi", k=k) as fields:
+            history, u, w_final = evolve_ldi_lyapunov(
+                u,
+                parameters,
+                mapping,
+                jacobian,
+                v.copy(),
+                w.copy(),
+                exponents,
+                max_time,
+                tol,
+                tangent,
+                mapping_inplace,
+                jacobian_inplace,
+                constant_jacobian,
+            )
+            fields["iterations"] = len(history)
+        return history, u, w_final, exponents
+
+    state = checkpoint.state if checkpoint is not None else {}
+    if "U" in state and np.array_equal(state["U"], U):
+        # Resume the Lyapunov integration of the accepted candidate
+        index = int(state["index"])
+        history = state["history"]
+        iterations = int(state["batch_iterations"])
+        u, w_final, exponents = state["u"], state["w"], state["exponents"]
+        done = int(state["done"])
+    else:
+        rows = list(range(len(U)))
+        if cache is not None:
+            keys = [
+                candidate_key(
+                    mapping,
+                    jacobian,
+                    tangent,
+                    mapping_inplace,
+                    jacobian_inplace,
+                    parameters,
+                    u,
+                    k,
+                    seed,
+                    tol,
+                    total_time,
+                    transient_time,
+                )
+                for u in U
+            ]
+            entries = cache.get(keys)
+            rows = [
+                i
+                for i in rows
+                if cached_decision(entries.get(keys[i]), target_interval) is not False
+            ]
+
+        results = dict(zip(rows, map_candidates(search, U[rows]))) if rows else {}
+        iterations = sum(
+            transient_time + len(history) for history, *_ in results.values()
+        )
+        if cache is not None:
+            cache.put(
+                (
+                    keys[i],
+                    len(history),
+                    history[-1],
+                    history[-1] < tol,
+                    len(history) == sample_size,
+                )
+                for i, (history, *_) in results.items()
+            )
+
+        for index, (history, u, w_final, exponents) in results.items():
+            if ldi_accepted(history, sample_size, target_interval, tol):
+                break
+        else:
+            return None, None, iterations, None
+        done = len(history)
+
+    exponents = continue_lyapunov(
+        u,
+        parameters,
+        mapping,
+        jacobian,
+        w_final,
+        exponents,
+        done,
+        sample_size,
+        checkpoint,
+        dict(U=U, index=index, history=history, batch_iterations=iterations),
+        tangent,
+        mapping_inplace,
+        jacobian_inplace,
+        constant_jacobian,
+    )
+
+    return index, history, iterations, exponents
+
+
+@njit(nogil=True)
+def evolve_multi_ldi_lyapunov(
+    u,
+    parameters,
+    mapping,
+    jacobian,
+    v,
+    w,
+    exponents,
+    ks,
+    max_times,
+    tol,
+    tangent=None,
+):
+    """
+    Evolve the orbit together with max(ks) LDI deviation vectors v and the
+    Lyapunov vectors w, recording at every iteration the LDI of the first k
+    vectors for every k in ks (see `nested_ldi`).
+
+    The LDI of ks[j] stops being recorded at the first iteration where it
+    drops below tol, or after max_times[j] iterations (ks with max_times[j] = 0
+    are not recorded at all). The orbit is evolved until every k stops.
+
+    Returns:
+    - (history, lengths, u, w): (iterations, len(ks)) array with the LDI of
+      each k in its columns, number of iterations recorded for each k, and the
+      final state and Lyapunov vectors.
+    """
+    k = v.shape[1]
+    m = w.shape[1]
+    num_ks = len(ks)
+    history = np.zeros((max_times.max(), num_ks))
+    lengths = np.zeros(num_ks, dtype=np.int64)
+    active = max_times > 0
+    ldi = np.empty(num_ks)
+
+    n = 0
+    while active.any():
+        u = mapping(u, parameters)
+
+        # Update deviation vectors
+        if tangent is None:
+            J = np.ascontiguousarray(jacobian(u, parameters, mapping))
+            for i in range(k):
+                v[:, i] = J @ np.ascontiguousarray(v[:, i])
+            for i in range(m):
+                w[:, i] = J @ np.ascontiguousarray(w[:, i])
+        else:
+            v = tangent(u, parameters, v)
+            w = tangent(u, parameters, w)
+        for i in range(k):
+            v[:, i] = v[:, i] / np.linalg.norm(v[:, i])
+
+        nested_ldi(v, ks, ldi)
+
+        w, R = qr(w)
+        exponents += np.log(np.abs(np.diag(R)))
+
+        for j in range(num_ks):
+            if active[j]:
+                history[n, j] = ldi[j]
+                lengths[j] = n + 1
+                if ldi[j] < tol or n + 1 >= max_times[j]:
+                    active[j] = False
+        n += 1
+
+    return history[:n], lengths, u, w
+
+
+def multi_ldi_lyapunov_batch(
+    U,
+    total_time,
+    ks,
+    parameters,
+    mapping,
+    jacobian,
+    target_intervals,
+    pending=None,
+    transient_time=0,
+    seed=13,
+    tol=1e-16,
+    lyapunov_seed=13,
+    num_exponents=None,
+    tangent=None,
+    checkpoint=None,
+    transients=None,
+):
+    """
+    Multi-k counterpart of `ldi_lyapunov_batch`: evolve max(ks) deviation
+    vectors once per candidate and decide its acceptance for every pending k
+    from the LDI of the first k of them, so a single integration serves all the
+    rejection searches of an initial condition.
+
+    The vectors of every k are the leading columns of the max(ks) vectors
+    drawn from seed, so the histories differ from those of separate
+    `ldi_lyapunov_batch` runs (which draw k vectors each) but have the same
+    statistics. The integration of a candidate stops once every pending k is
+    decided, and the first candidate accepted for at least one of them
+    continues its Lyapunov vectors to total_time.
+
+    Parameters:
+    - U: Candidate initial conditions, one per row.
+    - total_time: Total number of iterations, including the transient.
+    - ks: Numbers of deviation vectors, in increasing order.
+    - parameters: Parameters of the mapping.
+    - mapping, jacobian: Model kernels (see models.py).
+    - target_intervals: [lower, upper] bounds of the accepted history length
+      of each k.
+    - pending: Indices j of the ks still searched for (default: all of them).
+    - transient_time, seed, tol, lyapunov_seed, num_exponents, tangent,
+      checkpoint, transients: As in `ldi_lyapunov_batch`.
+
+    Returns:
+    - (index, histories, iterations, exponents): Row of the first accepted
+      candidate, a dictionary mapping the index j of each k it is accepted for
+      to its LDI history, its Lyapunov exponents (all None if no candidate is
+      accepted), and the number of iterations performed for the whole batch.
+    """
+    U = np.atleast_2d(np.array(U, dtype=np.float64))
+    parameters = np.array(parameters, dtype=np.float64)
+    neq = U.shape[1]
+    if num_exponents is None:
+        num_exponents = neq
+    if pending is None:
+        pending = range(len(ks))
+    v = initial_deviation_vectors(neq, ks[-1], seed)
+    w = initial_deviation_vectors(neq, num_exponents, lyapunov_seed)
+
+    sample_size = total_time - transient_time
+    max_times = np.zeros(len(ks), dtype=np.int64)
+    for j in pending:
+        max_times[j] = min(target_intervals[j][1], sample_size)
+
+    def search(u):
+        exponents = np.zeros(num_exponents)
+        with span("transient", iterations=transient_time):
+            u = post_transient(u, parameters, transient_time, mapping, cache=transients)
+        with span("ldi", k=ks[-1]) as fields:
+            history, lengths, u, w_final = evolve_multi_ldi_lyapunov(
+                u,
+                parameters,
+                mapping,
+                jacobian,
+                v.copy(),
+                w.copy(),
+                exponents,
+                np.array(ks, dtype=np.int64),
+                max_times,
+                tol,
+                tangent,
+            )
+            fields["iterations"] = len(history)
+        return history, lengths, u, w_final, exponents
+
+    state = checkpoint.state if checkpoint is not None else {}
+    if "U" in state and np.array_equal(state["U"], U):
+        # Resume the Lyapunov integration of the accepted candidate
+        index = int(state["index"])
+        histories = {int(j): state[f"history_{j}"] for j in state["accepted"]}
+        iterations = int(state["batch_iterations"])
+        u, w_final, exponents = state["u"], state["w"], state["exponents"]
+        done = int(state["done"])
+    else:
+        results = map_candidates(search, U)
+        iterations = sum(transient_time + len(history) for history, *_ in results)
+
+        for index, (history, lengths, u, w_final, exponents) in enumerate(results):
+            histories = {}
+            for j in pending:
+                history_j = history[: lengths[j], j]
+                if ldi_accepted(history_j, sample_size, target_intervals[j], tol):
+                    histories[j] = history_j
+            if histories:
+                break
+        else:
+            return None, None, iterations, None
+        done = len(history)
+
+    state = dict(
+        U=U,
+        index=index,
+        accepted=list(histories),
+        batch_iterations=iterations,
+        **{f"history_{j}": history for j, history in histories.items()},
+    )
+    exponents = continue_lyapunov(
+        u,
+        parameters,
+        mapping,
+        jacobian,
+        w_final,
+        exponents,
+        done,
+        sample_size,
+        checkpoint,
+        state,
+        tangent,
+    )
+
+    return index, histories, iterations, exponents
+
+
+@njit(nogil=True)
+def alignment_index_time(
+    u, parameters, mapping, jacobian, v, sample_size, transient_time, tol, sali
+):
+    """
+    Iterate a single orbit and its deviation vectors v (unit vectors, updated
+    in place) until their alignment index drops below tol, as `ds.SALI` (and
+    `ds.GALI`) do with early termination.
+
+    Parameters:
+    - u: Initial condition.
+    - parameters: Parameters of the mapping.
+    - mapping, jacobian: Model kernels (see models.py).
+    - v: (neq, k) deviation vectors.
+    - sample_size: Largest number of iterations after the transient.
+    - transient_time: Number of initial iterations to discard.
+    - tol: Threshold of the index.
+    - sali: Whether the index is the SALI of the two vectors (otherwise the
+      GALI of the k vectors, i.e. their LDI).
+
+    Returns:
+    - (n, value): Number of iterations until the index dropped below tol
+      (sample_size if it did not), and its value then.
+    """
+    neq, k = v.shape
+    x = np.empty(neq)
+    for _ in range(transient_time):
+        u = mapping(u, parameters)
+
+    value = 1.0
+    for n in range(1, sample_size + 1):
+        u = mapping(u, parameters)
+        J = np.ascontiguousarray(jacobian(u, parameters, mapping))
+        apply_jacobian(J, v, x)
+        for i in range(k):
+            v[:, i] /= np.linalg.norm(v[:, i])
+
+        if sali:
+            value = min(
+                np.linalg.norm(v[:, 0] + v[:, 1]), np.linalg.norm(v[:, 0] - v[:, 1])
+            )
+        else:
+            R = np.linalg.qr(v)[1]
+            value = 1.0
+            for i in range(k):
+                value *= abs(R[i, i])
+        if value < tol:
+            return n, value
+
+    return sample_size, value
+
+
+@njit(nogil=True, parallel=True)
+def alignment_index_tiles(
+    base,
+    axes,
+    x,
+    y,
+    parameters,
+    mapping,
+    jacobian,
+    v,
+    sample_size,
+    transient_time,
+    tol,
+    sali,
+    tile,
+    times,
+    values,
+):
+    """
+    Evaluate `alignment_index_time` at every point of a grid, writing into
+    times and values, with the square tiles of the grid distributed over the
+    threads (neighbouring points, and the orbits starting there, take similar
+    numbers of iterations).
+    """
+    rows = (len(y) + tile - 1) // tile
+    columns = (len(x) + tile - 1) // tile
+    for t in prange(rows * columns):
+        i0 = (t // columns) * tile
+        j0 = (t % columns) * tile
+        for i in range(i0, min(i0 + tile, len(y))):
+            for j in range(j0, min(j0 + tile, len(x))):
+                u = base.copy()
+                u[axes[0]] = x[j]
+                u[axes[1]] = y[i]
+                times[i, j], values[i, j] = alignment_index_time(
+                    u,
+                    parameters,
+                    mapping,
+                    jacobian,
+                    v.copy(),
+                    sample_size,
+                    transient_time,
+                    tol,
+                    sali,
+                )
+
+
+def alignment_index_grid(
+    x,
+    y,
+    total_time,
+    parameters,
+    mapping,
+    jacobian,
+    index="sali",
+    k=2,
+    base=None,
+    axes=(0, 1),
+    transient_time=0,
+    seed=13,
+    tol=1e-16,
+    tile=32,
+):
+    """
+    Compute the SALI (or GALI_k) of the orbits starting at every point of a
+    grid of initial conditions in a single compiled, multi-threaded pass. Each
+    orbit stops as soon as its index drops below tol.
+
+    For each point, this gives the length of `ds.SALI(u, total_time,
+    parameters=parameters, transient_time=transient_time, seed=seed,
+    return_history=True, tol=tol)` (the time series the system scripts store)
+    and its last value, without one call per point. For maps whose Jacobian
+    depends on the state, the two only agree up to round-off, so with tol at
+    the round-off floor of the index (~1e-16) the lengths can differ.
+
+    Parameters:
+    - x, y: Coordinates of the grid along the two axes.
+    - total_time: Total number of iterations, including the transient.
+    - parameters: Parameters of the mapping.
+    - mapping, jacobian: Model kernels (see models.py).
+    - index: "sali" or "gali".
+    - k: Number of deviation vectors of the GALI (2 for the SALI).
+    - base: State whose components along axes are replaced by the grid
+      coordinates (default: zeros of dimension 2), e.g. for slices of
+      higher-dimensional maps.
+    - axes: Components of the state varied along x and y.
+    - transient_time: Number of initial iterations to discard.
+    - seed: Seed of the deviation vectors, shared by all the points.
+    - tol: Threshold of the index (e.g. SALI_threshold in parameters.py).
+    - tile: Side of the square tiles of points handed to each thread.
+
+    Returns:
+    - (times, values): (len(y), len(x)) arrays of the number of iterations
+      until the index dropped below tol (total_time - transient_time if it did
+      not) and of its last value.
+    """
+    if index not in ("sali", "gali"):
+        raise ValueError(f"unknown alignment index {index!r}")
+    if index == "sali":
+        k = 2
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    base = np.zeros(2) if base is None else np.array(base, dtype=np.float64)
+    if parameters is None:
+        parameters = np.zeros(1)
+    parameters = np.atleast_1d(np.array(parameters, dtype=np.float64))
+    v = initial_deviation_vectors(len(base), k, seed)
+
+    times = np.empty((len(y), len(x)), dtype=np.int64)
+    values = np.empty((len(y), len(x)))
+    alignment_index_tiles(
+        base,
+        np.array(axes, dtype=np.int64),
+        x,
+        y,
+        parameters,
+        mapping,
+        jacobian,
+        v,
+        total_time - transient_time,
+        transient_time,
+        tol,
+        index == "sali",
+        tile,
+        times,
+        values,
+    )
+
+    return times, values
+
+
+def flow_deviation_vectors(neq, k, seed):
+    """
+    Draw k orthonormal deviation vectors exactly as the pynamicalsys routines
+    for continuous-time systems do.
+
+    Parameters:
+    - neq: Dimension of the system.
+    - k: Number of deviation vectors.
+    - seed: Seed of the random number generator.
+
+    Returns:
+    - (neq, k) array with orthonormal columns.
+    """
+    np.random.seed(seed)
+    v = -1 + 2 * np.random.rand(neq * k)
+    v, _ = qr(v.reshape(neq, k))
+
+    return v
+
+
+@njit(nogil=True)
+def variational_rk4_step(time, u, V, parameters, equations_of_motion, jacobian, h):
+    """
+    Advance the state u and the deviation vectors V (one per column) by one
+    RK4 step of size h. All the columns of V share the Jacobian of each stage.
+
+    Returns:
+    - (u, V) after the step.
+    """
+    k1u = equations_of_motion(time, u, parameters)
+    k1v = jacobian(time, u, parameters) @ V
+
+    u2 = u + 0.5 * h * k1u
+    V2 = V + 0.5 * h * k1v
+    k2u = equations_of_motion(time + 0.5 * h, u2, parameters)
+    k2v = jacobian(time + 0.5 * h, u2, parameters) @ V2
+
+    u3 = u + 0.5 * h * k2u
+    V3 = V + 0.5 * h * k2v
+    k3u = equations_of_motion(time + 0.5 * h, u3, parameters)
+    k3v = jacobian(time + 0.5 * h, u3, parameters) @ V3
+
+    u4 = u + h * k3u
+    V4 = V + h * k3v
+    k4u = equations_of_motion(time + h, u4, parameters)
+    k4v = jacobian(time + h, u4, parameters) @ V4
+
+    u_next = u + (h / 6.0) * (k1u + 2 * k2u + 2 * k3u + k4u)
+    V_next = V + (h / 6.0) * (k1v + 2 * k2v + 2 * k3v + k4v)
+
+    return u_next, V_next
+
+
+@njit(nogil=True)
+def tangent_rk4_step(
+    time, u, V, parameters, equations_of_motion, variational, h, K, Vs
+):
+    """
+    Same as `variational_rk4_step`, but the deviation vectors are advanced in
+    place by a variational kernel `variational(time, u, V, parameters, dV)`
+    that writes J @ V into dV (see models.py), using the preallocated stage
+    buffers K, of shape (4,) + V.shape, and Vs, of the shape of V.
+
+    Returns:
+    - u after the step (V is updated in place).
+    """
+    neq, m = V.shape
+
+    k1u = equations_of_motion(time, u, parameters)
+    variational(time, u, V, parameters, K[0])
+
+    u2 = u + 0.5 * h * k1u
+    for i in range(neq):
+        for l in range(m):
+            Vs[i, l] = V[i, l] + 0.5 * h * K[0, i, l]
+    k2u = equations_of_motion(time + 0.5 * h, u2, parameters)
+    variational(time + 0.5 * h, u2, Vs, parameters, K[1])
+
+    u3 = u + 0.5 * h * k2u
+    for i in range(neq):
+        for l in range(m):
+            Vs[i, l] = V[i, l] + 0.5 * h * K[1, i, l]
+    k3u = equations_of_motion(time + 0.5 * h, u3, parameters)
+    variational(time + 0.5 * h, u3, Vs, parameters, K[2])
+
+    u4 = u + h * k3u
+    for i in range(neq):
+        for l in range(m):
+            Vs[i, l] = V[i, l] + h * K[2, i, l]
+    k4u = equations_of_motion(time + h, u4, parameters)
+    variational(time + h, u4, Vs, parameters, K[3])
+
+    u_next = u + (h / 6.0) * (k1u + 2 * k2u + 2 * k3u + k4u)
+    for i in range(neq):
+        for l in range(m):
+            V[i, l] = V[i, l] + (h / 6.0) * (
+                K[0, i, l] + 2 * K[1, i, l] + 2 * K[2, i, l] + K[3, i, l]
+            )
+
+    return u_next
+
+
+@njit(nogil=True)
+def symplectic_step(u, V, parameters, drift, kick, h, coefficients):
+    """
+    Advance the state u and the deviation vectors V in place by one step of
+    size h of a separable Hamiltonian system, composing leapfrog (drift, kick,
+    drift) sub-steps of sizes coefficients * h (see SYMPLECTIC_SCHEMES). The
+    drift `drift(u, V, h)` advances the positions and the kick `kick(u, V,
+    parameters, h)` the momenta, both with their deviations (see models.py).
+
+    Returns:
+    - u after the step (V is updated in place).
+    """
+    for c in coefficients:
+        drift(u, V, 0.5 * c * h)
+        kick(u, V, parameters, c * h)
+        drift(u, V, 0.5 * c * h)
+
+    return u
+
+
+@njit(nogil=True)
+def tangent_rk45_step(
+    time,
+    u,
+    V,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    h,
+    atol,
+    rtol,
+    K,
+    Vs,
+    variational=None,
+):
+    """
+    Advance the state u and the deviation vectors V by one adaptive
+    Dormand-Prince 5(4) step, with the error control of the pynamicalsys
+    "rk45" integrator (maximum over the state and the deviation vectors of
+    the error relative to atol + rtol * |value|). Rejected steps are retried
+    with a smaller step until one is accepted.
+
+    K, of shape (7,) + V.shape, and Vs, of the shape of V, are preallocated
+    stage buffers. If a variational kernel is given, it is used instead of
+    the Jacobian (see `tangent_rk4_step`).
+
+    Returns:
+    - (u, h, h_next): State after the step (V is updated in place), size of
+      the accepted step and size proposed for the next one.
+    """
+    neq, m = V.shape
+    ku = np.empty((7, neq))
+    while True:
+        for s in range(7):
+            us = u.copy()
+            Vs[:, :] = V
+            for r in range(s):
+                us += h * RK45_A[s, r] * ku[r]
+                Vs += h * RK45_A[s, r] * K[r]
+            ts = time + RK45_C[s] * h
+            ku[s] = equations_of_motion(ts, us, parameters)
+            if variational is None:
+                K[s] = jacobian(ts, us, parameters) @ Vs
+            else:
+                variational(ts, us, Vs, parameters, K[s])
+
+        # Fifth-order solution and error of the embedded fourth-order one
+        u5 = u.copy()
+        eu = np.zeros(neq)
+        V5 = V.copy()
+        eV = np.zeros((neq, m))
+        for s in range(7):
+            u5 += h * RK45_B5[s] * ku[s]
+            eu += h * (RK45_B5[s] - RK45_B4[s]) * ku[s]
+            V5 += h * RK45_B5[s] * K[s]
+            eV += h * (RK45_B5[s] - RK45_B4[s]) * K[s]
+        err = max(
+            np.max(np.abs(eu) / (atol + rtol * np.maximum(np.abs(u), np.abs(u5)))),
+            np.max(np.abs(eV) / (atol + rtol * np.maximum(np.abs(V), np.abs(V5)))),
+        )
+
+        factor = 2.0 if err == 0 else min(max(0.9 * err**-0.25, 0.1), 2.0)
+        if err < 1.0:
+            V[:, :] = V5
+            return u5, h, h * factor
+        h = h * factor
+
+
+def integrator_arguments(integrator="rk4", splitting=None, atol=1e-6, rtol=1e-3):
+    """
+    Translate the name of an integrator into the optional arguments
+    (drift, kick, coefficients, tolerances) of the flow evolution routines,
+    which select a symplectic composition if drift and kick are given, an
+    adaptive Dormand-Prince step if the (atol, rtol) tolerances are given, and
+    the fixed-step RK4 otherwise.
+
+    Parameters:
+    - integrator: "rk4" (fixed step), "rk45" (adaptive Dormand-Prince) or the
+      name of a symplectic scheme in SYMPLECTIC_SCHEMES (fixed step).
+    - splitting: (drift, kick) kernels of the Hamiltonian, required by the
+      symplectic schemes (see models.py).
+    - atol, rtol: Absolute and relative tolerances of "rk45".
+
+    Returns:
+    - Tuple of the four arguments.
+    """
+    if integrator == "rk4":
+        return None, None, None, None
+    if integrator == "rk45":
+        return None, None, None, np.array([atol, rtol])
+    if integrator in SYMPLECTIC_SCHEMES:
+        if splitting is None:
+            raise ValueError(f"{integrator} requires the drift and kick kernels")
+        drift, kick = splitting
+        return drift, kick, np.array(SYMPLECTIC_SCHEMES[integrator]), None
+
+    raise ValueError(f"Unknown integrator: {integrator}")
+
+
+@njit(nogil=True)
+def grow_rows(a):
+    """
+    Return a copy of the 2D array a with twice as many rows, the new ones
+    zero.
+    """
+    b = np.zeros((2 * a.shape[0] + 1, a.shape[1]))
+    b[: a.shape[0]] = a
+
+    return b
+
+
+@njit(nogil=True)
+def evolve_flow_ldi_lyapunov(
+    u,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    v,
+    w,
+    exponents,
+    time,
+    time_step,
+    total_time,
+    max_time,
+    threshold,
+    variational=None,
+    drift=None,
+    kick=None,
+    coefficients=None,
+    tolerances=None,
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Integrate the flow together with the LDI deviation vectors v and the
+    Lyapunov vectors w until the LDI drops to the threshold, the time exceeds
+    max_time or the time reaches total_time, whichever happens first.
+
+    Both sets of vectors are integrated as a single block of variational
+    equations, so each RK4 stage evaluates the Jacobian once for all of them.
+    If a variational kernel is given, it is used instead of the Jacobian (see
+    `tangent_rk4_step`). The optional drift, kick, coefficients and tolerances
+    select another integrator (see `integrator_arguments`).
+
+    If a Hamiltonian kernel `hamiltonian(u, parameters)` is given, the energy
+    of the initial state (unless energy already holds samples) and of every
+    step is added to the statistics array energy (see energy.py).
+
+    Returns:
+    - (history, u, w, time, time_step): (time, LDI) at each of the steps
+      performed, and the final state, Lyapunov vectors, time and time step.
+    """
+    k = v.shape[1]
+    V = np.hstack((v, w))
+    K = np.empty((7, V.shape[0], V.shape[1]))
+    Vs = np.empty_like(V)
+    history = np.zeros((int(min(max_time, total_time) / time_step) + 3, 2))
+
+    if hamiltonian is not None:
+        if energy[0] == 0:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+
+    n = 0
+    while time < total_time:
+        if time + time_step > total_time:
+            time_step = total_time - time
+
+        if drift is not None:
+            u = symplectic_step(u, V, parameters, drift, kick, time_step, coefficients)
+            h = time_step
+        elif tolerances is not None:
+            u, h, time_step = tangent_rk45_step(
+                time,
+                u,
+                V,
+                parameters,
+                equations_of_motion,
+                jacobian,
+                time_step,
+                tolerances[0],
+                tolerances[1],
+                K,
+                Vs,
+                variational,
+            )
+        elif variational is None:
+            u, V = variational_rk4_step(
+                time, u, V, parameters, equations_of_motion, jacobian, time_step
+            )
+            h = time_step
+        else:
+            u = tangent_rk4_step(
+                time,
+                u,
+                V,
+                parameters,
+                equations_of_motion,
+                variational,
+                time_step,
+                K,
+                Vs,
+            )
+            h = time_step
+        time = time + h
+        if hamiltonian is not None:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+
+        # Normalize the LDI deviation vectors
+        for i in range(k):
+            V[:, i] = V[:, i] / np.linalg.norm(V[:, i])
+
+        # LDI is the product of all singular values
+        _, S, _ = np.linalg.svd(np.ascontiguousarray(V[:, :k]), full_matrices=False)
+        ldi = np.exp(np.sum(np.log(S)))
+
+        # Re-orthonormalize the Lyapunov vectors
+        Q, R = qr(np.ascontiguousarray(V[:, k:]))
+        exponents += np.log(np.abs(np.diag(R)))
+        V[:, k:] = Q
+
+        if n == history.shape[0]:
+            # Adaptive steps shorter than time_step
+            history = grow_rows(history)
+        history[n, 0] = time
+        history[n, 1] = ldi
+        n += 1
+
+        if ldi <= threshold or time > max_time:
+            break
+
+    return history[:n], u, np.ascontiguousarray(V[:, k:]), time, time_step
+
+
+@njit(nogil=True)
+def evolve_flow_lyapunov(
+    u,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    w,
+    exponents,
+    time,
+    time_step,
+    total_time,
+    variational=None,
+    max_steps=-1,
+    drift=None,
+    kick=None,
+    coefficients=None,
+    tolerances=None,
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Integrate the flow and the Lyapunov vectors w until total_time (or for at
+    most max_steps time steps, if max_steps is not negative), accumulating the
+    log of the diagonal of R in exponents. The optional drift, kick,
+    coefficients and tolerances select the integrator (see
+    `integrator_arguments`).
+
+    If a Hamiltonian kernel `hamiltonian(u, parameters)` is given, the energy
+    of the initial state (unless energy already holds samples) and of every
+    step is added to the statistics array energy (see energy.py).
+
+    Returns:
+    - (u, w, time, time_step): Final state, Lyapunov vectors, time and time
+      step (shortened if the last step ended exactly at total_time).
+    """
+    K = np.empty((7, w.shape[0], w.shape[1]))
+    Ws = np.empty_like(w)
+    if hamiltonian is not None:
+        if energy[0] == 0:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+
+    n = 0
+    while time < total_time and n != max_steps:
+        if time + time_step > total_time:
+            time_step = total_time - time
+
+        if drift is not None:
+            u = symplectic_step(u, w, parameters, drift, kick, time_step, coefficients)
+            h = time_step
+        elif tolerances is not None:
+            u, h, time_step = tangent_rk45_step(
+                time,
+                u,
+                w,
+                parameters,
+                equations_of_motion,
+                jacobian,
+                time_step,
+                tolerances[0],
+                tolerances[1],
+                K,
+                Ws,
+                variational,
+            )
+        elif variational is None:
+            u, w = variational_rk4_step(
+                time, u, w, parameters, equations_of_motion, jacobian, time_step
+            )
+            h = time_step
+        else:
+            u = tangent_rk4_step(
+                time,
+                u,
+                w,
+                parameters,
+                equations_of_motion,
+                variational,
+                time_step,
+                K,
+                Ws,
+            )
+            h = time_step
+        time = time + h
+        if hamiltonian is not None:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+        n += 1
+
+        w, R = qr(w)
+        exponents += np.log(np.abs(np.diag(R)))
+
+    return u, w, time, time_step
+
+
+@njit(nogil=True)
+def flow_alignment_spectrum(
+    u,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    v,
+    time,
+    time_step,
+    total_time,
+    out,
+    stride=1,
+    variational=None,
+):
+    """
+    Integrate the flow and the deviation vectors v until total_time,
+    normalizing each vector after every time step, and record the time and
+    the singular values of v every stride time steps.
+
+    Parameters:
+    - u: Initial condition.
+    - parameters: Parameters of the equations of motion.
+    - equations_of_motion, jacobian: Model kernels (see models.py).
+    - v: (neq, k) deviation vectors, updated in place.
+    - time, time_step, total_time: Initial time, RK4 time step and final time.
+    - out: Preallocated (rows, k + 1) array; each row receives the time and
+      the singular values, in decreasing order, until it is full.
+    - stride: Sub-sampling stride, in time steps.
+    - variational: Optional variational kernel (see `tangent_rk4_step`).
+
+    Returns:
+    - (u, time, rows): Final state and time, and number of rows written.
+    """
+    k = v.shape[1]
+    K = np.empty((4, v.shape[0], k))
+    Vs = np.empty_like(v)
+    n = 0
+    row = 0
+    while time < total_time and row < out.shape[0]:
+        if time + time_step > total_time:
+            time_step = total_time - time
+
+        if variational is None:
+            u, v_next = variational_rk4_step(
+                time, u, v, parameters, equations_of_motion, jacobian, time_step
+            )
+            v[:, :] = v_next
+        else:
+            u = tangent_rk4_step(
+                time,
+                u,
+                v,
+                parameters,
+                equations_of_motion,
+                variational,
+                time_step,
+                K,
+                Vs,
+            )
+        time = time + time_step
+        for i in range(k):
+            v[:, i] = v[:, i] / np.linalg.norm(v[:, i])
+
+        n += 1
+        if n % stride == 0:
+            _, S, _ = np.linalg.svd(v, full_matrices=False)
+            out[row, 0] = time
+            out[row, 1:] = S
+            row += 1
+
+    return u, time, row
+
+
+def continue_flow_lyapunov(
+    u,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    w,
+    exponents,
+    time,
+    time_step,
+    total_time,
+    checkpoint,
+    state,
+    variational=None,
+    stepping=(),
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Continuous-time counterpart of `continue_lyapunov`: integrate the Lyapunov
+    vectors of an accepted candidate from time to total_time, with the
+    integrator selected by stepping (see `integrator_arguments`), adding the
+    energy of every step to energy if a Hamiltonian kernel is given.
+
+    Returns:
+    - Lyapunov exponents.
+    """
+    chunk = CHECKPOINT_STEPS if checkpoint is not None else -1
+    with span("lyapunov", time=total_time - time):
+        while time < total_time:
+            u, w, time, time_step = evolve_flow_lyapunov(
+                u,
+                parameters,
+                equations_of_motion,
+                jacobian,
+                w,
+                exponents,
+                time,
+                time_step,
+                total_time,
+                variational,
+                chunk,
+                *stepping,
+                hamiltonian=hamiltonian,
+                energy=energy,
+            )
+            if checkpoint is not None:
+                extra = {} if energy is None else {"energy": energy}
+                checkpoint.save(
+                    dict(
+                        checkpoint.state,
+                        **state,
+                        **extra,
+                        u=u,
+                        w=w,
+                        exponents=exponents,
+                        time=time,
+                        time_step=time_step,
+                    )
+                )
+
+    return exponents / time
+
+
+def flow_ldi_lyapunov_batch(
+    U,
+    total_time,
+    k,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    target_interval,
+    time_step,
+    seed=13,
+    threshold=1e-16,
+    lyapunov_seed=13,
+    endpoint=True,
+    num_exponents=None,
+    variational=None,
+    checkpoint=None,
+    cache=None,
+    integrator="rk4",
+    splitting=None,
+    atol=1e-6,
+    rtol=1e-3,
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Continuous-time counterpart of `ldi_lyapunov_batch` for flows integrated
+    with a fixed-step RK4 (or another integrator, see below).
+
+    A candidate is accepted if the time at which its LDI drops to the threshold
+    falls within the target interval. For each candidate, this reproduces
+    `ds.LDI(..., return_history=True)` followed by `ds.lyapunov` for an
+    integrator set up with `ds.integrator("rk4", time_step=time_step)` up to
+    round-off (as with `ldi_lyapunov_batch`, decisions near the edges of the
+    interval can differ), but the flow is integrated only once and the LDI
+    stops as soon as the time exceeds the upper bound of the interval. With
+    integrator="rk45", the steps are adaptive, as with
+    `ds.integrator("rk45", atol=atol, rtol=rtol)`, and time_step is the
+    initial step. The symplectic integrators of
+    SYMPLECTIC_SCHEMES take fixed steps of the drift and kick kernels given
+    in splitting, which then replace the equations of motion and the
+    variational kernel.
+
+    If a Hamiltonian kernel `hamiltonian(u, parameters)` is given (e.g.
+    `fermi_pasta_ulam_hamiltonian` in models.py), the energy conservation of
+    the accepted candidate is monitored at every step of its integration, and
+    its statistics are written into energy (see energy.py).
+
+    Parameters:
+    - U: Candidate initial conditions, one per row.
+    - total_time: Total integration time.
+    - k: Number of deviation vectors.
+    - parameters: Parameters of the equations of motion.
+    - equations_of_motion, jacobian: Model kernels (see models.py).
+    - target_interval: [lower, upper] bounds of the accepted threshold time.
+    - time_step: Time step (initial step of "rk45").
+    - seed: Seed of the LDI deviation vectors.
+    - threshold: LDI threshold.
+    - lyapunov_seed: Seed of the Lyapunov vectors.
+    - endpoint: Whether to include the endpoint time = total_time.
+    - num_exponents: Number of Lyapunov exponents (default: all of them).
+    - variational: Optional kernel `variational(time, u, V, parameters, dV)`
+      writing J @ V into dV without building the Jacobian (see models.py).
+    - checkpoint: Optional `Checkpoint` used as in `ldi_lyapunov_batch`.
+    - cache: Optional `CandidateCache` used as in `ldi_lyapunov_batch`.
+    - integrator, splitting, atol, rtol: Integrator and its options (see
+      `integrator_arguments`).
+    - hamiltonian: Optional Hamiltonian kernel.
+    - energy: Statistics array (see `energy.energy_stats`) receiving the
+      energy statistics of the accepted candidate, if a Hamiltonian is given.
+
+    Returns:
+    - (index, history, time, exponents): Row of the first accepted candidate,
+      its (time, LDI) history and Lyapunov exponents (all None if no candidate
+      is accepted), and the integration time spent on the whole batch by the
+      search.
+    """
+    U = np.atleast_2d(np.array(U, dtype=np.float64))
+    parameters = np.array(parameters, dtype=np.float64)
+    neq = U.shape[1]
+    if num_exponents is None:
+        num_exponents = neq
+    v = flow_deviation_vectors(neq, k, seed)
+    w = flow_deviation_vectors(neq, num_exponents, lyapunov_seed)
+
+    total_time = float(total_time)
+    if endpoint:
+        total_time += time_step
+    stepping = integrator_arguments(integrator, splitting, atol, rtol)
+
+    def search(u):
+        exponents = np.zeros(num_exponents)
+        stats = energy_stats() if hamiltonian is not None else None
+        with span("ldi", k=k) as fields:
+            history, u, w_final, time, h = evolve_flow_ldi_lyapunov(
+                u.copy(),
+                parameters,
+                equations_of_motion,
+                jacobian,
+                v.copy(),
+                w.copy(),
+                exponents,
+                0.0,
+                time_step,
+                total_time,
+                float(target_interval[1]),
+                threshold,
+                variational,
+                *stepping,
+                hamiltonian=hamiltonian,
+                energy=stats,
+            )
+            fields["time"] = time
+        return history, u, w_final, exponents, time, h, stats
+
+    state = checkpoint.state if checkpoint is not None else {}
+    if "U" in state and np.array_equal(state["U"], U):
+        # Resume the Lyapunov integration of the accepted candidate
+        index = int(state["index"])
+        history = state["history"]
+        search_time = float(state["search_time"])
+        u, w_final, exponents = state["u"], state["w"], state["exponents"]
+        time, h = float(state["time"]), float(state["time_step"])
+        stats = None
+        if hamiltonian is not None:
+            stats = state.get("energy", energy_stats())
+    else:
+        rows = list(range(len(U)))
+        if cache is not None:
+            keys = [
+                candidate_key(
+                    equations_of_motion,
+                    jacobian,
+                    variational,
+                    parameters,
+                    u,
+                    k,
+                    seed,
+                    threshold,
+                    total_time,
+                    time_step,
+                    *(() if integrator == "rk4" else (integrator, atol, rtol)),
+                )
+                for u in U
+            ]
+            entries = cache.get(keys)
+            rows = [
+                i
+                for i in rows
+                if cached_decision(entries.get(keys[i]), target_interval) is not False
+            ]
+
+        results = dict(zip(rows, map_candidates(search, U[rows]))) if rows else {}
+        search_time = sum(history[-1, 0] for history, *_ in results.values())
+        if cache is not None:
+            cache.put(
+                (
+                    keys[i],
+                    history[-1, 0],
+                    history[-1, 1],
+                    history[-1, 1] <= threshold,
+                    time >= total_time,
+                )
+                for i, (history, _, _, _, time, *_) in results.items()
+            )
+
+        for index, result in results.items():
+            history, u, w_final, exponents, time, h, stats = result
+            if target_interval[0] <= history[-1, 0] <= target_interval[1]:
+                break
+        else:
+            return None, None, search_time, None
+
+    exponents = continue_flow_lyapunov(
+        u,
+        parameters,
+        equations_of_motion,
+        jacobian,
+        w_final,
+        exponents,
+        time,
+        h,
+        total_time,
+        checkpoint,
+        dict(U=U, index=index, history=history, search_time=search_time),
+        variational,
+        stepping,
+        hamiltonian,
+        stats,
+    )
+    if hamiltonian is not None and energy is not None:
+        energy[:] = stats
+
+    return index, history, search_time, exponents
+
+
+@njit(nogil=True)
+def evolve_flow_multi_ldi_lyapunov(
+    u,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    v,
+    w,
+    exponents,
+    time,
+    time_step,
+    total_time,
+    ks,
+    max_times,
+    threshold,
+    variational=None,
+    drift=None,
+    kick=None,
+    coefficients=None,
+    tolerances=None,
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Continuous-time counterpart of `evolve_multi_ldi_lyapunov`: integrate the
+    flow together with max(ks) LDI deviation vectors v and the Lyapunov
+    vectors w, recording at every time step the LDI of the first k vectors for
+    every k in ks.
+
+    The LDI of ks[j] stops being recorded once it drops to the threshold or
+    the time exceeds max_times[j] (ks with a negative max_times[j] are not
+    recorded at all). The flow is integrated until every k stops or the time
+    reaches total_time. The optional drift, kick, coefficients and tolerances
+    select the integrator (see `integrator_arguments`).
+
+    If a Hamiltonian kernel `hamiltonian(u, parameters)` is given, the energy
+    of the initial state (unless energy already holds samples) and of every
+    step is added to the statistics array energy (see energy.py).
+
+    Returns:
+    - (history, lengths, u, w, time, time_step): (steps, len(ks) + 1) array
+      with the time in its first column and the LDI of each k in the others,
+      number of steps recorded for each k, and the final state, Lyapunov
+      vectors, time and time step.
+    """
+    k = v.shape[1]
+    num_ks = len(ks)
+    V = np.hstack((v, w))
+    K = np.empty((7, V.shape[0], V.shape[1]))
+    Vs = np.empty_like(V)
+    rows = int(min(max_times.max(), total_time) / time_step) + 3
+    history = np.zeros((max(rows, 0), num_ks + 1))
+    lengths = np.zeros(num_ks, dtype=np.int64)
+    active = max_times >= 0
+    ldi = np.empty(num_ks)
+
+    if hamiltonian is not None:
+        if energy[0] == 0:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+
+    n = 0
+    while time < total_time and active.any():
+        if time + time_step > total_time:
+            time_step = total_time - time
+
+        if drift is not None:
+            u = symplectic_step(u, V, parameters, drift, kick, time_step, coefficients)
+            h = time_step
+        elif tolerances is not None:
+            u, h, time_step = tangent_rk45_step(
+                time,
+                u,
+                V,
+                parameters,
+                equations_of_motion,
+                jacobian,
+                time_step,
+                tolerances[0],
+                tolerances[1],
+                K,
+                Vs,
+                variational,
+            )
+        elif variational is None:
+            u, V = variational_rk4_step(
+                time, u, V, parameters, equations_of_motion, jacobian, time_step
+            )
+            h = time_step
+        else:
+            u = tangent_rk4_step(
+                time,
+                u,
+                V,
+                parameters,
+                equations_of_motion,
+                variational,
+                time_step,
+                K,
+                Vs,
+            )
+            h = time_step
+        time = time + h
+        if hamiltonian is not None:
+            update_energy_stats(energy, time, hamiltonian(u, parameters))
+
+        # Normalize the LDI deviation vectors
+        for i in range(k):
+            V[:, i] = V[:, i] / np.linalg.norm(V[:, i])
+
+        nested_ldi(np.ascontiguousarray(V[:, :k]), ks, ldi)
+
+        # Re-orthonormalize the Lyapunov vectors
+        Q, R = qr(np.ascontiguousarray(V[:, k:]))
+        exponents += np.log(np.abs(np.diag(R)))
+        V[:, k:] = Q
+
+        if n == history.shape[0]:
+            # Adaptive steps shorter than time_step
+            history = grow_rows(history)
+        history[n, 0] = time
+        for j in range(num_ks):
+            if active[j]:
+                history[n, j + 1] = ldi[j]
+                lengths[j] = n + 1
+                if ldi[j] <= threshold or time > max_times[j]:
+                    active[j] = False
+        n += 1
+
+    return history[:n], lengths, u, np.ascontiguousarray(V[:, k:]), time, time_step
+
+
+def flow_multi_ldi_lyapunov_batch(
+    U,
+    total_time,
+    ks,
+    parameters,
+    equations_of_motion,
+    jacobian,
+    target_intervals,
+    time_step,
+    pending=None,
+    seed=13,
+    threshold=1e-16,
+    lyapunov_seed=13,
+    endpoint=True,
+    num_exponents=None,
+    variational=None,
+    checkpoint=None,
+    integrator="rk4",
+    splitting=None,
+    atol=1e-6,
+    rtol=1e-3,
+    hamiltonian=None,
+    energy=None,
+):
+    """
+    Continuous-time counterpart of `multi_ldi_lyapunov_batch` for flows
+    (see `flow_ldi_lyapunov_batch`).
+
+    Parameters:
+    - U: Candidate initial conditions, one per row.
+    - total_time: Total integration time.
+    - ks: Numbers of deviation vectors, in increasing order.
+    - parameters: Parameters of the equations of motion.
+    - equations_of_motion, jacobian: Model kernels (see models.py).
+    - target_intervals: [lower, upper] bounds of the accepted threshold time
+      of each k.
+    - time_step: Time step (initial step of "rk45").
+    - pending: Indices j of the ks still searched for (default: all of them).
+    - seed, threshold, lyapunov_seed, endpoint, num_exponents, variational,
+      checkpoint, integrator, splitting, atol, rtol, hamiltonian, energy: As
+      in `flow_ldi_lyapunov_batch`.
+
+    Returns:
+    - (index, histories, time, exponents): Row of the first accepted
+      candidate, a dictionary mapping the index j of each k it is accepted for
+      to its (time, LDI) history, its Lyapunov exponents (all None if no
+      candidate is accepted), and the integration time spent on the whole
+      batch by the search.
+    """
+    U = np.atleast_2d(np.array(U, dtype=np.float64))
+    parameters = np.array(parameters, dtype=np.float64)
+    neq = U.shape[1]
+    if num_exponents is None:
+        num_exponents = neq
+    if pending is None:
+        pending = range(len(ks))
+    v = flow_deviation_vectors(neq, ks[-1], seed)
+    w = flow_deviation_vectors(neq, num_exponents, lyapunov_seed)
+
+    total_time = float(total_time)
+    if endpoint:
+        total_time += time_step
+    max_times = np.full(len(ks), -1.0)
+    for j in pending:
+        max_times[j] = target_intervals[j][1]
+    stepping = integrator_arguments(integrator, splitting, atol, rtol)
+
+    def search(u):
+        exponents = np.zeros(num_exponents)
+        stats = energy_stats() if hamiltonian is not None else None
+        with span("ldi", k=ks[-1]) as fields:
+            history, lengths, u, w_final, time, h = evolve_flow_multi_ldi_lyapunov(
+                u.copy(),
+                parameters,
+                equations_of_motion,
+                jacobian,
+                v.copy(),
+                w.copy(),
+                exponents,
+                0.0,
+                time_step,
+                total_time,
+                np.array(ks, dtype=np.int64),
+                max_times,
+                threshold,
+                variational,
+                *stepping,
+                hamiltonian=hamiltonian,
+                energy=stats,
+            )
+            fields["time"] = time
+        return history, lengths, u, w_final, exponents, time, h, stats
+
+    state = checkpoint.state if checkpoint is not None else {}
+    if "U" in state and np.array_equal(state["U"], U):
+        # Resume the Lyapunov integration of the accepted candidate
+        index = int(state["index"])
+        histories = {int(j): state[f"history_{j}"] for j in state["accepted"]}
+        search_time = float(state["search_time"])
+        u, w_final, exponents = state["u"], state["w"], state["exponents"]
+        time, h = float(state["time"]), float(state["time_step"])
+        stats = None
+        if hamiltonian is not None:
+            stats = state.get("energy", energy_stats())
+    else:
+        results = map_candidates(search, U)
+        search_time = sum(time for *_, time, _, _ in results)
+
+        for index, result in enumerate(results):
+            history, lengths, u, w_final, exponents, time, h, stats = result
+            histories = {}
+            for j in pending:
+                history_j = history[: lengths[j]][:, [0, j + 1]]
+                if (
+                    len(history_j)
+                    and target_intervals[j][0]
+                    <= history_j[-1, 0]
+                    <= target_intervals[j][1]
+                ):
+                    histories[j] = history_j
+            if histories:
+                break
+        else:
+            return None, None, search_time, None
+
+    state = dict(
+        U=U,
+        index=index,
+        accepted=list(histories),
+        search_time=search_time,
+        **{f"history_{j}": history for j, history in histories.items()},
+    )
+    exponents = continue_flow_lyapunov(
+        u,
+        parameters,
+        equations_of_motion,
+        jacobian,
+        w_final,
+        exponents,
+        time,
+        h,
+        total_time,
+        checkpoint,
+        state,
+        variational,
+        stepping,
+        hamiltonian,
+        stats,
+    )
+    if hamiltonian is not None and energy is not None:
+        energy[:] = stats
+
+    return index, histories, search_time, exponents
+
+
+def search_summary(stats):
+    """
+    Combine the statistics of several rejection searches.
+
+    Parameters:
+    - stats: List of dictionaries returned by the `run_task` functions, with the
+      number of "candidates", the "iterations" performed and the
+      "full_iterations" the candidates would have needed without early abort.
+      The None returned for tasks already in the result store are ignored.
+
+    Returns:
+    - Dictionary with the number of tasks, candidates, the acceptance rate and
+      the number and fraction of iterations saved.
+    """
+    stats = [s for s in stats if s is not None]
+    tasks = len(stats)
+    candidates = sum(s["candidates"] for s in stats)
+    iterations = sum(s["iterations"] for s in stats)
+    full_iterations = sum(s["full_iterations"] for s in stats)
+    saved = full_iterations - iterations
+
+    return {
+        "tasks": tasks,
+        "candidates": candidates,
+        "acceptance_rate": tasks / candidates if candidates else 0.0,
+        "iterations_saved": saved,
+        "fraction_saved": saved / full_iterations if full_iterations else 0.0,
+    }
+
+
+def format_search_summary(summary):
+    """
+    Format the output of `search_summary` as a single line.
+    """
+    return (
+        f"{summary['tasks']} accepted out of {summary['candidates']} candidates "
+        f"(acceptance rate {summary['acceptance_rate']:.3f}), "
+        f"{summary['iterations_saved']} iterations saved "
+        f"({100 * summary['fraction_saved']:.1f}%)"
+    )
@@ -0,0 +1,101 @@
+"""
+Lazy, memory-mapped access to the histories of the result store.
+
+The records of a container (see store.py) are stored contiguously, each one
+right after its header, and are aligned to 8 bytes. Memory-mapping the whole
+container as a flat float64 buffer therefore gives every record as a view,
+described by its offset and shape, without reading it. A `RaggedArray` groups
+the records of a (system, k) and behaves like a list of (rows, columns) arrays
+that are only read from disk when they are accessed, so the analysis can
+iterate over thousands of long histories without holding them in memory.
+"""
+
+import os
+import numpy as np
+from store import DTYPE, read_index
+
+
+class RaggedArray:
+    """
+    Sequence of 2D arrays with the same number of columns and different
+    numbers of rows, stored in one flat buffer.
+
+    Parameters:
+    - buffer: Flat float64 array (usually a memory map).
+    - offsets: Position in buffer of the first element of each array.
+    - rows: Number of rows of each array.
+    - columns: Number of columns shared by all arrays.
+    """
+
+    def __init__(self, buffer, offsets, rows, columns):
+        self.buffer = buffer
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RaggedArray(self.buffer, self.offsets[i], self.rows[i], self.columns)
+
+        start = self.offsets[i]
+        stop = start + self.rows[i] * self.columns
+
+        return self.buffer[start:stop].reshape(self.rows[i], self.columns)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        """
+        Number of rows of each array (e.g. the length of each history).
+        """
+        return self.rows
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the arrays in bytes.
+        """
+        return int(self.rows.sum()) * self.columns * self.buffer.itemsize
+
+
+def open_buffer(filename):
+    """
+    Memory-map a container as a flat, read-only float64 buffer.
+    """
+    size = os.path.getsize(filename) // DTYPE.itemsize
+
+    return np.memmap(filename, dtype=DTYPE, mode="r", shape=(size,))
+
+
+def load_ragged(filename, keys, index=None):
+    """
+    Map records of a container as a ragged array, without reading them.
+
+    Parameters:
+    - filename: Container file.
+    - keys: Names of the records, all with the same number of columns.
+    - index: Index returned by `read_index` (read from the file if None).
+
+    Returns:
+    - RaggedArray with the records, in the order of keys.
+    """
+    if index is None:
+        index = read_index(filename)
+
+    entries = [index[key] for key in keys]
+    columns = {entry[2] for entry in entries}
+    if len(columns) > 1:
+        raise ValueError(f"{filename}: records with different numbers of columns")
+
+    offsets = [entry[0] // DTYPE.itemsize for entry in entries]
+    rows = [entry[1] for entry in entries]
+
+    return RaggedArray(
+        open_buffer(filename), offsets, rows, columns.pop() if entries else 0
+    )
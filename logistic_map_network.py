@@ -4,7 +4,7 @@ logistic maps using pynamicalsys. It generates slightly perturbed initial condit
 and searches for those that satisfy predefined LDI intervals.
 
 Usage:
-    python logistic_map_network.py <i_ini> <i_end>
+    python logistic_map_network.py <i_ini> <i_end> [batch_size]
 
     or
 
@@ -15,29 +15,68 @@ Arguments:
         Starting index of initial conditions for this batch.
     i_end : int
         Ending index of initial conditions for this batch.
+    batch_size : int, optional
+        Number of candidate initial conditions evaluated at once, in parallel
+        (default 1).
 
 Outputs:
-    Data/LogisticMapNetwork/lmn_ldi_k=<k>_ic=<i>.dat
-    Data/LogisticMapNetwork/lmn_lyapunov_k=<k>_ic=<i>.dat
+    Data/LogisticMapNetwork/lmn.store, with the records (see store.py)
+        lmn_ldi_k=<k>_ic=<i>
+        lmn_lyapunov_k=<k>_ic=<i>
 """
 
 import os
 import sys
 import numpy as np
-from pynamicalsys import DiscreteDynamicalSystem as dds
-from models import logistic_map_network, logistic_map_network_jacobian
-from parameters import LOGISTIC_MAP_NETWORK
+from models import (
+    logistic_map_network,
+    logistic_map_network_synchronous,
+    logistic_map_network_jacobian,
+    logistic_map_network_tangent,
+)
+from indicators import (
+    ldi_lyapunov_batch,
+    multi_ldi_lyapunov_batch,
+    search_summary,
+    format_search_summary,
+)
+from parameters import LOGISTIC_MAP_NETWORK, CANDIDATE_CACHE, HISTORY
+from recording import thin_history
+from store import store_file, append_records, has_record, numbered
+from profiling import profiled_task, span
+from checkpoint import Checkpoint, checkpoint_file
+from candidate_cache import CandidateCache
+from transient_cache import shared_transient_cache
 
 # --------------------------
 # System parameters
 # --------------------------
 network_size = LOGISTIC_MAP_NETWORK["network_size"]
-parameters = LOGISTIC_MAP_NETWORK["parameters"]
-parameters.append(network_size)
+parameters = LOGISTIC_MAP_NETWORK["parameters"] + [network_size]
 np.random.seed(5)
 u0 = np.random.uniform(0.0, 1, network_size) + 1e-4
 du = LOGISTIC_MAP_NETWORK["du"]
 
+# Node update: the in-place Gauss-Seidel sweep of the published results, or the
+# synchronous update of all the nodes (the map whose Jacobian is
+# logistic_map_network_jacobian)
+mapping = {
+    "gauss-seidel": logistic_map_network,
+    "synchronous": logistic_map_network_synchronous,
+}[LOGISTIC_MAP_NETWORK["update"]]
+
+# For large networks, apply the Jacobian to the deviation vectors with the
+# ring-coupling stencil instead of building the N x N matrix, and compute only
+# the leading Lyapunov exponents
+tangent = (
+    logistic_map_network_tangent if LOGISTIC_MAP_NETWORK["jacobian_free"] else None
+)
+num_exponents = LOGISTIC_MAP_NETWORK["num_exponents"]
+
+# Search for all ks at once: each candidate evolves max(ks) deviation vectors
+# and is tested against the target interval of every k
+multi_k = LOGISTIC_MAP_NETWORK["multi_k"]
+
 # --------------------------
 # Iteration parameters
 # --------------------------
@@ -51,75 +90,273 @@ ks = LOGISTIC_MAP_NETWORK["ks"]
 
 path = LOGISTIC_MAP_NETWORK["path"]  # Datafiles location
 os.makedirs(path, exist_ok=True)
+results_file = store_file(path, "lmn")  # Result store of all (k, ic)
 
-# --------------------------
-# Create dynamical system
-# --------------------------
-ds = dds(
-    mapping=logistic_map_network,
-    jacobian=logistic_map_network_jacobian,
-    system_dimension=network_size,
-    number_of_parameters=4,
-)
 
 # --------------------------
-# Batch indices from command line
+# JIT warm-up
 # --------------------------
-i_ini = int(sys.argv[1])
-i_end = int(sys.argv[2])
+def warm_up(batch_size=1):
+    """
+    Compile the model kernels and the LDI and Lyapunov drivers used by
+    `run_task` by running them for a couple of iterations.
+
+    Parameters:
+    - batch_size: Number of candidates evaluated at once by `run_task`.
+    """
+    if multi_k:
+        multi_ldi_lyapunov_batch(
+            [u0] * batch_size,
+            2,
+            ks,
+            parameters,
+            mapping,
+            logistic_map_network_jacobian,
+            [[1, 1]] * len(ks),
+            transient_time=1,
+            num_exponents=num_exponents,
+            tangent=tangent,
+        )
+        return
+
+    ldi_lyapunov_batch(
+        [u0] * batch_size,
+        2,
+        2,
+        parameters,
+        mapping,
+        logistic_map_network_jacobian,
+        [1, 1],
+        transient_time=1,
+        num_exponents=num_exponents,
+        tangent=tangent,
+    )
+
 
 # --------------------------
-# Main computation loop
+# Main computation
 # --------------------------
-for j, target_interval in enumerate(intervals):
+def task_done(j, ic):
+    """
+    Return whether a previous run stored the results of the task of the j-th
+    k and the ic-th initial condition. With multi_k, the task of the first k
+    searches for all the ks and the others have nothing to do.
+    """
+    if multi_k and j > 0:
+        return True
+    if multi_k:
+        return all(has_record(results_file, f"lmn_ldi_k={k}_ic={ic}") for k in ks)
+
+    return has_record(results_file, f"lmn_ldi_k={ks[j]}_ic={ic}")
+
+
+@profiled_task("logistic_map_network")
+def run_task(j, ic, batch_size=1):
+    """
+    Search for a perturbed initial condition whose LDI falls within the j-th
+    target interval and save its LDI history and Lyapunov exponents.
+
+    Parameters:
+    - j: Index of the LDI calculation (k = ks[j]) and of its target interval.
+    - ic: Index of the initial condition.
+    - batch_size: Number of candidates evaluated at once (in parallel).
+
+    Returns:
+    - Dictionary with the number of "candidates" drawn until the accepted one,
+      the "iterations" performed and the "full_iterations" the evaluated
+      candidates would have needed without early abort. None if the results
+      of the task were already stored.
+    """
+    if multi_k:
+        # The task of the first k searches for all of them
+        return run_multi_k_task(ic, batch_size) if j == 0 else None
+
+    target_interval = intervals[j]
     k_val = ks[j]  # k-index for LDI, matching original code
 
-    for ic in range(i_ini, i_end + 1):
-        count = 0
-        while True:
+    # Skip tasks completed by a previous run
+    if task_done(j, ic):
+        return None
+
+    # Outcomes of the candidates evaluated by previous runs
+    cache = None
+    if CANDIDATE_CACHE["enabled"]:
+        cache = CandidateCache(CANDIDATE_CACHE["filename"], CANDIDATE_CACHE["budget"])
+
+    # Resume the search where a preempted run stopped
+    checkpoint = Checkpoint(checkpoint_file(path, f"lmn_k={k_val}_ic={ic}"))
+    state = checkpoint.load()
+    count = int(state.get("count", 0))
+    iterations = int(state.get("iterations", 0))
+    evaluated = int(state.get("evaluated", 0))
+    while True:
+        # Perturbed initial conditions of the next batch of candidates
+        candidates = []
+        for b in range(batch_size):
             # Set reproducible seed
-            np.random.seed(ic * 10 + j + count)
+            np.random.seed(ic * 10 + j + count + b)
 
             # Generate random initial condition
             u = np.random.rand(network_size)
             u = u0 + u * du
+            candidates.append(u)
+
+        # Compute LDI histories, stopping as soon as each candidate is decided,
+        # and the Lyapunov exponents of the first accepted candidate along the
+        # same orbit
+        index, ldi_history, n, lyapunov_values = ldi_lyapunov_batch(
+            candidates,
+            total_time,
+            k_val,
+            parameters,
+            mapping,
+            logistic_map_network_jacobian,
+            target_interval,
+            transient_time=transient_time,
+            seed=2,
+            checkpoint=checkpoint,
+            cache=cache,
+            num_exponents=num_exponents,
+            tangent=tangent,
+            transients=shared_transient_cache(),
+        )
+        iterations += n
+        evaluated += batch_size
 
-            # Compute LDI history
-            ldi_history = ds.LDI(
-                u,
-                total_time,
-                k=k_val,
-                parameters=parameters,
-                seed=2,
-                transient_time=transient_time,
-                return_history=True,
-            )
+        # Accept if LDI length falls in the target interval
+        if index is not None:
+            count += index
             ldi_history = ldi_history[ldi_history > 0]
+            break
+        count += batch_size
+        checkpoint.save(
+            {"count": count, "iterations": iterations, "evaluated": evaluated}
+        )
+
+    # --------------------------
+    # Save LDI and Lyapunov exponents to the result store
+    # --------------------------
+    with span("write"):
+        append_records(
+            results_file,
+            [
+                (
+                    f"lmn_ldi_k={k_val}_ic={ic}",
+                    thin_history(numbered(ldi_history), **HISTORY),
+                ),
+                (f"lmn_lyapunov_k={k_val}_ic={ic}", numbered(lyapunov_values)),
+            ],
+        )
+    checkpoint.remove()
+    if cache is not None:
+        cache.close()
+
+    return {
+        "candidates": count + 1,
+        "iterations": iterations,
+        "full_iterations": evaluated * total_time,
+    }
+
+
+def run_multi_k_task(ic, batch_size=1):
+    """
+    Search for perturbed initial conditions whose LDI falls within the target
+    interval of every k, evaluating each candidate once for all the ks, and
+    save the LDI history and Lyapunov exponents of each k as `run_task` does.
+
+    Parameters:
+    - ic: Index of the initial condition.
+    - batch_size: Number of candidates evaluated at once (in parallel).
+
+    Returns:
+    - Search statistics as in `run_task`, for all the ks together. None if the
+      results of every k were already stored.
+    """
+    # Skip the ks completed by a previous run
+    pending = [
+        j
+        for j, k_val in enumerate(ks)
+        if not has_record(results_file, f"lmn_ldi_k={k_val}_ic={ic}")
+    ]
+    if not pending:
+        return None
+
+    # Resume the search where a preempted run stopped
+    checkpoint = Checkpoint(checkpoint_file(path, f"lmn_ic={ic}"))
+    state = checkpoint.load()
+    count = int(state.get("count", 0))
+    iterations = int(state.get("iterations", 0))
+    evaluated = int(state.get("evaluated", 0))
+    while pending:
+        # Perturbed initial conditions of the next batch of candidates
+        candidates = []
+        for b in range(batch_size):
+            np.random.seed(ic * 10 + count + b)
+            u = np.random.rand(network_size)
+            candidates.append(u0 + u * du)
+
+        index, ldi_histories, n, lyapunov_values = multi_ldi_lyapunov_batch(
+            candidates,
+            total_time,
+            ks,
+            parameters,
+            mapping,
+            logistic_map_network_jacobian,
+            intervals,
+            pending,
+            transient_time=transient_time,
+            seed=2,
+            checkpoint=checkpoint,
+            num_exponents=num_exponents,
+            tangent=tangent,
+            transients=shared_transient_cache(),
+        )
+        iterations += n
+        evaluated += batch_size
+        if index is None:
+            count += batch_size
+        else:
+            # Save the results of every k the candidate is accepted for
+            records = []
+            for j, ldi_history in ldi_histories.items():
+                if j in pending:
+                    ldi_history = ldi_history[ldi_history > 0]
+                    records += [
+                        (
+                            f"lmn_ldi_k={ks[j]}_ic={ic}",
+                            thin_history(numbered(ldi_history), **HISTORY),
+                        ),
+                        (f"lmn_lyapunov_k={ks[j]}_ic={ic}", numbered(lyapunov_values)),
+                    ]
+            with span("write"):
+                append_records(results_file, records)
+            pending = [j for j in pending if j not in ldi_histories]
+            count += index + 1
+        checkpoint.save(
+            {"count": count, "iterations": iterations, "evaluated": evaluated}
+        )
+    checkpoint.remove()
+
+    return {
+        "candidates": count,
+        "iterations": iterations,
+        "full_iterations": evaluated * total_time,
+    }
+
+
+if __name__ == "__main__":
+    # --------------------------
+    # Batch indices from command line
+    # --------------------------
+    i_ini = int(sys.argv[1])
+    i_end = int(sys.argv[2])
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
 
-            # Accept if LDI length falls in the target interval
-            if target_interval[0] <= len(ldi_history) <= target_interval[1]:
-                # Compute Lyapunov exponents
-                lyapunov_values = ds.lyapunov(
-                    u,
-                    total_time,
-                    parameters=parameters,
-                    transient_time=transient_time,
-                )
-                break
-            count += 1
-
-        # --------------------------
-        # Save LDI to file
-        # --------------------------
-        ldi_file = f"{path}/lmn_ldi_k={k_val}_ic={ic}.dat"
-        with open(ldi_file, "w") as f:
-            for idx, val in enumerate(ldi_history):
-                f.write(f"{idx + 1} {val:.16f}\n")
-
-        # --------------------------
-        # Save Lyapunov exponents to file
-        # --------------------------
-        lyap_file = f"{path}/lmn_lyapunov_k={k_val}_ic={ic}.dat"
-        with open(lyap_file, "w") as f:
-            for idx, val in enumerate(lyapunov_values):
-                f.write(f"{idx + 1} {val:.16f}\n")
+    if multi_k:
+        # The task of the first k searches for all of them
+        stats = [run_task(0, ic, batch_size) for ic in range(i_ini, i_end + 1)]
+        print(f"k = {ks}: {format_search_summary(search_summary(stats))}")
+    else:
+        for j in range(len(intervals)):
+            stats = [run_task(j, ic, batch_size) for ic in range(i_ini, i_end + 1)]
+            print(f"k = {ks[j]}: {format_search_summary(search_summary(stats))}")
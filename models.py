@@ -1,8 +1,8 @@
 import numpy as np
-from numba import njit
+from numba import njit, prange
 
 
-@njit
+@njit(cache=True)
 def cat_map(u, parameters):
 
     x, y = u
@@ -15,13 +15,36 @@ def cat_map(u, parameters):
     return np.array([x_new, y_new], dtype=np.float64)
 
 
-@njit
+@njit(cache=True)
 def cat_map_jacobian(u, parameters, *args):
 
     return np.array([[2, 1], [1, 1]], dtype=np.float64)
 
 
-@njit
+@njit(cache=True)
+def cat_map_inplace(u, parameters, out):
+    # Same as cat_map, writing the new state into out
+    x = u[0]
+    y = u[1]
+
+    out[0] = (2 * x + y) % 1.0
+    out[1] = (x + y) % 1.0
+
+    return out
+
+
+@njit(cache=True)
+def cat_map_jacobian_inplace(u, parameters, J):
+    # Same as cat_map_jacobian, writing into J (constant: independent of u)
+    J[0, 0] = 2.0
+    J[0, 1] = 1.0
+    J[1, 0] = 1.0
+    J[1, 1] = 1.0
+
+    return J
+
+
+@njit(cache=True)
 def baker_map(u, parameters):
     x, y = u
     k = parameters[0]
@@ -36,7 +59,7 @@ def baker_map(u, parameters):
     return np.array([x_new, y_new], dtype=np.float64)
 
 
-@njit
+@njit(cache=True)
 def baker_map_jacobian(u, parameters, *args):
 
     k = parameters[0]
@@ -49,7 +72,35 @@ def baker_map_jacobian(u, parameters, *args):
     return J
 
 
-@njit
+@njit(cache=True)
+def baker_map_inplace(u, parameters, out):
+    # Same as baker_map, writing the new state into out
+    x = u[0]
+    y = u[1]
+    k = parameters[0]
+
+    if 0 <= y <= 0.5:
+        out[0] = k * x
+        out[1] = 2 * y
+    else:
+        out[0] = 1 + k * (x - 1)
+        out[1] = 1 + 2 * (y - 1)
+
+    return out
+
+
+@njit(cache=True)
+def baker_map_jacobian_inplace(u, parameters, J):
+    # Same as baker_map_jacobian, writing into J (constant: independent of u)
+    J[0, 0] = parameters[0]
+    J[0, 1] = 0.0
+    J[1, 0] = 0.0
+    J[1, 1] = 2.0
+
+    return J
+
+
+@njit(cache=True)
 def henon_map_3D(u, parameters):
     x, y, z = u
     M1, M2, B = parameters
@@ -61,7 +112,7 @@ def henon_map_3D(u, parameters):
     return np.array([x_new, y_new, z_new], dtype=np.float64)
 
 
-@njit
+@njit(cache=True)
 def henon_map_3D_jacobian(u, parameters, *args):
     M1, M2, B = parameters
 
@@ -72,13 +123,49 @@ def henon_map_3D_jacobian(u, parameters, *args):
     return J
 
 
-@njit
+@njit(cache=True)
+def henon_map_3D_inplace(u, parameters, out):
+    # Same as henon_map_3D, writing the new state into out
+    x = u[0]
+    y = u[1]
+    z = u[2]
+    M1 = parameters[0]
+    M2 = parameters[1]
+    B = parameters[2]
+
+    out[0] = y
+    out[1] = z
+    out[2] = M1 + B * x + M2 * y - z**2
+
+    return out
+
+
+@njit(cache=True)
+def henon_map_3D_jacobian_inplace(u, parameters, J):
+    # Same as henon_map_3D_jacobian, writing into J
+    J[0, 0] = 0.0
+    J[0, 1] = 1.0
+    J[0, 2] = 0.0
+    J[1, 0] = 0.0
+    J[1, 1] = 0.0
+    J[1, 2] = 1.0
+    J[2, 0] = parameters[2]
+    J[2, 1] = parameters[1]
+    J[2, 2] = -2.0 * u[2]
+
+    return J
+
+
+@njit(cache=True)
 def f(u, a):
     return a * u * (1 - u)
 
 
-@njit
+@njit(cache=True)
 def logistic_map_network(u, parameters):
+    # Gauss-Seidel sweep: u is updated in place, node by node, so the coupling
+    # of node i reads the new values of the nodes before it (use
+    # logistic_map_network_synchronous for the map of the Jacobian below)
     a, r, sigma, N = parameters
 
     P = round(r * N)
@@ -94,7 +181,36 @@ def logistic_map_network(u, parameters):
     return u
 
 
-@njit
+@njit(cache=True)
+def logistic_map_network_synchronous(u, parameters):
+    # Synchronous update of every node from the same state, without modifying
+    # u: f is evaluated once per node and the ring coupling is a sum over a
+    # window slid around the ring, in O(N) instead of O(N * P) operations
+    a, r, sigma, N = parameters
+
+    P = round(r * N)
+
+    N = int(N)
+
+    F = np.empty(N)
+    for j in range(N):
+        F[j] = f(u[j], a)
+
+    # Sum of F over the stencil of node 0
+    S = 0.0
+    for j in range(-P, P + 1):
+        S += F[j % N]
+
+    u_new = np.empty(N)
+    c = sigma / (2 * P)
+    for i in range(N):
+        u_new[i] = F[i] + c * (S - (2 * P + 1) * F[i])
+        S += F[(i + P + 1) % N] - F[(i - P) % N]
+
+    return u_new
+
+
+@njit(cache=True)
 def logistic_map_network_jacobian(u, parameters, *args):
     a, r, sigma, N = parameters
 
@@ -117,7 +233,44 @@ def logistic_map_network_jacobian(u, parameters, *args):
     return J
 
 
-@njit
+@njit(cache=True)
+def logistic_map_network_tangent(u, parameters, V):
+    # Applies logistic_map_network_jacobian(u, parameters) to the columns of V
+    # with the ring-coupling stencil, in O(N) operations per column and without
+    # building the N x N Jacobian (same matrix as long as 2P + 1 <= N)
+    a, r, sigma, N = parameters
+
+    P = round(r * N)
+
+    N = int(N)
+    m = V.shape[1]
+
+    # f'(u_j) * V[j, :]
+    G = np.empty((N, m))
+    for j in range(N):
+        f_prime = a * (1 - 2 * u[j])
+        for l in range(m):
+            G[j, l] = f_prime * V[j, l]
+
+    # Sum of G over the stencil of node 0, slid around the ring
+    S = np.zeros(m)
+    for j in range(-P, P + 1):
+        for l in range(m):
+            S[l] += G[j % N, l]
+
+    JV = np.empty((N, m))
+    c = sigma / (2 * P)
+    for i in range(N):
+        j_in = (i + P + 1) % N
+        j_out = (i - P) % N
+        for l in range(m):
+            JV[i, l] = (1 - sigma) * G[i, l] + c * (S[l] - G[i, l])
+            S[l] += G[j_in, l] - G[j_out, l]
+
+    return JV
+
+
+@njit(cache=True)
 def fermi_pasta_ulam(time, u, parameters):
     dof = len(u) // 2  # total particles including fixed ends
     dudt = np.zeros_like(u)
@@ -138,7 +291,7 @@ def fermi_pasta_ulam(time, u, parameters):
     return dudt
 
 
-@njit
+@njit(cache=True)
 def fermi_pasta_ulam_jacobian(time, u, parameters):
 
     dof = len(u) // 2
@@ -168,22 +321,112 @@ def fermi_pasta_ulam_jacobian(time, u, parameters):
     return J
 
 
-def fermi_pasta_ulam_energy(u, parameters):
-    u = np.atleast_2d(u)
-    dof = u.shape[1] // 2
+@njit(cache=True)
+def fermi_pasta_ulam_variational(time, u, V, parameters, dV):
+    # Writes fermi_pasta_ulam_jacobian(time, u, parameters) @ V into dV using
+    # the nearest-neighbour stencil, without allocating the Jacobian
+    dof = len(u) // 2
+    beta = parameters[0]
+    m = V.shape[1]
+
+    # fixed ends (j=0 and j=dof-1) remain zero
+    for l in range(m):
+        dV[0, l] = 0.0
+        dV[1, l] = 0.0
+        dV[2 * dof - 2, l] = 0.0
+        dV[2 * dof - 1, l] = 0.0
+
+    # movable particles i=1..dof-2
+    for i in range(1, dof - 1):
+        left = u[2 * i] - u[2 * i - 2]
+        right = u[2 * i + 2] - u[2 * i]
+        J_left = 1 - 3 * beta * left**2
+        J_center = -2 + 3 * beta * (right**2 + left**2)
+        J_right = 1 - 3 * beta * right**2
+        for l in range(m):
+            # dx_i/dt = p_i
+            dV[2 * i, l] = V[2 * i + 1, l]
+            # dp_i/dt depends on x_{i-1}, x_i, x_{i+1}
+            dV[2 * i + 1, l] = (
+                J_left * V[2 * i - 2, l]
+                + J_center * V[2 * i, l]
+                + J_right * V[2 * i + 2, l]
+            )
+
+    return dV
+
+
+@njit(cache=True)
+def fermi_pasta_ulam_drift(u, V, h):
+    # Advances the positions and their deviations by h times the momenta (the
+    # kinetic part of the splitting of the FPU Hamiltonian), in place
+    dof = len(u) // 2
+    m = V.shape[1]
+    for i in range(1, dof - 1):
+        u[2 * i] += h * u[2 * i + 1]
+        for l in range(m):
+            V[2 * i, l] += h * V[2 * i + 1, l]
+
+    return u
+
+
+@njit(cache=True)
+def fermi_pasta_ulam_kick(u, V, parameters, h):
+    # Advances the momenta and their deviations by h times the forces (the
+    # potential part of the splitting), in place. The deviations use the same
+    # coefficients as fermi_pasta_ulam_variational
+    dof = len(u) // 2
     beta = parameters[0]
+    m = V.shape[1]
+    for i in range(1, dof - 1):
+        left = u[2 * i] - u[2 * i - 2]
+        right = u[2 * i + 2] - u[2 * i]
+        u[2 * i + 1] += h * (right - left + beta * (right**3 - left**3))
+        J_left = 1 - 3 * beta * left**2
+        J_center = -2 + 3 * beta * (right**2 + left**2)
+        J_right = 1 - 3 * beta * right**2
+        for l in range(m):
+            V[2 * i + 1, l] += h * (
+                J_left * V[2 * i - 2, l]
+                + J_center * V[2 * i, l]
+                + J_right * V[2 * i + 2, l]
+            )
 
-    x = u[:, 0::2]
-    p = u[:, 1::2]
+    return u
+
+
+@njit(cache=True)
+def fermi_pasta_ulam_hamiltonian(u, parameters):
+    # Energy of a single state, in one pass over the particles and springs
+    dof = len(u) // 2
+    beta = parameters[0]
 
     # kinetic energy: only movable particles j=1..dof-2
-    T = 0.5 * np.sum(p[:, 1:-1] ** 2, axis=1)
+    T = 0.0
+    for j in range(1, dof - 1):
+        T += 0.5 * u[2 * j + 1] ** 2
 
     # potential energy: springs between j=0..dof-2 and j+1
-    V = np.zeros(u.shape[0])
+    V = 0.0
     for j in range(dof - 1):
-        dx = x[:, j + 1] - x[:, j]
+        dx = u[2 * j + 2] - u[2 * j]
         V += 0.5 * dx**2 + 0.25 * beta * dx**4
 
-    H = T + V
+    return T + V
+
+
+@njit(cache=True, parallel=True)
+def fermi_pasta_ulam_energies(trajectory, parameters, H):
+    # Energy of each row of a (T, 2 * dof) trajectory, in parallel
+    for t in prange(trajectory.shape[0]):
+        H[t] = fermi_pasta_ulam_hamiltonian(trajectory[t], parameters)
+
+    return H
+
+
+def fermi_pasta_ulam_energy(u, parameters):
+    u = np.ascontiguousarray(np.atleast_2d(u), dtype=np.float64)
+    parameters = np.asarray(parameters, dtype=np.float64)
+
+    H = fermi_pasta_ulam_energies(u, parameters, np.empty(u.shape[0]))
     return H if u.shape[0] > 1 else H[0]
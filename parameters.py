@@ -11,6 +11,12 @@ FPU = {
     "path": "Data/FPU",
     "num_ic": 100,
     "LDI_threshold": 1e-15,
+    "jacobian_free": False,  # Integrate the variational equations with the stencil
+    "num_exponents": None,  # Number of Lyapunov exponents (None: all of them)
+    "multi_k": False,  # Search for all ks at once, evolving max(ks) vectors
+    "integrator": "rk4",  # "rk4", "rk45", "leapfrog", "yoshida4" or "yoshida6"
+    "tolerance": 1e-11,  # Absolute and relative tolerance of "rk45"
+    "max_energy_error": 1e-6,  # Largest relative energy error (None: not monitored)
 }
 
 # Henon map parameters
@@ -24,6 +30,7 @@ HENON = {
     "sample_size": int(1e6),
     "transient_time": int(5e5),
     "path": "Data/Henon",
+    "inplace_kernels": False,  # Write the state and Jacobian into preallocated buffers
 }
 
 # Logistic map network parameters
@@ -37,6 +44,10 @@ LOGISTIC_MAP_NETWORK = {
     "sample_size": 50000,
     "transient_time": 50000,
     "path": "Data/LogisticMapNetwork",
+    "jacobian_free": False,  # Apply the Jacobian with the ring-coupling stencil
+    "num_exponents": None,  # Number of Lyapunov exponents (None: all of them)
+    "multi_k": False,  # Search for all ks at once, evolving max(ks) vectors
+    "update": "gauss-seidel",  # Node update: "gauss-seidel" or "synchronous"
 }
 
 CATMAP = {
@@ -44,6 +55,8 @@ CATMAP = {
     "total_time": 10000,
     "SALI_threshold": 3e-16,
     "path": "Data/CatMap",
+    "grid_size": 2048,  # Grid points per axis of the grid mode
+    "grid_index": "sali",  # Index of the grid mode: "sali" or "gali"
 }
 
 BAKERMAP = {
@@ -53,4 +66,53 @@ BAKERMAP = {
     "SALI_threshold": 1e-16,
     "path": "Data/BakerMap",
     "parameters": [0.3],
+    "grid_size": 2048,  # Grid points per axis of the grid mode
+    "grid_index": "sali",  # Index of the grid mode: "sali" or "gali"
+}
+
+# Rows of the LDI and SALI histories stored by the system scripts (see
+# recording.py): "all", "every" (one row out of stride), "log" (per_decade rows
+# per decade of the iteration number) or "last" (first and last rows only)
+HISTORY = {
+    "policy": "all",
+    "stride": 10,
+    "per_decade": 100,
+}
+
+# Cache of the LDI outcomes of the candidates of the rejection searches. Off by
+# default: it is a single SQLite file written by every worker, to be enabled for
+# reruns on a local disk (not on a network file system)
+CANDIDATE_CACHE = {
+    "enabled": False,
+    "filename": "Data/candidate_cache.sqlite",
+    "budget": 256 * 2**20,  # Disk budget in bytes
+}
+
+# Cache of the post-transient states of the maps (see transient_cache.py). The
+# disk tier is off by default, for the same reasons as the candidate cache: set
+# a filename (e.g. "Data/transient_cache.sqlite") on a local disk to enable it
+TRANSIENT_CACHE = {
+    "enabled": True,
+    "filename": None,  # SQLite file of the disk tier (None: memory only)
+    "budget": 64 * 2**20,  # Disk budget in bytes
+    "memory_entries": 4096,  # States kept in memory by each process
+}
+
+# Coordinator and workers of the multi-node backend (see cluster.py)
+CLUSTER = {
+    "host": "127.0.0.1",  # Interface the coordinator listens on
+    "port": 5555,
+    "heartbeat": 10.0,  # Seconds between the heartbeats of a worker
+    "lease_timeout": 60.0,  # Seconds of silence after which a task is lost
+    "max_attempts": 3,  # Times a lost task is handed out before it fails
+    "max_payload": 2**30,  # Largest records of a task a message may carry, in bytes
+}
+
+# Script module and LDI indices of each system. SALI systems have no k.
+SYSTEMS = {
+    "henon_map_3D": HENON["ks"],
+    "logistic_map_network": LOGISTIC_MAP_NETWORK["ks"],
+    "fpu": FPU["ks"],
+    "cat_map": None,
+    "baker_map": None,
 }
@@ -0,0 +1,414 @@
+"""
+Opt-in profiling of the system scripts.
+
+When the environment variable ALIGNMENT_PROFILE names a file (e.g. set by
+`python run_systems.py ... --profile <file>`, and inherited by the worker
+processes), every process appends trace events to it, one JSON object per line
+in the Chrome trace event format:
+
+- "task": one (system, k, ic) task, with its number of candidates, rejected
+  candidates, iterations and iterations without early abort, the time spent
+  compiling JIT functions and the peak resident set size of the process during
+  the task;
+- "warm_up": JIT compilation of a system before its tasks (see warmup.py);
+- "transient", "ldi" and "lyapunov": burn-in, early-abort LDI search of one
+  candidate and continuation of the Lyapunov vectors of the accepted one, with
+  their number of iterations (or integration steps);
+- "write": storing the records of a task.
+
+The compiled kernels themselves are not instrumented: the phases are timed
+around the calls of the drivers in indicators.py, which return the iteration
+counts. Without ALIGNMENT_PROFILE, `span` and `profiled_task` do nothing.
+
+Usage:
+    python profiling.py summary <trace> [<trace> ...] [--top <n>]
+
+        ranks the phases of each system by total time and lists the slowest
+        tasks, over the traces of a whole campaign (e.g. one per host).
+
+    python profiling.py chrome <trace> [<trace> ...] <out.json>
+
+        converts traces into a JSON array that chrome://tracing and Perfetto
+        open.
+"""
+
+import argparse
+import contextlib
+import functools
+import inspect
+import json
+import os
+import socket
+import threading
+import time
+from numba.core import event
+from parameters import SYSTEMS
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Environment variable holding the trace file
+PROFILE_ENV = "ALIGNMENT_PROFILE"
+
+# Counters of the running task, if any (one task at a time per process)
+_task = None
+_lock = threading.Lock()
+
+
+def enabled():
+    """
+    Return whether profiling is enabled in this process.
+    """
+    return bool(os.environ.get(PROFILE_ENV))
+
+
+def enable(filename):
+    """
+    Enable profiling in this process and the processes it starts, appending
+    the trace events to filename.
+    """
+    os.environ[PROFILE_ENV] = os.path.abspath(filename)
+
+
+def emit(name, start, duration, **fields):
+    """
+    Append a complete ("X") trace event to the trace file.
+
+    Parameters:
+    - name: Name of the event.
+    - start: time.time() at its start.
+    - duration: Duration in seconds.
+    - fields: Arguments of the event.
+    """
+    record = {
+        "name": name,
+        "ph": "X",
+        "ts": round(start * 1e6),
+        "dur": round(duration * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "host": socket.gethostname(),
+        "args": fields,
+    }
+    line = json.dumps(record, default=lambda value: value.item()) + "\n"
+    # A single write per line, so concurrent processes do not interleave lines
+    fd = os.open(os.environ[PROFILE_ENV], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _span(name, fields):
+    start, begin = time.time(), time.perf_counter()
+    try:
+        yield fields
+    finally:
+        elapsed = time.perf_counter() - begin
+        if _task is not None:
+            with _lock:
+                phase = _task.setdefault(name, {"seconds": 0.0, "calls": 0})
+                phase["seconds"] += elapsed
+                phase["calls"] += 1
+        emit(name, start, elapsed, **fields)
+
+
+def span(name, **fields):
+    """
+    Time a block as a trace event.
+
+    Parameters:
+    - name: Name of the event.
+    - fields: Arguments of the event. The dictionary yielded by the context
+      manager can be updated inside the block (e.g. with an iteration count
+      known at the end).
+
+    Returns:
+    - Context manager (a no-op if profiling is disabled).
+    """
+    if not enabled():
+        return contextlib.nullcontext({})
+
+    return _span(name, fields)
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the process, if the platform allows
+    it (Linux).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of the process in bytes (since the last
+    `reset_peak_rss` on Linux), or None if unknown.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+def profiled_task(system):
+    """
+    Decorator of the `run_task` function of a system script that records each
+    call as a "task" event.
+
+    The arguments j and ic of the call identify the task, and the statistics
+    returned by the LDI scripts give its counts of candidates and iterations.
+    The event also holds the total time and number of calls of each phase
+    (span) of the task, e.g. the number of candidates evaluated ("ldi" calls).
+
+    Parameters:
+    - system: Name of the system script module (a key of SYSTEMS).
+    """
+
+    def decorator(run_task):
+        signature = inspect.signature(run_task)
+
+        @functools.wraps(run_task)
+        def wrapper(*args, **kwargs):
+            global _task
+            if not enabled():
+                return run_task(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs).arguments
+            fields = {"system": system, "ic": arguments["ic"]}
+            if "j" in arguments:
+                fields["k"] = SYSTEMS[system][arguments["j"]]
+            reset_peak_rss()
+            _task = {}
+            compile_timer = event.TimingListener()
+            start, begin = time.time(), time.perf_counter()
+            status = "error"
+            try:
+                with event.install_listener("numba:compile", compile_timer):
+                    result = run_task(*args, **kwargs)
+                # Tasks completed by a previous run store nothing
+                status = "done" if "write" in _task else "skipped"
+                if result is not None:
+                    fields["candidates"] = result["candidates"]
+                    fields["rejected"] = result["candidates"] - 1
+                    fields["iterations"] = result["iterations"]
+                    fields["full_iterations"] = result["full_iterations"]
+                return result
+            finally:
+                elapsed = time.perf_counter() - begin
+                fields["status"] = status
+                fields["jit_compile"] = (
+                    compile_timer.duration if compile_timer.done else 0.0
+                )
+                fields["peak_rss"] = peak_rss()
+                fields["phases"] = _task
+                _task = None
+                emit("task", start, elapsed, **fields)
+
+        return wrapper
+
+    return decorator
+
+
+def read_traces(filenames):
+    """
+    Read the events of trace files, skipping incomplete lines (e.g. from a
+    killed process).
+    """
+    events = []
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+    return events
+
+
+def task_label(fields):
+    """
+    Return the (system, k) label of a task or phase event.
+    """
+    if fields.get("k") is None:
+        return fields["system"]
+
+    return f"{fields['system']} k={fields['k']}"
+
+
+def summarize(events, top=10):
+    """
+    Rank the hotspots of a campaign.
+
+    Parameters:
+    - events: Trace events (see `read_traces`).
+    - top: Number of hotspots and of slowest tasks listed.
+
+    Returns:
+    - Dictionary with:
+      - "groups": for each (system, k), the number of "tasks", their "wall"
+        time, "jit_compile" time, "candidates" evaluated (calls of the LDI
+        search), "rejected" candidates (if the script returns its search
+        statistics), "iterations" and "peak_rss", and the total "seconds" and
+        "calls" of each of their "phases" (the rest of the task time under
+        "other"), ranked by wall time;
+      - "hotspots": the top (label, phase, seconds, share of the total task
+        time) over all the groups, slowest first;
+      - "warm_up": the total warm-up time of each system;
+      - "slowest": the slowest tasks.
+    Tasks skipped because their results were already stored are ignored.
+    """
+    groups = {}
+    warm_up = {}
+    tasks = []
+    for record in events:
+        fields = record.get("args", {})
+        seconds = record["dur"] / 1e6
+        if record["name"] == "warm_up":
+            warm_up[fields["system"]] = warm_up.get(fields["system"], 0.0) + seconds
+        if record["name"] != "task" or fields.get("status") == "skipped":
+            continue
+
+        tasks.append((seconds, fields))
+        group = groups.setdefault(
+            task_label(fields),
+            {
+                "tasks": 0,
+                "wall": 0.0,
+                "jit_compile": 0.0,
+                "candidates": 0,
+                "rejected": 0,
+                "iterations": 0,
+                "peak_rss": 0,
+                "phases": {},
+            },
+        )
+        group["tasks"] += 1
+        group["wall"] += seconds
+        group["jit_compile"] += fields["jit_compile"]
+        group["candidates"] += fields["phases"].get("ldi", {}).get("calls", 0)
+        group["rejected"] += fields.get("rejected", 0)
+        group["iterations"] += fields.get("iterations", 0)
+        group["peak_rss"] = max(group["peak_rss"], fields.get("peak_rss") or 0)
+        for name, phase in fields["phases"].items():
+            total = group["phases"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += phase["seconds"]
+            total["calls"] += phase["calls"]
+
+    hotspots = []
+    for label, group in groups.items():
+        # Phases on several threads (batched searches) may add up to more than
+        # the wall time of the task
+        other = group["wall"] - sum(p["seconds"] for p in group["phases"].values())
+        group["phases"]["other"] = {"seconds": max(other, 0.0), "calls": 0}
+        group["phases"] = dict(
+            sorted(group["phases"].items(), key=lambda item: -item[1]["seconds"])
+        )
+        hotspots += [
+            (label, name, phase["seconds"]) for name, phase in group["phases"].items()
+        ]
+
+    total = sum(seconds for seconds, _ in tasks)
+    hotspots.sort(key=lambda item: -item[2])
+    tasks.sort(key=lambda item: -item[0])
+
+    return {
+        "groups": dict(sorted(groups.items(), key=lambda item: -item[1]["wall"])),
+        "hotspots": [
+            (label, name, seconds, seconds / total if total else 0.0)
+            for label, name, seconds in hotspots[:top]
+        ],
+        "warm_up": warm_up,
+        "slowest": [dict(fields, wall=seconds) for seconds, fields in tasks[:top]],
+    }
+
+
+def format_summary(summary):
+    """
+    Format the output of `summarize` as a report.
+    """
+    lines = ["Hotspots:"]
+    for label, name, seconds, share in summary["hotspots"]:
+        lines.append(
+            f"    {label:<28} {name:<10} {seconds:10.2f} s  {100 * share:5.1f}%"
+        )
+
+    for label, group in summary["groups"].items():
+        counts = ""
+        if group["candidates"]:
+            counts += f", {group['candidates']} candidate(s)"
+        if group["rejected"]:
+            counts += f" ({group['rejected']} rejected)"
+        if group["iterations"]:
+            counts += f", {group['iterations']} iterations"
+        lines.append(
+            f"{label}: {group['tasks']} task(s) in {group['wall']:.1f} s{counts}, "
+            f"JIT {group['jit_compile']:.1f} s, peak RSS "
+            f"{group['peak_rss'] / 2**20:.0f} MiB"
+        )
+        for name, phase in group["phases"].items():
+            share = 100 * phase["seconds"] / group["wall"] if group["wall"] else 0.0
+            calls = f"{phase['calls']} call(s)" if phase["calls"] else ""
+            lines.append(
+                f"    {name:<10} {phase['seconds']:10.2f} s  {share:5.1f}%  {calls}"
+            )
+
+    for system, seconds in summary["warm_up"].items():
+        lines.append(f"Warm-up of {system}: {seconds:.1f} s")
+
+    if summary["slowest"]:
+        lines.append("Slowest tasks:")
+    for fields in summary["slowest"]:
+        lines.append(
+            f"    {task_label(fields)} ic={fields['ic']}: {fields['wall']:.2f} s, "
+            f"JIT {fields['jit_compile']:.2f} s, peak RSS "
+            f"{(fields.get('peak_rss') or 0) / 2**20:.0f} MiB"
+        )
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize or convert the traces of profiled runs."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="Rank the hotspots")
+    summary_parser.add_argument("traces", nargs="+")
+    summary_parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest tasks listed"
+    )
+    chrome_parser = subparsers.add_parser(
+        "chrome", help="Convert to the JSON array format of chrome://tracing"
+    )
+    chrome_parser.add_argument("traces", nargs="+")
+    chrome_parser.add_argument("output")
+    args = parser.parse_args()
+
+    events = read_traces(args.traces)
+    if args.command == "summary":
+        print(format_summary(summarize(events, args.top)))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(events, f)
+
+
+if __name__ == "__main__":
+    main()
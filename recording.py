@@ -0,0 +1,80 @@
+"""
+Recording policies of the LDI and SALI histories.
+
+The system scripts store the history of every accepted candidate, one row per
+iteration (or per sample time of the FPU chain), but the analysis only fits
+exponential decays to them and plots them on log axes. A recording policy
+keeps a subset of the rows instead:
+
+- "all": every row (the default, as in the paper);
+- "every": one row out of `stride`;
+- "log": about `per_decade` rows per decade of the row index, so the early
+  iterations are resolved as finely as the late ones on a log axis;
+- "last": the first and the last row only.
+
+The first and last rows are always kept. The histories stop at the iteration
+where the index drops below the threshold, so the last row is the threshold
+crossing (or the end of the sample), and the history length, i.e. the first
+column of the last row, is preserved by every policy. The rows keep their
+first column (the iteration number or the time), so the fits of fitting.py,
+which regress against it, still estimate the same decay rate: exactly the same
+fit for "all", the same rate up to the sampling noise of the LDI for "every",
+and, for "log", a fit that weighs the early iterations more.
+"""
+
+import numpy as np
+
+POLICIES = ("all", "every", "log", "last")
+
+
+def history_times(length, policy="all", stride=10, per_decade=100):
+    """
+    Select the iterations of a history recorded by a policy.
+
+    Parameters:
+    - length: Number of iterations of the history.
+    - policy: "all", "every", "log" or "last" (see the module docstring).
+    - stride: Iterations between two rows of the "every" policy.
+    - per_decade: Rows per decade of the "log" policy.
+
+    Returns:
+    - Sorted 1-based iterations in [1, length], including 1 and length (empty
+      if length is 0). Also usable as the `sample_times` of pynamicalsys.
+    """
+    if policy not in POLICIES:
+        raise ValueError(
+            f"unknown recording policy {policy!r}, expected one of {POLICIES}"
+        )
+    if length <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if policy == "all":
+        times = np.arange(1, length + 1)
+    elif policy == "every":
+        times = np.arange(1, length + 1, stride)
+    elif policy == "log":
+        decades = np.log10(length)
+        num = max(int(np.ceil(decades * per_decade)) + 1, 2)
+        times = np.rint(np.logspace(0, decades, num))
+    else:
+        times = np.array([1, length])
+
+    return np.unique(np.concatenate((times, [1, length]))).astype(np.int64)
+
+
+def thin_history(history, policy="all", stride=10, per_decade=100):
+    """
+    Keep the rows of a history selected by a recording policy.
+
+    Parameters:
+    - history: (n, columns) array with one row per iteration, e.g. from
+      `store.numbered` or the (time, LDI) history of the FPU chain.
+    - policy, stride, per_decade: As in `history_times`.
+
+    Returns:
+    - The selected rows (history itself for the "all" policy).
+    """
+    if policy == "all":
+        return history
+
+    return history[history_times(len(history), policy, stride, per_decade) - 1]
@@ -1,18 +1,36 @@
 """
-This script distributes a given number of initial conditions (`num_ic`) across
-all available CPUs and runs a selected system script in parallel.
+This script runs a given number of initial conditions (`num_ic`) of one or more
+system scripts in parallel on all available CPUs.
 
 Usage:
-    python run_systems.py <num_ic>
+    python run_systems.py <num_ic> [--mode {queue,batch,cluster}] [--workers <n>]
+                                   [--system <n>] [--batch-size <b>]
+                                   [--host <h>] [--port <p>] [--token <t>]
+                                   [--profile <trace>]
 
-How it works:
-1. Determines the total number of logical CPUs available.
-2. Computes how many jobs each CPU should handle.
-3. Splits the jobs into contiguous ranges, one per CPU.
-4. Launches each range as a background process.
-5. Waits for all background processes to finish before exiting.
+Modes:
+    queue (default)
+        Keeps a pool of persistent worker processes and hands out one
+        (system, k, ic) task at a time (see `scheduler.py`). Workers that
+        finish early pick up the next pending task, so the load stays balanced
+        even when the rejection searches take very different times. When all
+        systems are selected, their tasks are interleaved.
 
-When run, the user is prompted to select the system:
+    batch
+        Splits the initial conditions into contiguous ranges, one per CPU, and
+        launches `python <script> <i_ini> <i_end>` for each range. Waits for all
+        the launched processes to finish before exiting. Each process compiles
+        the drivers of its system before running its first task.
+
+With `--batch-size <b>`, the rejection searches of the LDI systems evaluate b
+candidate initial conditions at once, one per thread. This keeps several cores
+busy with fewer workers, e.g. when there are fewer tasks than CPUs.
+
+With `--profile <trace>`, every process appends timing and count events of the
+tasks and of their phases to the trace file (see `profiling.py`), which
+`python profiling.py summary <trace>` turns into a ranking of the hotspots.
+
+When `--system` is not given, the user is prompted to select the system:
     1: Henon map 3D
     2: Logistic map network
     3: FPU (Fermi-Pasta-Ulam)
@@ -22,82 +40,178 @@ When run, the user is prompted to select the system:
     7: Exit
 """
 
-import os
+import argparse
+import subprocess
 import sys
 import numpy as np
+from cluster import run_coordinator
+from parameters import CLUSTER, SYSTEMS
+from profiling import enable as enable_profiling
+from scheduler import available_cpus, interleave_tasks, run_queue
+from warmup import warm_up
 
-# --------------------------
-# Input: number of initial conditions
-# --------------------------
-num_ic = int(sys.argv[1])
-
-# --------------------------
-# User menu
-# --------------------------
-print("Select the system to run:")
-print("1. Henon map 3D")
-print("2. Logistic map network")
-print("3. FPU (Fermi-Pasta-Ulam)")
-print("4. Cat map")
-print("5. Baker map")
-print("6. All")
-print("7. Exit")
-
-try:
-    choice = int(input("Enter system number: "))
-except ValueError:
-    print("Invalid input. Exiting.")
-    sys.exit(1)
-
-# Map user input to script filenames
+# Map user input to script modules
 script_map = {
-    1: "henon_map_3D.py",
-    2: "logistic_map_network.py",
-    3: "fpu.py",
-    4: "cat_map.py",
-    5: "baker_map.py",
+    1: "henon_map_3D",
+    2: "logistic_map_network",
+    3: "fpu",
+    4: "cat_map",
+    5: "baker_map",
 }
 
-# --------------------------
-# Handle choices
-# --------------------------
-if choice == 7:
-    print("Exiting.")
-    sys.exit(0)
-elif choice == 6:
-    scripts_to_run = list(script_map.values())
-elif choice in script_map:
-    scripts_to_run = [script_map[choice]]
-else:
-    print(f"Invalid choice: {choice}")
-    sys.exit(1)
-
-# --------------------------
-# Determine CPU batching
-# --------------------------
-# Number of CPUs available to this process (cross-platform)
-try:
-    # Linux-specific
-    available_cpus = len(os.sched_getaffinity(0))
-except AttributeError:
-    import multiprocessing
-
-    # Fallback for macOS, Windows, or systems without sched_getaffinity
-    available_cpus = multiprocessing.cpu_count()
-jobs_per_CPU = int(np.ceil(num_ic / available_cpus))
-
-# --------------------------
-# Launch batches for each selected script
-# --------------------------
-for script in scripts_to_run:
-    print(f"Running {script} ...")
-    for i in range(0, num_ic, jobs_per_CPU):
-        i_ini = i
-        i_end = min(i + jobs_per_CPU - 1, num_ic - 1)  # avoid going past last IC
-
-        comm = f"python {script} {i_ini} {i_end} &"
-        print(f"$ {comm}")
-        os.system(comm)
-
-# Wait for all background processes to finish
-os.system("wait")
+
+def select_systems(choice):
+    """
+    Translate the menu choice into the list of script modules to run.
+    """
+    if choice is None:
+        # --------------------------
+        # User menu
+        # --------------------------
+        print("Select the system to run:")
+        print("1. Henon map 3D")
+        print("2. Logistic map network")
+        print("3. FPU (Fermi-Pasta-Ulam)")
+        print("4. Cat map")
+        print("5. Baker map")
+        print("6. All")
+        print("7. Exit")
+
+        try:
+            choice = int(input("Enter system number: "))
+        except ValueError:
+            print("Invalid input. Exiting.")
+            sys.exit(1)
+
+    # --------------------------
+    # Handle choices
+    # --------------------------
+    if choice == 7:
+        print("Exiting.")
+        sys.exit(0)
+    elif choice == 6:
+        return list(script_map.values())
+    elif choice in script_map:
+        return [script_map[choice]]
+    else:
+        print(f"Invalid choice: {choice}")
+        sys.exit(1)
+
+
+def run_batches(scripts_to_run, num_ic, num_workers, batch_size=1):
+    """
+    Launch contiguous ranges of initial conditions as separate processes and
+    wait for all of them to finish.
+    """
+    jobs_per_CPU = int(np.ceil(num_ic / num_workers))
+
+    # Populate the on-disk cache of the model kernels once before launching the
+    # batches (each batch process still compiles the drivers)
+    warm_up(scripts_to_run, batch_size)
+
+    processes = []
+    for module in scripts_to_run:
+        script = f"{module}.py"
+        print(f"Running {script} ...")
+        for i in range(0, num_ic, jobs_per_CPU):
+            i_ini = i
+            i_end = min(i + jobs_per_CPU - 1, num_ic - 1)  # avoid going past last IC
+
+            comm = [sys.executable, script, str(i_ini), str(i_end)]
+            if SYSTEMS[module] is not None:
+                comm.append(str(batch_size))
+            print(f"$ {' '.join(comm)}")
+            processes.append(subprocess.Popen(comm))
+
+    # Wait for all launched processes to finish
+    return [process.wait() for process in processes]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the system scripts in parallel on all available CPUs."
+    )
+    parser.add_argument("num_ic", type=int, help="Number of initial conditions")
+    parser.add_argument(
+        "--mode",
+        choices=["queue", "batch", "cluster"],
+        default="queue",
+        help="Work-queue scheduler (default), static contiguous batches or "
+        "coordinator of remote workers",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: available CPUs; cluster "
+        "mode: local workers, none by default)",
+    )
+    parser.add_argument(
+        "--system",
+        type=int,
+        default=None,
+        help="Menu number of the system to run (skips the prompt)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Candidates evaluated at once by the LDI rejection searches",
+    )
+    parser.add_argument(
+        "--host",
+        default=CLUSTER["host"],
+        help="Interface the coordinator listens on (cluster mode)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=CLUSTER["port"],
+        help="Port of the coordinator (cluster mode)",
+    )
+    parser.add_argument(
+        "--token",
+        default="",
+        help="Secret the workers must present (cluster mode)",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Trace file of the profiling events (see profiling.py)",
+    )
+    args = parser.parse_args()
+
+    if args.profile is not None:
+        enable_profiling(args.profile)
+    scripts_to_run = select_systems(args.system)
+    tasks = interleave_tasks(scripts_to_run, args.num_ic)
+    if args.mode == "cluster":
+        failed = run_coordinator(
+            tasks,
+            args.batch_size,
+            args.host,
+            args.port,
+            args.token,
+            args.workers or 0,
+        )
+        if failed:
+            print(f"{len(failed)} task(s) failed")
+            sys.exit(1)
+        return
+
+    num_workers = args.workers if args.workers is not None else available_cpus()
+
+    if args.mode == "batch":
+        return_codes = run_batches(
+            scripts_to_run, args.num_ic, num_workers, args.batch_size
+        )
+        sys.exit(0 if all(code == 0 for code in return_codes) else 1)
+
+    failed = run_queue(tasks, num_workers, args.batch_size)
+    if failed:
+        print(f"{len(failed)} task(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Work-queue scheduler for the system scripts.
+
+Instead of splitting the initial conditions into fixed contiguous chunks, the
+scheduler keeps a pool of persistent worker processes and hands out one
+(system, k, ic) task at a time. Workers that finish early immediately pick up
+the next task, so a handful of slow rejection searches no longer leave the
+remaining cores idle. When several systems are selected, their tasks are
+interleaved so that the machine stays saturated until the very end.
+
+Each system script exposes a `run_task` function that performs a single task:
+`run_task(j, ic)` for the LDI systems and `run_task(ic)` for the SALI systems.
+The selected systems are compiled in the parent process (see `warmup.py`)
+before the workers are forked, so the workers inherit the compiled code and
+reuse the imported script modules for every task.
+"""
+
+import functools
+import importlib
+import itertools
+import multiprocessing
+import os
+import time
+import numba
+from parameters import SYSTEMS
+from indicators import search_summary, format_search_summary
+from warmup import warm_up
+
+
+def available_cpus():
+    """
+    Return the number of CPUs available to this process.
+    """
+    try:
+        # Linux-specific
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Fallback for macOS, Windows, or systems without sched_getaffinity
+        return multiprocessing.cpu_count()
+
+
+def system_tasks(system, num_ic):
+    """
+    List the tasks of a single system in the order the batch scripts run them.
+
+    Parameters:
+    - system: Name of the system script module (a key of SYSTEMS).
+    - num_ic: Number of initial conditions.
+
+    Returns:
+    - List of (system, j, ic) tuples. j is None for the SALI systems.
+    """
+    ks = SYSTEMS[system]
+    if ks is None:
+        return [(system, None, ic) for ic in range(num_ic)]
+
+    return [(system, j, ic) for j in range(len(ks)) for ic in range(num_ic)]
+
+
+def interleave_tasks(systems, num_ic):
+    """
+    Build the task list for several systems, alternating between them.
+
+    Parameters:
+    - systems: List of system script module names.
+    - num_ic: Number of initial conditions per system (and per k).
+
+    Returns:
+    - List of (system, j, ic) tuples.
+    """
+    per_system = [system_tasks(system, num_ic) for system in systems]
+    interleaved = itertools.chain.from_iterable(itertools.zip_longest(*per_system))
+
+    return [task for task in interleaved if task is not None]
+
+
+def describe_task(task):
+    """
+    Return a short human-readable label for a task.
+    """
+    system, j, ic = task
+    if j is None:
+        return f"{system} ic={ic}"
+
+    return f"{system} k={SYSTEMS[system][j]} ic={ic}"
+
+
+def task_status(result, error):
+    """
+    Describe the outcome of a task: "done", with the number of candidates of
+    its rejection search if any, or "FAILED" with the error message.
+    """
+    status = "done" if error is None else f"FAILED ({error})"
+    if result is not None:
+        status += f" after {result['candidates']} candidate(s)"
+
+    return status
+
+
+def print_search_summaries(stats):
+    """
+    Print the combined rejection-search statistics of each (system, j).
+
+    Parameters:
+    - stats: Dictionary mapping (system, j) to the list of dictionaries returned
+      by the `run_task` functions.
+    """
+    for (system, j), system_stats in sorted(stats.items()):
+        summary = format_search_summary(search_summary(system_stats))
+        print(f"{system} k={SYSTEMS[system][j]}: {summary}")
+
+
+def task_done(task):
+    """
+    Return whether a previous run stored the results of a task (see the
+    `task_done` functions of the system scripts).
+    """
+    system, j, ic = task
+    module = importlib.import_module(system)
+    if j is None:
+        return module.task_done(ic)
+
+    return module.task_done(j, ic)
+
+
+def init_worker(num_threads, systems=None, batch_size=1):
+    """
+    Set up a worker process: limit the number of threads used by the batched
+    searches and, if systems are given, compile them in the worker.
+    """
+    numba.set_num_threads(num_threads)
+    if systems is not None:
+        warm_up(systems, batch_size)
+
+
+def run_task(task, batch_size=1):
+    """
+    Execute a single task inside a worker process.
+
+    Parameters:
+    - task: (system, j, ic) tuple.
+    - batch_size: Number of candidates evaluated at once by the rejection
+      searches of the LDI systems.
+
+    Returns:
+    - (task, elapsed, result, error): Wall time of the task in seconds, the
+      value returned by the script's `run_task` (the rejection-search
+      statistics for the LDI systems) and the error message if the task raised,
+      None otherwise.
+    """
+    system, j, ic = task
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        module = importlib.import_module(system)
+        if j is None:
+            result = module.run_task(ic)
+        else:
+            result = module.run_task(j, ic, batch_size)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+
+    return task, time.perf_counter() - start, result, error
+
+
+def run_queue(tasks, num_workers=None, batch_size=1):
+    """
+    Run the tasks on a pool of persistent worker processes.
+
+    Tasks are dispatched one at a time, so idle workers always pull the next
+    pending task. The call blocks until every task has finished, reports
+    progress as tasks complete and, for the LDI systems, summarizes the
+    acceptance rate and the iterations saved by the early abort for each k.
+
+    With batch_size > 1, each rejection search evaluates batch_size candidates
+    at once on several threads, and the available CPUs are split evenly among
+    the workers.
+
+    Parameters:
+    - tasks: List of (system, j, ic) tuples.
+    - num_workers: Number of worker processes (default: available CPUs).
+    - batch_size: Number of candidates evaluated at once by the rejection
+      searches of the LDI systems.
+
+    Returns:
+    - List of the tasks that failed.
+    """
+    if num_workers is None:
+        num_workers = available_cpus()
+    num_workers = max(1, min(num_workers, len(tasks)))
+
+    total = len(tasks)
+    systems = list(dict.fromkeys(task[0] for task in tasks))
+
+    # Compile once here: forked workers inherit the compiled code, and spawned
+    # workers load the model kernels from the on-disk cache populated here
+    for system, elapsed in warm_up(systems, batch_size).items():
+        print(f"Warmed up {system} in {elapsed:.1f} s")
+    num_threads = max(1, available_cpus() // num_workers) if batch_size > 1 else 1
+    initargs = (num_threads,)
+    if multiprocessing.get_start_method() != "fork":
+        initargs = (num_threads, systems, batch_size)
+
+    print(f"Scheduling {total} tasks on {num_workers} workers")
+
+    failed = []
+    stats = {}
+    start = time.perf_counter()
+    with multiprocessing.Pool(num_workers, init_worker, initargs) as pool:
+        results = pool.imap_unordered(
+            functools.partial(run_task, batch_size=batch_size), tasks, chunksize=1
+        )
+        for done, (task, elapsed, result, error) in enumerate(results, start=1):
+            status = task_status(result, error)
+            if result is not None:
+                stats.setdefault(task[:2], []).append(result)
+            print(
+                f"[{done}/{total}] {describe_task(task)} {status} in {elapsed:.1f} s "
+                f"(total {time.perf_counter() - start:.1f} s)",
+                flush=True,
+            )
+            if error is not None:
+                failed.append(task)
+
+    print_search_summaries(stats)
+
+    return failed
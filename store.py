@@ -0,0 +1,348 @@
+"""
+Append-only binary result store.
+
+Each system keeps its results in a single container file (e.g.
+Data/Henon/henon.store) instead of two text files per (k, ic). The container is
+a sequence of records, each one holding a 2D float64 array under a key:
+
+    magic (4 bytes) | key length (uint32) | rows (uint64) | columns (uint64)
+    key (utf-8, zero-padded to a multiple of 8 bytes) | data (little-endian)
+
+Records are only ever appended, each one with a single write on a file opened
+in append mode and under an exclusive lock, so several workers can write to the
+same container concurrently. The keys are the names of the former .dat files
+without the extension (e.g. "henon_ldi_k=2_ic=5") and each record holds the
+same rows and columns as the file, at full precision. If a key is written
+more than once, the last record wins. An incomplete record at the end of the
+file (e.g. from a killed worker) is ignored by the readers and truncated by the
+next append, under the lock (without fcntl, e.g. on Windows, it is left in
+place and hides the records appended after it).
+
+Inside `capture_records()`, `append_records` collects the encoded records
+instead of writing them, so a remote worker (see `cluster.py`) can send the
+results of a task to the coordinator, which appends them with `append_data`.
+
+Usage:
+    python store.py <directory> [<directory> ...]
+
+    converts the .dat files of existing data directories (e.g. Data/Henon)
+    into containers, leaving the text files untouched.
+"""
+
+import contextlib
+import glob
+import os
+import struct
+import sys
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: rely on the atomicity of appends
+    fcntl = None
+
+MAGIC = b"AIR1"
+HEADER = struct.Struct("<4sIQQ")
+DTYPE = np.dtype("<f8")
+
+# List of the (filename, data) pairs collected by `capture_records`, if active
+_captured = None
+
+# Index of each container scanned by this process (see `container_index`):
+# filename -> (inode, size, mtime, end of the complete records, index)
+_indices = {}
+
+# Container of each data directory, named after the prefix of its .dat files
+STORE_NAMES = {
+    "Henon": "henon",
+    "LogisticMapNetwork": "lmn",
+    "FPU": "fpu",
+    "CatMap": "catmap",
+    "BakerMap": "bakermap",
+}
+
+
+def store_file(path, name):
+    """
+    Return the file name of the container of a data directory.
+
+    Parameters:
+    - path: Data directory (e.g. HENON["path"]).
+    - name: Prefix of the record keys (e.g. "henon").
+    """
+    return os.path.join(path, f"{name}.store")
+
+
+def numbered(values):
+    """
+    Prepend the 1-based index column to a sequence of values, as in the .dat
+    files of the LDI, SALI and Lyapunov values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+
+    return np.column_stack((np.arange(1, len(values) + 1), values))
+
+
+def encode_record(key, array):
+    """
+    Serialize a record.
+
+    Parameters:
+    - key: Name of the record.
+    - array: 1D or 2D array; 1D arrays are stored as a single column.
+
+    Returns:
+    - Bytes of the record.
+    """
+    array = np.asarray(array, dtype=DTYPE)
+    if array.ndim == 1:
+        array = array[:, None]
+    key = key.encode()
+    padding = -len(key) % 8
+    header = HEADER.pack(MAGIC, len(key), array.shape[0], array.shape[1])
+
+    return header + key + b"\0" * padding + np.ascontiguousarray(array).tobytes()
+
+
+def append_records(filename, records):
+    """
+    Append records to a container, creating it if needed.
+
+    All the records are written at once, so the records of a task (e.g. its LDI
+    history and Lyapunov exponents) are either all stored or not at all.
+
+    Parameters:
+    - filename: Container file.
+    - records: Iterable of (key, array) pairs.
+    """
+    data = b"".join(encode_record(key, array) for key, array in records)
+    if _captured is not None:
+        _captured.append((filename, data))
+        return
+
+    append_data(filename, data)
+
+
+def record_keys(data):
+    """
+    Return the keys of encoded records (see `encode_record`).
+    """
+    keys = []
+    offset = 0
+    while offset < len(data):
+        magic, key_length, rows, columns = HEADER.unpack_from(data, offset)
+        if magic != MAGIC:
+            raise ValueError(f"corrupt record at byte {offset}")
+        start = offset + HEADER.size
+        keys.append(bytes(data[start : start + key_length]).decode())
+        offset = start + key_length + (-key_length % 8)
+        offset += rows * columns * DTYPE.itemsize
+
+    return keys
+
+
+def append_data(filename, data, skip_stored=False):
+    """
+    Append encoded records (see `encode_record`) to a container in a single
+    write, creating it if needed. An incomplete record at the end of the
+    container is truncated first.
+
+    Parameters:
+    - filename: Container file.
+    - data: Encoded records.
+    - skip_stored: Whether to write nothing if the container already holds
+      every key of data, e.g. the records of a task sent again after its
+      first completion was lost.
+
+    Returns:
+    - Whether data was written.
+    """
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Drop the incomplete record left by a killed writer, which would
+            # otherwise swallow the records appended after it
+            end, _ = container_index(filename)
+            if end < os.fstat(fd).st_size:
+                os.ftruncate(fd, end)
+        if skip_stored:
+            _, index = container_index(filename)
+            if all(key in index for key in record_keys(data)):
+                return False
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        # Closing the file also releases the lock
+        os.close(fd)
+
+    return True
+
+
+@contextlib.contextmanager
+def capture_records():
+    """
+    Collect the records appended in the block instead of writing them.
+
+    Yields:
+    - List that receives a (filename, data) pair for each `append_records`
+      call, data being the encoded records.
+    """
+    global _captured
+    previous, _captured = _captured, []
+    try:
+        yield _captured
+    finally:
+        _captured = previous
+
+
+def scan_records(f, offset, size, index):
+    """
+    Add the complete records of an open container, from offset to size, to
+    index.
+
+    Returns:
+    - End of the last complete record.
+    """
+    while offset + HEADER.size <= size:
+        f.seek(offset)
+        magic, key_length, rows, columns = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{f.name}: corrupt record at byte {offset}")
+        key = f.read(key_length).decode()
+        data = offset + HEADER.size + key_length + (-key_length % 8)
+        end = data + rows * columns * DTYPE.itemsize
+        if end > size:
+            # Incomplete record at the end of the file
+            break
+        index[key] = (data, rows, columns)
+        offset = end
+
+    return offset
+
+
+def container_index(filename):
+    """
+    Return the index of a container, scanning only the records appended since
+    the last call for the same file.
+
+    Records are only ever appended after the complete ones, so the index of the
+    previous scan stays valid as long as the file is the same (same inode) and
+    not shorter than its complete records.
+
+    Returns:
+    - (end, index): End of the last complete record and index as in
+      `read_index`. The index is shared with later calls and must not be
+      modified.
+    """
+    stat = os.stat(filename)
+    cached = _indices.get(filename)
+    if cached is not None and cached[0] == stat.st_ino and stat.st_size >= cached[3]:
+        _, size, mtime, end, index = cached
+        if (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+            return end, index
+    else:
+        end, index = 0, {}
+
+    with open(filename, "rb") as f:
+        end = scan_records(f, end, stat.st_size, index)
+    _indices[filename] = (stat.st_ino, stat.st_size, stat.st_mtime_ns, end, index)
+
+    return end, index
+
+
+def read_index(filename):
+    """
+    Scan the record headers of a container.
+
+    Parameters:
+    - filename: Container file.
+
+    Returns:
+    - Dictionary mapping each key to the (offset, rows, columns) of the data of
+      its last complete record, in the order the keys were first written.
+    """
+    return dict(container_index(filename)[1])
+
+
+def has_record(filename, key):
+    """
+    Return whether a container exists and holds a complete record of key.
+
+    Only the records appended since the previous call are scanned, so checking
+    every task of a campaign against the same container takes linear time.
+    """
+    return os.path.exists(filename) and key in container_index(filename)[1]
+
+
+def load_records(filename, keys, index=None):
+    """
+    Read records from a container.
+
+    Parameters:
+    - filename: Container file.
+    - keys: Names of the records.
+    - index: Index returned by `read_index` (read from the file if None).
+
+    Returns:
+    - List of (rows, columns) arrays, in the order of keys.
+    """
+    if index is None:
+        index = read_index(filename)
+
+    arrays = []
+    with open(filename, "rb") as f:
+        for key in keys:
+            offset, rows, columns = index[key]
+            f.seek(offset)
+            array = np.fromfile(f, dtype=DTYPE, count=rows * columns)
+            arrays.append(array.reshape(rows, columns))
+
+    return arrays
+
+
+def load_record(filename, key):
+    """
+    Read a single record from a container.
+    """
+    return load_records(filename, [key])[0]
+
+
+def convert_directory(path, name=None):
+    """
+    Append the .dat files of a data directory to its container.
+
+    Files whose key is already in the container are skipped, so an interrupted
+    conversion can be resumed.
+
+    Parameters:
+    - path: Data directory.
+    - name: Prefix of the record keys (default: from STORE_NAMES).
+
+    Returns:
+    - (filename, converted): Container file and number of files converted.
+    """
+    if name is None:
+        name = STORE_NAMES[os.path.basename(os.path.normpath(path))]
+    filename = store_file(path, name)
+    done = read_index(filename) if os.path.exists(filename) else {}
+
+    converted = 0
+    for dat in sorted(glob.glob(os.path.join(path, f"{name}_*.dat"))):
+        key = os.path.splitext(os.path.basename(dat))[0]
+        if key in done:
+            continue
+        array = np.loadtxt(dat, dtype=np.float64, ndmin=2)
+        append_records(filename, [(key, array)])
+        converted += 1
+
+    return filename, converted
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        filename, converted = convert_directory(path)
+        print(f"{path}: converted {converted} file(s) into {filename}")
@@ -0,0 +1,332 @@
+"""
+Streaming orbits of the maps and constant-memory reductions over them.
+
+`ds.trajectory` materializes the whole orbit (sample_size x dimension values)
+even when only its bounds, a histogram or a few thousand points for a plot are
+needed. `orbit_chunks` instead yields the orbit of any map of models.py in
+fixed-size blocks, filled by a compiled loop into a single reused buffer, with
+the same states as `ds.trajectory(u, total_time, parameters=parameters,
+transient_time=transient_time)`. The reducers below consume the blocks one at
+a time:
+
+- `Bounds`: componentwise minimum and maximum;
+- `Histogram`: histogram of selected components over fixed bins;
+- `Moments`: mean, variance and covariance (combined block by block, which is
+  numerically stable);
+- `Decimated`: evenly spaced samples of the orbit, at most max_samples of
+  them, for plotting (the stride doubles whenever the buffer fills up, so the
+  length of the orbit need not be known in advance);
+- `Tail`: the last states of the orbit.
+
+`reduce_orbit` feeds every block to several reducers, so one pass over the
+orbit gives all of them:
+
+    bounds, samples = reduce_orbit(
+        orbit_chunks(u, parameters, henon_map_3D, total_time, transient_time),
+        Bounds(),
+        Decimated(10**5),
+    )
+"""
+
+import numpy as np
+from numba import njit
+from indicators import post_transient
+
+# Default number of states per block
+CHUNK_SIZE = 65536
+
+
+@njit(nogil=True)
+def fill_orbit(u, parameters, out, mapping, mapping_inplace=None):
+    """
+    Iterate the mapping out.shape[0] times from u, writing each new state into
+    a row of out.
+
+    If an in-place mapping `mapping_inplace(u, parameters, out)` is given, it
+    writes the states directly into the rows of out.
+
+    Returns:
+    - Last state (a copy, so out can be reused).
+    """
+    for n in range(out.shape[0]):
+        if mapping_inplace is None:
+            u = mapping(u, parameters)
+            out[n] = u
+        else:
+            mapping_inplace(u, parameters, out[n])
+            u = out[n]
+
+    return u.copy()
+
+
+def orbit_chunks(
+    u,
+    parameters,
+    mapping,
+    total_time,
+    transient_time=0,
+    chunk_size=CHUNK_SIZE,
+    mapping_inplace=None,
+    copy=False,
+    transients=None,
+):
+    """
+    Generate the orbit of a map in blocks of consecutive states.
+
+    Parameters:
+    - u: Initial condition.
+    - parameters: Parameters of the map.
+    - mapping: Map kernel (see models.py).
+    - total_time: Total number of iterations, including the transient.
+    - transient_time: Number of iterations discarded before the first state.
+    - chunk_size: Number of states per block (the last one may be shorter).
+    - mapping_inplace: Optional in-place variant of the map (see models.py).
+    - copy: Whether to yield a new array for every block. By default the same
+      buffer is refilled, so a block is only valid until the next one is
+      generated.
+    - transients: Optional `TransientCache` (see transient_cache.py) holding
+      the post-transient state of u.
+
+    Yields:
+    - (rows, dimension) arrays of states.
+    """
+    parameters = np.array(parameters, dtype=np.float64)
+    u = post_transient(
+        u, parameters, transient_time, mapping, mapping_inplace, transients
+    )
+
+    buffer = np.empty((chunk_size, len(u)))
+    remaining = total_time - transient_time
+    while remaining > 0:
+        chunk = buffer[: min(chunk_size, remaining)]
+        u = fill_orbit(u, parameters, chunk, mapping, mapping_inplace)
+        remaining -= len(chunk)
+        yield chunk.copy() if copy else chunk
+
+
+def reduce_orbit(chunks, *reducers):
+    """
+    Feed every block of an orbit to the reducers.
+
+    Parameters:
+    - chunks: Iterable of blocks (e.g. from `orbit_chunks`).
+    - reducers: Objects with `update(chunk)` and `result()` methods.
+
+    Returns:
+    - Result of each reducer: a single value for one reducer, a tuple
+      otherwise.
+    """
+    for chunk in chunks:
+        for reducer in reducers:
+            reducer.update(chunk)
+
+    results = tuple(reducer.result() for reducer in reducers)
+
+    return results[0] if len(results) == 1 else results
+
+
+class Bounds:
+    """
+    Componentwise minimum and maximum of the states.
+    """
+
+    def __init__(self):
+        self.lower = None
+        self.upper = None
+
+    def update(self, chunk):
+        lower, upper = chunk.min(axis=0), chunk.max(axis=0)
+        if self.lower is None:
+            self.lower, self.upper = lower, upper
+        else:
+            np.minimum(self.lower, lower, out=self.lower)
+            np.maximum(self.upper, upper, out=self.upper)
+
+    def result(self):
+        """
+        Returns:
+        - (lower, upper): Arrays of the smallest and largest value of each
+          component.
+        """
+        return self.lower, self.upper
+
+
+class Histogram:
+    """
+    Histogram of selected components of the states.
+
+    Parameters:
+    - bins: Number of bins of each component (or a sequence of them).
+    - limits: [lower, upper] bounds of each component (e.g. from `Bounds` over
+      a shorter orbit). States outside them are not counted.
+    - columns: Components of the histogram (default: all of them).
+    - density: Whether `result` normalizes the counts to a probability
+      density.
+    """
+
+    def __init__(self, bins, limits, columns=None, density=False):
+        limits = np.atleast_2d(np.asarray(limits, dtype=np.float64))
+        self.columns = list(range(len(limits))) if columns is None else list(columns)
+        bins = np.broadcast_to(bins, len(self.columns))
+        self.edges = [np.linspace(lo, hi, b + 1) for (lo, hi), b in zip(limits, bins)]
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.density = density
+
+    def update(self, chunk):
+        counts, _ = np.histogramdd(chunk[:, self.columns], bins=self.edges)
+        self.counts += counts.astype(np.int64)
+
+    def result(self):
+        """
+        Returns:
+        - (histogram, edges): Counts (or density) and the bin edges of each
+          component.
+        """
+        if not self.density:
+            return self.counts, self.edges
+
+        # Volume of each bin
+        volume = np.ones(self.counts.shape)
+        for i, edges in enumerate(self.edges):
+            shape = [1] * len(self.edges)
+            shape[i] = -1
+            volume = volume * np.diff(edges).reshape(shape)
+
+        return self.counts / max(self.counts.sum(), 1) / volume, self.edges
+
+
+class Moments:
+    """
+    Mean, variance and covariance of the states.
+
+    The statistics of each block are combined with those of the previous
+    blocks (Chan et al.), which avoids the cancellation of the sums of squares
+    over long orbits.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.scatter = None
+
+    def update(self, chunk):
+        n = len(chunk)
+        if n == 0:
+            return
+        mean = chunk.mean(axis=0)
+        centered = chunk - mean
+        scatter = centered.T @ centered
+        if self.count == 0:
+            self.count, self.mean, self.scatter = n, mean, scatter
+            return
+
+        total = self.count + n
+        delta = mean - self.mean
+        self.scatter += scatter + np.outer(delta, delta) * (self.count * n / total)
+        self.mean = self.mean + delta * (n / total)
+        self.count = total
+
+    def result(self):
+        """
+        Returns:
+        - Dictionary with the number of states "count", and their "mean",
+          "variance" and "covariance" (normalized by count).
+        """
+        covariance = self.scatter / self.count
+
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": np.diag(covariance).copy(),
+            "covariance": covariance,
+        }
+
+
+class Decimated:
+    """
+    Evenly spaced samples of the orbit, for plotting.
+
+    The states with index 0, stride, 2 * stride, ... are kept, starting with
+    stride = 1. When a state must be kept and max_samples states already are,
+    every other one is dropped and the stride doubles, so at most max_samples
+    states are held whatever the length of the orbit (all of them if the orbit
+    is not longer than max_samples, and at least max_samples / 2 otherwise).
+
+    Parameters:
+    - max_samples: Largest number of samples kept (at least 2).
+    """
+
+    def __init__(self, max_samples):
+        if max_samples < 2:
+            raise ValueError("max_samples must be at least 2")
+        self.max_samples = max_samples
+        self.samples = None
+        self.count = 0
+        self.stride = 1
+        self.position = 0
+
+    def update(self, chunk):
+        if self.samples is None:
+            self.samples = np.empty((self.max_samples, chunk.shape[1]))
+
+        # Keep the states of the chunk whose index in the orbit is a multiple
+        # of the stride, from offset on
+        offset = 0
+        while offset < len(chunk):
+            first = offset + (-(self.position + offset) % self.stride)
+            rows = chunk[first :: self.stride]
+            if len(rows) and self.count == self.max_samples:
+                # Full buffer: drop every other sample and double the stride
+                kept = self.samples[: self.count : 2].copy()
+                self.count = len(kept)
+                self.samples[: self.count] = kept
+                self.stride *= 2
+                continue
+
+            rows = rows[: self.max_samples - self.count]
+            self.samples[self.count : self.count + len(rows)] = rows
+            self.count += len(rows)
+            offset = first + len(rows) * self.stride
+            if len(rows) == 0:
+                break
+        self.position += len(chunk)
+
+    def result(self):
+        """
+        Returns:
+        - (indices, samples): Index in the orbit (0 for the first state) and
+          value of each sample.
+        """
+        indices = np.arange(self.count) * self.stride
+
+        return indices, self.samples[: self.count].copy()
+
+
+class Tail:
+    """
+    Last states of the orbit.
+
+    Parameters:
+    - size: Number of states kept.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.samples = None
+        self.count = 0
+
+    def update(self, chunk):
+        if self.samples is None:
+            self.samples = np.empty((self.size, chunk.shape[1]))
+        chunk = chunk[-self.size :]
+        n = len(chunk)
+        self.samples[: self.size - n] = self.samples[n:].copy()
+        self.samples[self.size - n :] = chunk
+        self.count = min(self.count + n, self.size)
+
+    def result(self):
+        """
+        Returns:
+        - (min(size, length of the orbit), dimension) array of the last states.
+        """
+        return self.samples[self.size - self.count :].copy()
@@ -0,0 +1,54 @@
+import numpy as np
+from candidate_cache import CandidateCache, candidate_key
+from indicators import ldi_lyapunov_batch
+from models import logistic_map_network, logistic_map_network_jacobian
+
+PARAMETERS = [3.8, 0.15, 0.15, 10]
+
+
+def search(U, interval, cache=None):
+    return ldi_lyapunov_batch(
+        U,
+        3000,
+        3,
+        PARAMETERS,
+        logistic_map_network,
+        logistic_map_network_jacobian,
+        interval,
+        transient_time=1000,
+        seed=2,
+        cache=cache,
+    )
+
+
+def test_cache_hits_give_the_same_search(tmp_path):
+    rng = np.random.default_rng(5)
+    U = rng.uniform(0, 1, 10) + 1e-3 * rng.random((6, 10))
+    cache = CandidateCache(str(tmp_path / "cache.sqlite"), 2**20)
+    first = search(U, [1, 2000], cache)
+
+    # With a new interval, the candidates that the cache proves to be rejected
+    # are not integrated again, and the outcome is unchanged
+    lengths = [len(search([u], [1, 2000])[1]) for u in U]
+    interval = [lengths[3], lengths[3]]
+    expected = search(U, interval)
+    cached = search(U, interval, cache)
+    assert cached[0] == expected[0] == lengths.index(lengths[3])
+    assert cached[2] < expected[2]
+    np.testing.assert_array_equal(cached[1], expected[1])
+    np.testing.assert_array_equal(cached[3], expected[3])
+    np.testing.assert_array_equal(search(U, [1, 2000], cache)[3], first[3])
+    cache.close()
+
+
+def test_keys_depend_on_kernel_source():
+    def kernel(u, parameters):
+        return u
+
+    key = candidate_key(kernel, [1.0, 2.0], 3)
+
+    def kernel(u, parameters):
+        return 2 * u
+
+    assert candidate_key(kernel, [1.0, 2.0], 3) != key
+    assert candidate_key(kernel, [1.0, 2.0], 3) == candidate_key(kernel, [1, 2], 3)
@@ -0,0 +1,115 @@
+import importlib
+import numpy as np
+import pytest
+from checkpoint import Checkpoint, checkpoint_file, CHECKPOINT_STEPS
+from indicators import ldi_lyapunov_batch, search_summary
+from models import henon_map_3D, henon_map_3D_jacobian
+from parameters import HENON
+from store import has_record, load_record
+
+
+class Preempted(Exception):
+    pass
+
+
+class PreemptedCheckpoint(Checkpoint):
+    """
+    Checkpoint that is always written, and whose task is killed after a given
+    number of writes.
+    """
+
+    def __init__(self, filename, writes):
+        super().__init__(filename, interval=0)
+        self.writes = writes
+
+    def save(self, state, force=False):
+        if self.writes == 0:
+            raise Preempted
+        self.writes -= 1
+        return super().save(state, force)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    filename = checkpoint_file(str(tmp_path), "henon_k=2_ic=0")
+    checkpoint = Checkpoint(filename, interval=3600)
+    assert checkpoint.load() == {}
+
+    # Writes are throttled unless forced
+    assert not checkpoint.save({"count": 1})
+    assert checkpoint.save({"count": 2, "u": np.arange(3.0)}, force=True)
+    state = Checkpoint(filename).load()
+    assert int(state["count"]) == 2
+    np.testing.assert_array_equal(state["u"], np.arange(3.0))
+
+    checkpoint.remove()
+    assert Checkpoint(filename).load() == {}
+
+
+def test_driver_resumes_bit_identically(tmp_path):
+    u = np.array(HENON["u0"]) + 1e-4
+    parameters = np.array(HENON["parameters"], dtype=float)
+    sample_size = 3 * CHECKPOINT_STEPS + 500
+    arguments = (
+        [u],
+        1000 + sample_size,
+        2,
+        parameters,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+        [0, sample_size],
+    )
+    expected = ldi_lyapunov_batch(*arguments, transient_time=1000, seed=2)
+
+    # Preempt a run that writes its checkpoint at every opportunity, and
+    # resume from the last state it wrote
+    filename = checkpoint_file(str(tmp_path), "resume")
+    with pytest.raises(Preempted):
+        ldi_lyapunov_batch(
+            *arguments,
+            transient_time=1000,
+            seed=2,
+            checkpoint=PreemptedCheckpoint(filename, writes=2),
+        )
+    checkpoint = Checkpoint(filename)
+    assert 0 < int(checkpoint.load()["done"]) < sample_size
+    resumed = ldi_lyapunov_batch(
+        *arguments, transient_time=1000, seed=2, checkpoint=checkpoint
+    )
+
+    assert resumed[0] == expected[0]
+    np.testing.assert_array_equal(resumed[1], expected[1])
+    np.testing.assert_array_equal(resumed[3], expected[3])
+
+
+@pytest.fixture
+def henon_script(tmp_path, monkeypatch):
+    """
+    The Hénon script, writing into tmp_path, with a short sample and an
+    interval that accepts every candidate.
+    """
+    monkeypatch.chdir(tmp_path)
+    module = importlib.reload(importlib.import_module("henon_map_3D"))
+    monkeypatch.setattr(module, "transient_time", 100)
+    monkeypatch.setattr(module, "total_time", 2100)
+    monkeypatch.setattr(module, "intervals", [[1, 2000], [1, 2000]])
+
+    return module
+
+
+def test_script_skips_and_resumes_tasks(henon_script):
+    # A preempted search that had rejected two candidates resumes with the
+    # third one
+    path = henon_script.path
+    Checkpoint(checkpoint_file(path, "henon_k=2_ic=0")).save({"count": 2}, force=True)
+    stats = henon_script.run_task(0, 0)
+    assert stats["candidates"] == 3
+    assert has_record(henon_script.results_file, "henon_ldi_k=2_ic=0")
+    history = load_record(henon_script.results_file, "henon_ldi_k=2_ic=0")
+
+    # A rerun skips the stored task and still runs the others
+    stats = [henon_script.run_task(0, 0), henon_script.run_task(1, 0)]
+    assert stats[0] is None
+    assert search_summary(stats)["tasks"] == 1
+    np.testing.assert_array_equal(
+        load_record(henon_script.results_file, "henon_ldi_k=2_ic=0"), history
+    )
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import cat_map
+from parameters import CATMAP
+from cluster import Coordinator, run_coordinator
+from scheduler import system_tasks
+from store import load_record, read_index
+
+
+def test_local_workers_store_the_tasks(tmp_path, monkeypatch, capsys):
+    # Reference results of a local run
+    os.makedirs(tmp_path / "local" / CATMAP["path"])
+    monkeypatch.chdir(tmp_path / "local")
+    for ic in range(4):
+        cat_map.run_task(ic)
+    reference = os.path.abspath(cat_map.results_file)
+
+    # The workers run in the current directory and the coordinator writes the
+    # records to its result store
+    os.makedirs(tmp_path / "cluster")
+    monkeypatch.chdir(tmp_path / "cluster")
+    tasks = system_tasks("cat_map", 3)
+    assert run_coordinator(tasks, port=0, local_workers=2) == []
+    keys = [f"catmap_sali_ic={ic}" for ic in range(3)]
+    assert sorted(read_index(cat_map.results_file)) == keys
+    for key in keys:
+        np.testing.assert_array_equal(
+            load_record(cat_map.results_file, key), load_record(reference, key)
+        )
+
+    # A rerun only hands out the tasks whose records are missing
+    tasks = system_tasks("cat_map", 4)
+    assert list(Coordinator(tasks).pending) == [("cat_map", None, 3)]
+    capsys.readouterr()
+    assert run_coordinator(tasks, port=0, local_workers=2) == []
+    output = capsys.readouterr().out
+    assert "Skipping 3 task(s) already stored" in output
+    assert "[1/1] cat_map ic=3 done" in output
+    size = os.path.getsize(cat_map.results_file)
+    assert len(read_index(cat_map.results_file)) == 4
+    np.testing.assert_array_equal(
+        load_record(cat_map.results_file, "catmap_sali_ic=3"),
+        load_record(reference, "catmap_sali_ic=3"),
+    )
+
+    # Nothing is left to do, and nothing is appended
+    assert run_coordinator(tasks, port=0, local_workers=2) == []
+    assert os.path.getsize(cat_map.results_file) == size
+
+    # Lost results are computed again
+    os.remove(cat_map.results_file)
+    assert list(Coordinator(tasks).pending) == tasks
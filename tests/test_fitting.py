@@ -0,0 +1,42 @@
+import numpy as np
+from fitting import fit_exponential, sum_of_differences
+from utils import propagate_error
+
+
+def histories(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    result = []
+    for n in lengths:
+        x = np.arange(1.0, n + 1)
+        y = np.exp(-0.05 * x + 1 + rng.normal(0, 0.2, n))
+        y[rng.random(n) < 0.05] = 0.0  # Non-positive values are skipped
+        result.append(np.column_stack((x, y)))
+    return result
+
+
+def test_fit_matches_polyfit():
+    data = histories([40, 300, 7, 1000])
+    coeffs, errors = fit_exponential(data, chunk_size=3, return_errors=True)
+
+    np.testing.assert_array_equal(fit_exponential(data, chunk_size=3), coeffs)
+    for history, c, e in zip(data, coeffs, errors):
+        x, y = history[history[:, 1] > 0].T
+        p, cov = np.polyfit(x, np.log(y), 1, cov="unscaled")
+        residuals = np.log(y) - np.polyval(p, x)
+        variance = residuals @ residuals / (len(x) - 2)
+        np.testing.assert_allclose(c, p, rtol=1e-9)
+        np.testing.assert_allclose(e, np.sqrt(variance * np.diag(cov)), rtol=1e-9)
+
+
+def test_sum_of_differences_propagation():
+    exponents = np.random.default_rng(1).normal([0.5, 0.2, 0.0, -0.3], 0.01, (50, 4))
+    total, error = sum_of_differences(exponents, 3)
+
+    mean = exponents.mean(axis=0)
+    std = exponents.std(axis=0, ddof=1)
+    errors = [
+        propagate_error(lambda a, b: a - b, [mean[0], mean[j]], [std[0], std[j]])[1]
+        for j in (1, 2)
+    ]
+    np.testing.assert_allclose(total, 2 * mean[0] - mean[1] - mean[2])
+    np.testing.assert_allclose(error, sum(errors), rtol=1e-6)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from pynamicalsys import DiscreteDynamicalSystem as dds
+from indicators import alignment_index_grid
+from models import (
+    baker_map,
+    baker_map_jacobian,
+    cat_map,
+    cat_map_jacobian,
+    henon_map_3D,
+    henon_map_3D_jacobian,
+)
+from parameters import BAKERMAP, CATMAP, HENON
+
+GRID = (np.arange(4) + 0.5) / 4
+
+
+def per_point(ds, index, k, u, total_time, **kwargs):
+    # Length and last value of the history of a single point
+    if index == "sali":
+        history = ds.SALI(u, total_time, return_history=True, **kwargs)
+    else:
+        history = ds.GALI(u, total_time, k, return_history=True, **kwargs)
+    history = np.ravel(history)
+    history = history[history > 0]
+
+    return len(history), history[-1]
+
+
+@pytest.mark.parametrize(
+    "mapping, jacobian, parameters, tol",
+    [
+        (cat_map, cat_map_jacobian, None, CATMAP["SALI_threshold"]),
+        (baker_map, baker_map_jacobian, BAKERMAP["parameters"], 1e-16),
+    ],
+)
+def test_grid_matches_sali_at_the_threshold(mapping, jacobian, parameters, tol):
+    # Constant Jacobians: every point has the same history as ds.SALI, down to
+    # the threshold of the grid mode
+    ds = dds(
+        mapping=mapping,
+        jacobian=jacobian,
+        system_dimension=2,
+        number_of_parameters=0 if parameters is None else len(parameters),
+    )
+    times, values = alignment_index_grid(
+        GRID, GRID, 1000, parameters, mapping, jacobian, tol=tol
+    )
+    kwargs = {} if parameters is None else {"parameters": np.array(parameters)}
+    for i, y in enumerate(GRID):
+        for j, x in enumerate(GRID):
+            n, value = per_point(ds, "sali", 2, [x, y], 1000, tol=tol, **kwargs)
+            assert times[i, j] == n
+            assert values[i, j] == pytest.approx(value, rel=1e-12)
+
+
+@pytest.mark.parametrize(
+    "index, k, tol", [("sali", 2, 1e-8), ("gali", 2, 1e-5), ("gali", 3, 1e-5)]
+)
+def test_grid_matches_per_point_indices(index, k, tol):
+    # Slice of the Hénon map, whose Jacobian depends on the state. The
+    # thresholds stay above the round-off floor of the SALI and above the
+    # resolution of ds.GALI, so the crossings do not depend on round-off.
+    u0 = np.array(HENON["u0"])
+    parameters = np.array(HENON["parameters"], dtype=float)
+    x = u0[0] + 1e-3 * np.arange(3)
+    y = u0[1] + 1e-3 * np.arange(3)
+    ds = dds(
+        mapping=henon_map_3D,
+        jacobian=henon_map_3D_jacobian,
+        system_dimension=3,
+        number_of_parameters=3,
+    )
+    times, values = alignment_index_grid(
+        x,
+        y,
+        3000,
+        parameters,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+        index=index,
+        k=k,
+        base=u0,
+        transient_time=100,
+        tol=tol,
+    )
+    assert len(np.unique(times)) > 1
+    for i in range(len(y)):
+        for j in range(len(x)):
+            u = u0.copy()
+            u[:2] = x[j], y[i]
+            n, value = per_point(
+                ds,
+                index,
+                k,
+                u,
+                3000,
+                parameters=parameters,
+                transient_time=100,
+                tol=tol,
+            )
+            assert times[i, j] == n
+            assert values[i, j] == pytest.approx(value, rel=1e-5)
@@ -0,0 +1,212 @@
+import numpy as np
+from pynamicalsys import ContinuousDynamicalSystem as cds
+from pynamicalsys import DiscreteDynamicalSystem as dds
+from indicators import (
+    flow_ldi_lyapunov_batch,
+    initial_deviation_vectors,
+    ldi_lyapunov_batch,
+    multi_ldi_lyapunov_batch,
+)
+from models import (
+    fermi_pasta_ulam,
+    fermi_pasta_ulam_jacobian,
+    henon_map_3D,
+    henon_map_3D_jacobian,
+    logistic_map_network_jacobian,
+    logistic_map_network_synchronous,
+)
+from parameters import HENON, LOGISTIC_MAP_NETWORK
+
+TRANSIENT_TIME = 1000
+SAMPLE_SIZE = 5000
+
+
+def henon_candidate():
+    return np.array(HENON["u0"]) + 1e-4, np.array(HENON["parameters"], dtype=float)
+
+
+def test_fused_map_driver_matches_pynamicalsys():
+    u, parameters = henon_candidate()
+    ds = dds(
+        mapping=henon_map_3D,
+        jacobian=henon_map_3D_jacobian,
+        system_dimension=3,
+        number_of_parameters=3,
+    )
+    total_time = TRANSIENT_TIME + SAMPLE_SIZE
+    ldi = np.ravel(
+        ds.LDI(
+            u,
+            total_time,
+            2,
+            parameters=parameters,
+            transient_time=TRANSIENT_TIME,
+            return_history=True,
+            seed=2,
+        )
+    )
+    exponents = ds.lyapunov(
+        u, total_time, parameters=parameters, transient_time=TRANSIENT_TIME
+    )
+
+    index, history, _, fused = ldi_lyapunov_batch(
+        [u],
+        total_time,
+        2,
+        parameters,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+        [0, SAMPLE_SIZE],
+        transient_time=TRANSIENT_TIME,
+        seed=2,
+    )
+
+    assert index == 0
+    np.testing.assert_allclose(fused, exponents, rtol=1e-12, atol=1e-15)
+    # The LDI agrees up to round-off, which grows relative to the LDI as it
+    # approaches the threshold, so the crossing may move by a few iterations
+    above = ldi[: len(history)] > 1e-8
+    np.testing.assert_allclose(history[above], ldi[: len(history)][above], rtol=1e-6)
+    crossing = np.argmax(ldi < 1e-16) + 1
+    assert abs(len(history) - crossing) <= 0.01 * crossing
+
+
+def test_batch_returns_first_accepted_candidate():
+    u, parameters = henon_candidate()
+    U = [u + 1e-3 * np.random.default_rng(i).random(3) for i in range(4)]
+    arguments = (
+        TRANSIENT_TIME + SAMPLE_SIZE,
+        2,
+        parameters,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+    )
+    lengths = [
+        len(ldi_lyapunov_batch([v], *arguments, [0, SAMPLE_SIZE], TRANSIENT_TIME)[1])
+        for v in U
+    ]
+    # Accept the history length of the third candidate only
+    interval = [lengths[2], lengths[2]]
+    expected = lengths.index(lengths[2])
+
+    index, history, _, _ = ldi_lyapunov_batch(U, *arguments, interval, TRANSIENT_TIME)
+    assert index == expected
+    assert len(history) == lengths[expected]
+
+
+def separate_ldi(u, parameters, mapping, jacobian, v, max_time, tol=1e-16):
+    # LDI history of the deviation vectors v alone, as computed by ds.LDI
+    history = []
+    while len(history) < max_time:
+        u = mapping(u, parameters)
+        v = jacobian(u, parameters) @ v
+        v /= np.linalg.norm(v, axis=0)
+        history.append(np.prod(np.linalg.svd(v, compute_uv=False)))
+        if history[-1] < tol:
+            break
+
+    return np.array(history)
+
+
+def assert_same_ldi(history, reference):
+    # Agreement up to round-off, which grows relative to the LDI as it
+    # approaches the threshold: the values agree well above it, and so do the
+    # iterations where the LDI first drops below levels a little above it, but
+    # at the round-off floor the final crossing can move
+    n = min(len(history), len(reference))
+    above = reference[:n] > 1e-8
+    np.testing.assert_allclose(history[:n][above], reference[:n][above], rtol=1e-6)
+    for level in (1e-10, 1e-12, 1e-14):
+        assert np.argmax(history < level) == np.argmax(reference < level) > 0
+
+
+def test_nested_ldi_matches_separate_ldi():
+    N = LOGISTIC_MAP_NETWORK["network_size"]
+    parameters = np.array([*LOGISTIC_MAP_NETWORK["parameters"], N])
+    mapping = logistic_map_network_synchronous
+    jacobian = logistic_map_network_jacobian
+    u = np.random.default_rng(0).random(N)
+    ks = [2, 3, 5, 8]
+    sample_size = 3000
+    total_time = TRANSIENT_TIME + sample_size
+
+    index, histories, _, _ = multi_ldi_lyapunov_batch(
+        [u],
+        total_time,
+        ks,
+        parameters,
+        mapping,
+        jacobian,
+        [[0, sample_size]] * len(ks),
+        transient_time=TRANSIENT_TIME,
+        seed=2,
+    )
+    assert index == 0
+    assert sorted(histories) == list(range(len(ks)))
+
+    # The vectors of each k are the first k of the max(ks) vectors drawn from
+    # the seed, evolved on their own
+    u_T = u.copy()
+    for _ in range(TRANSIENT_TIME):
+        u_T = mapping(u_T, parameters)
+    v = initial_deviation_vectors(N, ks[-1], 2)
+    for j, k in enumerate(ks):
+        reference = separate_ldi(
+            u_T, parameters, mapping, jacobian, v[:, :k].copy(), sample_size
+        )
+        assert_same_ldi(histories[j], reference)
+
+    # For the largest k, these are the vectors of ds.LDI
+    ds = dds(
+        mapping=mapping,
+        jacobian=jacobian,
+        system_dimension=N,
+        number_of_parameters=4,
+    )
+    ldi = np.ravel(
+        ds.LDI(
+            u,
+            total_time,
+            ks[-1],
+            parameters=parameters,
+            transient_time=TRANSIENT_TIME,
+            return_history=True,
+            seed=2,
+        )
+    )
+    assert_same_ldi(histories[len(ks) - 1], ldi[ldi > 0])
+
+
+def test_fused_flow_driver_matches_pynamicalsys():
+    u = np.zeros(12)
+    u[2] = 0.995
+    parameters = np.array([1.0])
+    time_step = 0.005
+    total_time = 50
+    ds = cds(
+        equations_of_motion=fermi_pasta_ulam,
+        jacobian=fermi_pasta_ulam_jacobian,
+        system_dimension=12,
+        number_of_parameters=1,
+    )
+    ds.integrator("rk4", time_step=time_step)
+    ldi = ds.LDI(u, total_time, 3, parameters=parameters, seed=2, return_history=True)
+    exponents = ds.lyapunov(u, total_time, parameters=parameters)
+
+    index, history, _, fused = flow_ldi_lyapunov_batch(
+        [u],
+        total_time,
+        3,
+        parameters,
+        fermi_pasta_ulam,
+        fermi_pasta_ulam_jacobian,
+        [0, 2 * total_time],
+        time_step,
+        seed=2,
+    )
+
+    assert index == 0
+    np.testing.assert_allclose(fused, exponents, rtol=1e-12, atol=1e-15)
+    assert history.shape == ldi.shape
+    np.testing.assert_array_equal(history[:, 0], ldi[:, 0])
+    np.testing.assert_allclose(history[:, 1], ldi[:, 1], rtol=1e-8)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from energy import energy_stats, summarize_energy
+from indicators import SYMPLECTIC_SCHEMES, flow_ldi_lyapunov_batch
+from models import (
+    fermi_pasta_ulam,
+    fermi_pasta_ulam_drift,
+    fermi_pasta_ulam_hamiltonian,
+    fermi_pasta_ulam_jacobian,
+    fermi_pasta_ulam_kick,
+)
+
+TOTAL_TIME = 10
+TIME_STEP = 0.005
+
+
+def run(integrator):
+    u = np.zeros(12)
+    u[2] = 0.995
+    energy = energy_stats()
+    _, history, _, exponents = flow_ldi_lyapunov_batch(
+        [u],
+        TOTAL_TIME,
+        2,
+        np.array([1.0]),
+        fermi_pasta_ulam,
+        fermi_pasta_ulam_jacobian,
+        [0, 2 * TOTAL_TIME],
+        TIME_STEP,
+        seed=2,
+        integrator=integrator,
+        splitting=(fermi_pasta_ulam_drift, fermi_pasta_ulam_kick),
+        atol=1e-11,
+        rtol=1e-11,
+        hamiltonian=fermi_pasta_ulam_hamiltonian,
+        energy=energy,
+    )
+    return history, exponents, summarize_energy(energy)["max_error"]
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return run("rk4")
+
+
+@pytest.mark.parametrize("integrator", ["rk45", *SYMPLECTIC_SCHEMES])
+def test_integrators_agree_with_rk4(integrator, reference):
+    history, exponents, energy_error = run(integrator)
+    np.testing.assert_allclose(exponents[:2], reference[1][:2], rtol=1e-3)
+    np.testing.assert_allclose(history[-1, 1], reference[0][-1, 1], rtol=1e-2)
+    assert energy_error < 1e-4
+
+
+def test_symplectic_orders():
+    errors = [run(integrator)[2] for integrator in SYMPLECTIC_SCHEMES]
+    # leapfrog, yoshida4, yoshida6: higher orders conserve the energy better
+    assert errors[0] > errors[1] > errors[2]
@@ -0,0 +1,21 @@
+import numpy as np
+from loader import load_ragged
+from store import append_records, load_records, numbered
+
+
+def test_ragged_array_matches_records(tmp_path):
+    container = str(tmp_path / "test.store")
+    rng = np.random.default_rng(1)
+    records = [(f"ldi_ic={i}", numbered(rng.random(10 * i + 1))) for i in range(6)]
+    append_records(container, records[:3])
+    append_records(container, [("other", np.ones((4, 5)))])
+    append_records(container, records[3:])
+    keys = [key for key, _ in records]
+
+    ragged = load_ragged(container, keys)
+    assert len(ragged) == len(records)
+    np.testing.assert_array_equal(ragged.lengths, [len(a) for _, a in records])
+    for array, (_, expected) in zip(ragged, records):
+        np.testing.assert_array_equal(array, expected)
+    for array, expected in zip(ragged[2:4], load_records(container, keys[2:4])):
+        np.testing.assert_array_equal(array, expected)
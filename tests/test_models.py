@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from models import (
+    fermi_pasta_ulam_energies,
+    fermi_pasta_ulam_energy,
+    fermi_pasta_ulam_jacobian,
+    fermi_pasta_ulam_variational,
+    logistic_map_network_jacobian,
+    logistic_map_network_synchronous,
+    logistic_map_network_tangent,
+)
+
+
+def logistic_parameters(N, P, a=3.8, sigma=0.15):
+    # Coupling range r such that round(r * N) == P
+    return np.array([a, P / N, sigma, N], dtype=float)
+
+
+@pytest.mark.parametrize(
+    "N, P",
+    [(10, 2), (10, 1), (7, 2), (9, 4), (11, 5)],  # (9, 4), (11, 5): 2P + 1 == N
+)
+def test_logistic_tangent_matches_jacobian(N, P):
+    rng = np.random.default_rng(N * P)
+    parameters = logistic_parameters(N, P)
+    for _ in range(5):
+        u = rng.random(N)
+        V = rng.standard_normal((N, 3))
+        np.testing.assert_allclose(
+            logistic_map_network_tangent(u, parameters, V),
+            logistic_map_network_jacobian(u, parameters) @ V,
+            rtol=1e-12,
+            atol=1e-14,
+        )
+
+
+def synchronous_reference(u, parameters):
+    # Every node computed from the previous state, summing its whole stencil
+    a, r, sigma, N = parameters
+    P = round(r * N)
+    N = int(N)
+    F = a * u * (1 - u)
+    u_new = np.empty(N)
+    for i in range(N):
+        coupling = sum(F[j % N] - F[i] for j in range(i - P, i + P + 1))
+        u_new[i] = F[i] + sigma * coupling / (2 * P)
+
+    return u_new
+
+
+@pytest.mark.parametrize("N, P", [(3, 1), (10, 1), (10, 2), (10, 4), (31, 7), (64, 20)])
+def test_logistic_synchronous_update(N, P):
+    rng = np.random.default_rng(N + P)
+    parameters = logistic_parameters(N, P)
+    u = rng.random(N)
+    before = u.copy()
+    for _ in range(20):
+        u_new = logistic_map_network_synchronous(u, parameters)
+        np.testing.assert_array_equal(u, before)
+        np.testing.assert_allclose(
+            u_new, synchronous_reference(u, parameters), rtol=1e-12, atol=1e-14
+        )
+        u, before = u_new, u_new.copy()
+
+
+def fpu_energy_reference(u, beta):
+    # Vectorized energy of each row of a trajectory
+    x, p = u[:, 0::2], u[:, 1::2]
+    dx = np.diff(x, axis=1)
+    T = 0.5 * np.sum(p[:, 1:-1] ** 2, axis=1)
+    V = np.sum(0.5 * dx**2 + 0.25 * beta * dx**4, axis=1)
+
+    return T + V
+
+
+@pytest.mark.parametrize("dof, beta", [(6, 1.0), (12, 0.3)])
+def test_fpu_variational_matches_jacobian(dof, beta):
+    rng = np.random.default_rng(dof)
+    parameters = np.array([beta])
+    for _ in range(5):
+        u = rng.standard_normal(2 * dof)
+        V = rng.standard_normal((2 * dof, 4))
+        dV = np.full_like(V, np.nan)
+        np.testing.assert_allclose(
+            fermi_pasta_ulam_variational(0.0, u, V, parameters, dV),
+            fermi_pasta_ulam_jacobian(0.0, u, parameters) @ V,
+            rtol=1e-12,
+            atol=1e-14,
+        )
+
+
+def test_fpu_energies_match_reference():
+    rng = np.random.default_rng(1)
+    parameters = np.array([1.0])
+    trajectory = rng.standard_normal((1000, 12))
+    reference = fpu_energy_reference(trajectory, 1.0)
+
+    H = fermi_pasta_ulam_energies(trajectory, parameters, np.empty(1000))
+    np.testing.assert_allclose(H, reference, rtol=1e-13)
+    np.testing.assert_allclose(
+        fermi_pasta_ulam_energy(trajectory, parameters), reference, rtol=1e-13
+    )
+    # A single state gives a scalar
+    energy = fermi_pasta_ulam_energy(trajectory[3], parameters)
+    assert np.ndim(energy) == 0
+    np.testing.assert_allclose(energy, reference[3], rtol=1e-13)
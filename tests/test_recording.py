@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from recording import POLICIES, history_times, thin_history
+from store import numbered
+
+
+def test_every_keeps_one_row_per_stride():
+    np.testing.assert_array_equal(
+        history_times(25, "every", stride=10), [1, 11, 21, 25]
+    )
+    np.testing.assert_array_equal(history_times(21, "every", stride=10), [1, 11, 21])
+
+
+def test_log_keeps_rows_per_decade():
+    np.testing.assert_array_equal(
+        history_times(100, "log", per_decade=2), [1, 3, 10, 32, 100]
+    )
+
+    times = history_times(10**4, "log", per_decade=20)
+    # The first decade only has 9 iterations, the others about per_decade rows
+    for decade in range(1, 4):
+        in_decade = (times >= 10**decade) & (times < 10 ** (decade + 1))
+        assert 19 <= np.count_nonzero(in_decade) <= 21
+
+
+def test_last_keeps_the_ends():
+    np.testing.assert_array_equal(history_times(500, "last"), [1, 500])
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+@pytest.mark.parametrize("length", [1, 2, 9, 10, 11, 137, 5000])
+def test_policies_keep_the_first_and_last_rows(policy, length):
+    history = numbered(np.logspace(0, -16, length))
+    thinned = thin_history(history, policy, stride=10, per_decade=10)
+
+    times = history_times(length, policy, stride=10, per_decade=10)
+    assert times[0] == 1 and times[-1] == length
+    assert np.all(np.diff(times) > 0)
+    # The rows keep their iteration number in the first column
+    np.testing.assert_array_equal(thinned, history[times - 1])
+    np.testing.assert_array_equal(thinned[0], history[0])
+    np.testing.assert_array_equal(thinned[-1], history[-1])
+
+
+def test_all_returns_the_history():
+    history = numbered(np.arange(1.0, 6.0))
+    assert thin_history(history) is history
+
+
+def test_empty_history_and_unknown_policy():
+    assert len(history_times(0, "log")) == 0
+    assert thin_history(np.zeros((0, 2)), "every").shape == (0, 2)
+    with pytest.raises(ValueError):
+        history_times(10, "sparse")
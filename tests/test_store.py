@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+from store import (
+    append_data,
+    append_records,
+    encode_record,
+    has_record,
+    load_record,
+    load_records,
+    numbered,
+    read_index,
+    record_keys,
+)
+
+
+@pytest.fixture
+def container(tmp_path):
+    return str(tmp_path / "test.store")
+
+
+def test_round_trip(container):
+    ldi = numbered(np.logspace(0, -16, 50))
+    lyapunov = np.random.default_rng(0).random((7, 3))
+    append_records(container, [("ldi", ldi), ("lyapunov", lyapunov)])
+    append_records(container, [("column", np.arange(5.0))])
+
+    assert list(read_index(container)) == ["ldi", "lyapunov", "column"]
+    arrays = load_records(container, ["lyapunov", "ldi"])
+    np.testing.assert_array_equal(arrays[0], lyapunov)
+    np.testing.assert_array_equal(arrays[1], ldi)
+    assert load_record(container, "column").shape == (5, 1)
+
+
+def test_last_record_wins(container):
+    append_records(container, [("x", np.zeros((2, 2)))])
+    append_records(container, [("x", np.ones((3, 2)))])
+
+    np.testing.assert_array_equal(load_record(container, "x"), np.ones((3, 2)))
+
+
+def test_has_record_sees_new_appends(container):
+    assert not has_record(container, "a")
+    append_records(container, [("a", np.ones(3))])
+    assert has_record(container, "a")
+    assert not has_record(container, "b")
+    append_records(container, [("b", np.ones(3))])
+    assert has_record(container, "b")
+
+
+def test_torn_record_is_ignored_and_truncated(container):
+    append_records(container, [("a", np.ones((3, 2)))])
+    torn = encode_record("b", np.ones((50, 2)))
+    with open(container, "ab") as f:
+        f.write(torn[: len(torn) // 2])
+    assert list(read_index(container)) == ["a"]
+
+    for i in range(20):
+        append_records(container, [(f"c{i}", np.full((4, 3), float(i)))])
+
+    assert list(read_index(container)) == ["a"] + [f"c{i}" for i in range(20)]
+    np.testing.assert_array_equal(load_record(container, "c19"), np.full((4, 3), 19))
+
+
+def test_skip_stored(container):
+    data = encode_record("x", np.ones(4)) + encode_record("y", np.zeros(2))
+    assert record_keys(data) == ["x", "y"]
+    assert append_data(container, data, skip_stored=True)
+    size = os.path.getsize(container)
+
+    assert not append_data(container, data, skip_stored=True)
+    assert os.path.getsize(container) == size
@@ -0,0 +1,84 @@
+import numpy as np
+from indicators import burn_in, ldi_lyapunov_batch, post_transient
+from models import (
+    henon_map_3D,
+    henon_map_3D_inplace,
+    henon_map_3D_jacobian,
+)
+from parameters import HENON
+from streaming import orbit_chunks
+from transient_cache import TransientCache
+
+U0 = np.array(HENON["u0"]) + 1e-4
+PARAMETERS = np.array(HENON["parameters"], dtype=float)
+TRANSIENT_TIME = 20000
+
+
+def test_cached_state_is_bit_identical(tmp_path):
+    expected = burn_in(U0.copy(), PARAMETERS, TRANSIENT_TIME, henon_map_3D)
+    cache = TransientCache(str(tmp_path / "transients.sqlite"), 2**20, 4)
+    computed = post_transient(
+        U0, PARAMETERS, TRANSIENT_TIME, henon_map_3D, henon_map_3D_inplace, cache
+    )
+    hit = post_transient(U0, PARAMETERS, TRANSIENT_TIME, henon_map_3D, cache=cache)
+    np.testing.assert_array_equal(computed, expected)
+    np.testing.assert_array_equal(hit, expected)
+    assert hit is not computed
+
+    # The disk tier serves a new process
+    cache.close()
+    cache = TransientCache(str(tmp_path / "transients.sqlite"), 2**20, 4)
+    assert cache.memory == {}
+    hit = post_transient(U0, PARAMETERS, TRANSIENT_TIME, henon_map_3D, cache=cache)
+    np.testing.assert_array_equal(hit, expected)
+
+
+def test_drivers_and_orbits_through_the_cache():
+    cache = TransientCache(memory_entries=16)
+    U = [U0 + 1e-3 * np.random.default_rng(i).random(3) for i in range(3)]
+    arguments = (
+        U,
+        TRANSIENT_TIME + 3000,
+        2,
+        PARAMETERS,
+        henon_map_3D,
+        henon_map_3D_jacobian,
+        [1, 3000],
+    )
+    expected = ldi_lyapunov_batch(*arguments, TRANSIENT_TIME, seed=2)
+    for _ in range(2):
+        result = ldi_lyapunov_batch(
+            *arguments, TRANSIENT_TIME, seed=2, transients=cache
+        )
+        assert result[0] == expected[0]
+        np.testing.assert_array_equal(result[1], expected[1])
+        np.testing.assert_array_equal(result[3], expected[3])
+
+    orbit = [
+        np.concatenate(
+            list(
+                orbit_chunks(
+                    U[0],
+                    PARAMETERS,
+                    henon_map_3D,
+                    TRANSIENT_TIME + 100,
+                    TRANSIENT_TIME,
+                    copy=True,
+                    transients=transients,
+                )
+            )
+        )
+        for transients in (None, cache)
+    ]
+    np.testing.assert_array_equal(orbit[0], orbit[1])
+
+
+def test_eviction_bounds_both_tiers(tmp_path):
+    cache = TransientCache(str(tmp_path / "transients.sqlite"), 64 * 1024, 2)
+    for i in range(3000):
+        cache.put(str(i), np.random.default_rng(i).random(3))
+
+    assert len(cache.memory) == 2
+    assert cache.size() <= 64 * 1024
+    assert cache.get("0") is None
+    assert cache.get("2999") is not None
@@ -0,0 +1,194 @@
+"""
+Cache of the post-transient states of the orbits of the maps.
+
+Every LDI, Lyapunov and trajectory computation of a map starts by iterating
+its initial condition transient_time times and discarding the orbit. The state
+u_T reached only depends on the map, its parameters, the initial condition and
+transient_time, so `post_transient` in indicators.py caches it under a hash of
+them (see `candidate_key` in candidate_cache.py, which identifies the map by
+its source code): the rejection searches of the Hénon map and the logistic
+network reach the same candidates from different k and on reruns, and the
+notebook computes the bounds, the trajectory and the Lyapunov exponents of the
+same initial conditions.
+
+The cache has two tiers: the most recently used states of the process in
+memory, and, optionally, an SQLite file shared by all the workers on disk. The
+disk tier is off by default (see TRANSIENT_CACHE in parameters.py) since, like
+the candidate cache, it makes the workers contend for the lock of one file and
+is unreliable on network file systems. The least recently used entries are
+evicted when either tier exceeds its size. The
+states are stored at full precision, so the orbits continued from them are
+bit-identical to those that iterate the transient again.
+"""
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from candidate_cache import candidate_key, EVICTION_FRACTION
+from parameters import TRANSIENT_CACHE
+
+# Cache shared by the calls of this process (see `shared_transient_cache`)
+_shared = None
+
+
+def transient_key(u, parameters, transient_time, mapping):
+    """
+    Return the key of the state reached after transient_time iterations of u.
+
+    The in-place variant of the mapping is not part of the key: it performs
+    the same operations, so it reaches the same state.
+    """
+    return candidate_key("transient", mapping, parameters, u, transient_time)
+
+
+class TransientCache:
+    """
+    Two-tier LRU cache of post-transient states: in memory and in an SQLite
+    file. The methods can be called from several threads.
+
+    Parameters:
+    - filename: Cache file (None: memory only).
+    - budget: Disk budget in bytes.
+    - memory_entries: Number of states kept in memory.
+    """
+
+    def __init__(self, filename=None, budget=0, memory_entries=1024):
+        self.filename = filename
+        self.budget = budget
+        self.memory_entries = memory_entries
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        if filename is None:
+            return
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(
+            filename, timeout=600, check_same_thread=False
+        )
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS states ("
+                "key TEXT PRIMARY KEY, state BLOB, last_used REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS lru ON states (last_used)"
+            )
+
+    def get(self, key):
+        """
+        Look up a state, in memory first, and mark it as recently used.
+
+        Returns:
+        - Copy of the state, or None if it is not cached.
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key].copy()
+            if self.connection is None:
+                return None
+
+            with self.connection:
+                row = self.connection.execute(
+                    "SELECT state FROM states WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self.connection.execute(
+                    "UPDATE states SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            state = np.frombuffer(row[0], dtype=np.float64).copy()
+            self._remember(key, state)
+
+            return state.copy()
+
+    def put(self, key, state):
+        """
+        Store a state in both tiers, evicting the least recently used entries
+        if needed.
+        """
+        state = np.array(state, dtype=np.float64)
+        with self.lock:
+            self._remember(key, state)
+            if self.connection is None:
+                return
+
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO states VALUES (?, ?, ?)",
+                    (key, state.tobytes(), time.time()),
+                )
+            if self.size() > self.budget:
+                self.evict()
+
+    def _remember(self, key, state):
+        self.memory[key] = state
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def size(self):
+        """
+        Return the disk space used by the entries, in bytes.
+        """
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        pages = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        free = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return (pages - free) * page_size
+
+    def evict(self):
+        """
+        Delete the least recently used entries of the file so that it fits
+        its budget, with a margin of EVICTION_FRACTION of the entries.
+        """
+        count = self.connection.execute("SELECT COUNT(*) FROM states")
+        count = count.fetchone()[0]
+        if count == 0:
+            return
+
+        entry_size = self.size() / count
+        keep = int((1 - EVICTION_FRACTION) * self.budget / entry_size)
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM states WHERE key IN (SELECT key FROM states "
+                "ORDER BY last_used LIMIT ?)",
+                (max(0, count - keep),),
+            )
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def shared_transient_cache():
+    """
+    Return the cache of this process configured by TRANSIENT_CACHE in
+    parameters.py, or None if it is disabled.
+
+    The cache is created on first use in each process, so forked workers do
+    not share the SQLite connection of their parent.
+    """
+    global _shared
+    if not TRANSIENT_CACHE["enabled"]:
+        return None
+    if _shared is None or _shared[0] != os.getpid():
+        cache = TransientCache(
+            TRANSIENT_CACHE["filename"],
+            TRANSIENT_CACHE["budget"],
+            TRANSIENT_CACHE["memory_entries"],
+        )
+        _shared = (os.getpid(), cache)
+
+    return _shared[1]
@@ -0,0 +1,144 @@
+"""
+JIT warm-up and startup-time measurement for the system scripts.
+
+The model kernels in `models.py` are compiled with `cache=True`, so after the
+first run they are loaded from Numba's on-disk cache (the `__pycache__`
+directory next to `models.py`, or `NUMBA_CACHE_DIR` if set) instead of being
+recompiled by every process. The drivers in `indicators.py` and the
+pynamicalsys routines receive the kernels as arguments (and pass the mapping on
+to the Jacobians), and Numba cannot cache those specializations on disk; they
+are compiled once per process by `warm_up`, and they account for most of the
+startup time: a fresh process takes about as long (~10 s per system) with a
+populated on-disk cache as with an empty one. Only the workers of the
+work-queue scheduler start in milliseconds: it warms up the selected systems in
+the parent process before forking them, so they inherit every compiled
+function. The processes launched by `run_systems.py --mode batch` and the
+worker processes of `cluster.py` still compile the drivers once each.
+
+Usage:
+    python warmup.py [system ...]
+
+Measures, for each system, the time a fresh process needs before it can run its
+first task with an empty compilation cache, with a populated on-disk cache, and
+as a worker forked from an already warmed-up parent.
+"""
+
+import importlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from parameters import SYSTEMS
+from profiling import span
+
+# Code run in a fresh interpreter to time the startup of a system script
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+import {system}
+{system}.warm_up()
+print(time.perf_counter() - start)
+"""
+
+
+def warm_up(systems, batch_size=1):
+    """
+    Compile everything the given systems need in the current process.
+
+    Parameters:
+    - systems: List of system script module names.
+    - batch_size: Number of candidates evaluated at once by the rejection
+      searches of the LDI systems.
+
+    Returns:
+    - Dictionary mapping each system to its warm-up time in seconds.
+    """
+    timings = {}
+    for system in systems:
+        start = time.perf_counter()
+        with span("warm_up", system=system):
+            module = importlib.import_module(system)
+            if SYSTEMS[system] is None:
+                module.warm_up()
+            else:
+                module.warm_up(batch_size)
+        timings[system] = time.perf_counter() - start
+
+    return timings
+
+
+def fresh_process_startup(system, cache_dir):
+    """
+    Time the import and warm-up of a system script in a new interpreter.
+
+    Parameters:
+    - system: Name of the system script module.
+    - cache_dir: Directory used as the Numba on-disk cache.
+
+    Returns:
+    - Startup time in seconds, as measured inside the new process.
+    """
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SNIPPET.format(system=system)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def _timed_warm_up(system):
+    start = time.perf_counter()
+    importlib.import_module(system).warm_up()
+    return time.perf_counter() - start
+
+
+def forked_worker_startup(system):
+    """
+    Time the warm-up of a system inside a worker forked from this process after
+    this process has warmed up the system itself.
+    """
+    warm_up([system])
+    context = multiprocessing.get_context("fork")
+    with context.Pool(1) as pool:
+        return pool.apply(_timed_warm_up, (system,))
+
+
+def measure_startup(systems):
+    """
+    Measure the startup-time savings of the compilation cache for each system.
+
+    Parameters:
+    - systems: List of system script module names.
+
+    Returns:
+    - Dictionary mapping each system to a dictionary with the "cold",
+      "cached" and "forked" startup times in seconds.
+    """
+    results = {}
+    for system in systems:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold = fresh_process_startup(system, cache_dir)
+            cached = fresh_process_startup(system, cache_dir)
+        forked = forked_worker_startup(system)
+        results[system] = {"cold": cold, "cached": cached, "forked": forked}
+
+    return results
+
+
+if __name__ == "__main__":
+    systems = sys.argv[1:] or list(SYSTEMS)
+    results = measure_startup(systems)
+
+    print(f"{'system':<22}{'cold (s)':>12}{'cached (s)':>12}{'forked (s)':>12}")
+    for system, times in results.items():
+        print(
+            f"{system:<22}{times['cold']:>12.3f}{times['cached']:>12.3f}"
+            f"{times['forked']:>12.4f}"
+        )